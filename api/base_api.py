@@ -10,6 +10,7 @@ from db.base_model import sc_wrapper
 from db.cache import RedisHelper
 from db.db_context import session_socpe
 from db.model import ExchangeAPIModel, SymbolModel, KlineModel
+from db.symbol_registry import publish_symbol_change
 from util.async_request_util import request
 
 
@@ -159,6 +160,7 @@ class BaseApi(ABC):
         redis = RedisHelper()
         redis.connection.delete(name)
         redis.hmset(name, symbols)
+        publish_symbol_change()
         cls.logger.info(f"{cls.EXCHANGE}交易对入库更新成功")
 
     async def get_symbol_position(self):
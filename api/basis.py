@@ -1,5 +1,6 @@
 import time
 from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Optional, Tuple
 
 import click
 from sqlalchemy import func
@@ -15,7 +16,7 @@ from base.log import Logger
 from db.base_model import sc_wrapper
 from db.cache import RedisHelper
 from db.db_context import session_socpe
-from db.model import BasisTickerModel, BasisModel
+from db.model import BasisTickerModel, BasisModel, BasisTickerRollupModel
 from util.func_util import while_true_try
 
 logger = Logger('basis', logger_level)
@@ -68,95 +69,146 @@ class Basis:
             logger.info(f'缓存基差{day}日最大值最小值成功')
         return data
 
-    @classmethod
-    def cal_basis(cls, basis: BasisModel) -> dict:
-        """计算基差"""
-        redis = RedisHelper()
+    @staticmethod
+    def ticker_keys(basis: BasisModel) -> List[Tuple[str, str]]:
+        """基差用到的两个合约和现货的ticker在redis里的位置"""
         if basis.exchange == OkexApi.EXCHANGE:
             symbol1 = f"{basis.underlying}-{OkexFutureUtil.get_code_from_alias(basis.future1)}"
             symbol2 = f"{basis.underlying}-{OkexFutureUtil.get_code_from_alias(basis.future2)}"
-            ticker1 = redis.hget(f'{basis.exchange}:TICKER:{OkexApi.MarketType.FUTURES}'.upper(), symbol1)
-            ticker2 = redis.hget(f'{basis.exchange}:TICKER:{OkexApi.MarketType.FUTURES}'.upper(), symbol2)
-            ticker_spot = redis.hget(f'{basis.exchange}:TICKER:{OkexApi.MarketType.SPOT}'.upper(), f"{symbol2.split('-')[0]}-USDT")
+            return [
+                (f'{basis.exchange}:TICKER:{OkexApi.MarketType.FUTURES}'.upper(), symbol1),
+                (f'{basis.exchange}:TICKER:{OkexApi.MarketType.FUTURES}'.upper(), symbol2),
+                (f'{basis.exchange}:TICKER:{OkexApi.MarketType.SPOT}'.upper(), f"{symbol2.split('-')[0]}-USDT"),
+            ]
         elif basis.exchange == BinanceApi.EXCHANGE:
             symbol1 = f"{basis.underlying}_{BinanceFutureUtil.get_code_from_alias(basis.future1)}"
             symbol2 = f"{basis.underlying}_{BinanceFutureUtil.get_code_from_alias(basis.future2)}"
-            ticker1 = redis.hget(f'{basis.exchange}:TICKER:{BinanceApi.MarketType.COIN_FUTURE}'.upper(), symbol1)
-            ticker2 = redis.hget(f'{basis.exchange}:TICKER:{BinanceApi.MarketType.COIN_FUTURE}'.upper(), symbol2)
-            ticker_spot = redis.hget(f'{basis.exchange}:TICKER:{BinanceApi.MarketType.SPOT}'.upper(), f"{basis.underlying}T")
+            return [
+                (f'{basis.exchange}:TICKER:{BinanceApi.MarketType.COIN_FUTURE}'.upper(), symbol1),
+                (f'{basis.exchange}:TICKER:{BinanceApi.MarketType.COIN_FUTURE}'.upper(), symbol2),
+                (f'{basis.exchange}:TICKER:{BinanceApi.MarketType.SPOT}'.upper(), f"{basis.underlying}T"),
+            ]
         else:
             raise Exception("交易所不存在")
 
+    @classmethod
+    def basis_data(cls, basis: BasisModel, ticker1: dict, ticker2: dict, ticker_spot: dict, timestamp1: datetime) -> dict:
+        """用两个合约的ticker计算基差, 不检查ticker是否延时"""
+        long, short, best_long_qty, best_short_qty = cls.ticker_basis(ticker1, ticker2)
+        return {
+            'basis_id': basis.id,
+            'exchange': basis.exchange.upper(),
+            'underlying': basis.underlying,
+            'future1': basis.future1,
+            'future2': basis.future2,
+            'symbol': f"{MarketType[basis.future1].value}/{MarketType[basis.future2].value}",
+            'long': long,
+            'short': short,
+            'best_long_qty': best_long_qty,
+            'best_short_qty': best_short_qty,
+            'timestamp': timestamp1,
+            'spot': ticker_spot,
+            'ticker1': ticker1,
+            'ticker2': ticker2,
+            'volume': basis.volume
+        }
+
+    @classmethod
+    def cal_basis(cls, basis: BasisModel, tickers: Optional[List[dict]] = None) -> dict:
+        """计算基差
+
+        Args:
+            basis: 基差
+            tickers: 已经取好的 ticker_keys 对应的ticker, 没有的话从redis里取
+        """
+        if tickers is None:
+            redis = RedisHelper()
+            with redis.pipeline() as pipe:
+                for redis_key, key in cls.ticker_keys(basis):
+                    pipe.hget(redis_key, key)
+            tickers = pipe.results
+        ticker1, ticker2, ticker_spot = tickers
+
         timestamp1 = datetime.strptime(ticker1['timestamp'], "%Y-%m-%dT%H:%M:%S.%fZ")
         timestamp2 = datetime.strptime(ticker2['timestamp'], "%Y-%m-%dT%H:%M:%S.%fZ")
         timestamp = datetime.utcnow()
         delay = abs((timestamp - timestamp1).total_seconds()) + abs((timestamp - timestamp2).total_seconds())
         if delay < 200:
-            long, short, best_long_qty, best_short_qty = cls.ticker_basis(ticker1, ticker2)
-            basis_data = {
-                'basis_id': basis.id,
-                'exchange': basis.exchange.upper(),
-                'underlying': basis.underlying,
-                'future1': basis.future1,
-                'future2': basis.future2,
-                'symbol': f"{MarketType[basis.future1].value}/{MarketType[basis.future2].value}",
-                'long': long,
-                'short': short,
-                'best_long_qty': best_long_qty,
-                'best_short_qty': best_short_qty,
-                'timestamp': timestamp1,
-                'spot': ticker_spot,
-                'ticker1': ticker1,
-                'ticker2': ticker2,
-                'volume': basis.volume
-            }
-            return basis_data
+            return cls.basis_data(basis, ticker1, ticker2, ticker_spot, timestamp1)
         else:
             logger.warning(f"基差计算失败:{basis.exchange.upper()},{basis.underlying}，{str(timestamp)},{delay}", )
             # logger.warning(ticker1)
             # logger.warning(ticker2)
             raise Exception('数据延时')
 
+    @staticmethod
+    def get_basis_models() -> List[BasisModel]:
+        """从redis读取所有的基差对"""
+        redis = RedisHelper()
+        basises = redis.hgetall('BASIS:SYMBOL') or {}
+        return [BasisModel(**{
+            "id": basis['id'],
+            "underlying": basis['underlying'],
+            "future1": basis['future1'],
+            "future2": basis['future2'],
+            "exchange": basis['exchange'],
+            "volume": basis['volume'],
+            "is_coin_base": basis['is_coin_base'],
+        }) for basis in basises.values()]
+
+    @staticmethod
+    def ticks_to_db(ticks: Iterable[dict]) -> None:
+        """基差tick入库, 数据库里保存的是北京时间"""
+        rows = [{
+            'basis_id': tick['basis_id'],
+            'long': tick['long'],
+            'short': tick['short'],
+            'best_long_qty': tick['best_long_qty'],
+            'best_short_qty': tick['best_short_qty'],
+            'timestamp': tick['timestamp'] + timedelta(hours=8),
+            'price1': tick['ticker1']['last'],
+            'price2': tick['ticker2']['last'],
+            'spot': tick['spot']['last'],
+        } for tick in ticks]
+        with session_socpe() as sc:
+            sc.add_all([BasisTickerModel(**row) for row in rows])
+            BasisTickerRollupModel.rollup(rows, sc=sc)
+        logger.info(f'基差入库成功')
+
     @classmethod
     def cal_all_basis(cls, to_db=False):
         """记录基差tick"""
         redis = RedisHelper()
-        basises = redis.hgetall('BASIS:SYMBOL')
+        models = cls.get_basis_models()
+
+        # 所有基差的ticker一次取出来
+        keys = {}
+        with redis.pipeline() as pipe:
+            for model in models:
+                try:
+                    keys[model.id] = cls.ticker_keys(model)
+                except Exception as e:
+                    logger.error(f'{model.underlying}:{e}')
+                    continue
+                for redis_key, key in keys[model.id]:
+                    pipe.hget(redis_key, key)
+        results = iter(pipe.results)
+
         ticks = {}
-        for basis in basises.values():
+        for model in models:
+            if model.id not in keys:
+                continue
+            tickers = [next(results) for _ in keys[model.id]]
             try:
-                tick = cls.cal_basis(BasisModel(**{
-                    "id": basis['id'],
-                    "underlying": basis['underlying'],
-                    "future1": basis['future1'],
-                    "future2": basis['future2'],
-                    "exchange": basis['exchange'],
-                    "volume": basis['volume'],
-                    "is_coin_base": basis['is_coin_base'],
-                }))
+                tick = cls.cal_basis(model, tickers=tickers)
                 ticks[tick['basis_id']] = tick
             except Exception as e:
-                underlying = basis['underlying']
-                logger.error(f'{underlying}:{e}')
-        redis.connection.delete('BASIS:TICKER')
-        redis.hmset('BASIS:TICKER', ticks)
+                logger.error(f'{model.underlying}:{e}')
+        with redis.transaction() as pipe:
+            pipe.delete('BASIS:TICKER')
+            pipe.hmset('BASIS:TICKER', ticks)
         if to_db:
-            objs = []
-            for tick in ticks.values():
-                objs.append(BasisTickerModel(**{
-                    'basis_id': tick['basis_id'],
-                    'long': tick['long'],
-                    'short': tick['short'],
-                    'best_long_qty': tick['best_long_qty'],
-                    'best_short_qty': tick['best_short_qty'],
-                    'timestamp': tick['timestamp'] + timedelta(hours=8),
-                    'price1': tick['ticker1']['last'],
-                    'price2': tick['ticker2']['last'],
-                    'spot': tick['spot']['last'],
-                }))
-            with session_socpe() as sc:
-                sc.add_all(objs)
-            logger.info(f'基差入库成功')
+            cls.ticks_to_db(ticks.values())
         logger.info(f'基差更新成功')
 
         return ticks
@@ -0,0 +1,316 @@
+"""事件驱动的基差计算
+
+Basis.update_basis每0.5秒把所有基差重新算一遍, 再删除重写整个BASIS:TICKER。
+BasisEngine保存每个合约ticker到基差的索引, 币安的ticker订阅BookTickerService发布的变化通知,
+okex没有推送, 仍然按POLL_INTERVAL轮询, 只有ticker有变化的基差才重新计算, 写入redis的也只是变化的部分。
+
+1/7/30日做多基差最小值和做空基差最大值在内存里用单调队列滚动计算, 不再定时对BasisTickerModel做GROUP BY。
+"""
+import time
+from collections import defaultdict, deque
+from datetime import datetime, timedelta, timezone
+from typing import Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+from api.basis import Basis, logger
+from api.binance.book_ticker import ticker_key, update_channel
+from base.consts import BasisEngineConfig, BookTickerConfig
+from db.cache import RedisHelper
+from db.db_context import session_socpe
+from db.model import BasisModel, BasisTickerModel
+
+# (redis里ticker的哈希, 交易对)
+TickerKey = Tuple[str, str]
+
+EPOCH = datetime(1970, 1, 1)
+CHINA_TIMEZONE = timezone(timedelta(hours=8))
+
+
+def parse_timestamp(timestamp: str) -> datetime:
+    """解析ticker的时间, 格式是 %Y-%m-%dT%H:%M:%S.%fZ , 比strptime快很多"""
+    return datetime.fromisoformat(timestamp[:-1])
+
+
+class RollingExtreme(object):
+    """时间窗口里的最小值(maximum=True时是最大值)
+
+    单调队列里的值从队头到队尾递增, 新值进来的时候先弹出队尾比它大的值, 这些值在窗口里不可能再是最小值,
+    过期的值从队头弹出, 每个值最多进出队列一次。
+    """
+
+    def __init__(self, window: float, maximum: bool = False):
+        self.window = window
+        self.sign = -1 if maximum else 1
+        self.queue: Deque[Tuple[float, float]] = deque()
+
+    def push(self, timestamp: float, value: float) -> None:
+        value = self.sign * value
+        while self.queue and self.queue[-1][1] >= value:
+            self.queue.pop()
+        self.queue.append((timestamp, value))
+
+    def value(self, now: float) -> Optional[float]:
+        while self.queue and self.queue[0][0] <= now - self.window:
+            self.queue.popleft()
+        return self.sign * self.queue[0][1] if self.queue else None
+
+
+class BasisExtremes(object):
+    """一个基差在各个窗口里的做多基差最小值和做空基差最大值
+
+    同一分钟的tick先合并成一个桶, 这一分钟结束之后才进入队列, 所以队列最多保存窗口里的分钟数。
+    """
+
+    def __init__(self, days: List[int]):
+        self.minute: Optional[int] = None
+        self.min_long = 0
+        self.max_short = 0
+        self.windows = {day: (RollingExtreme(day * 86400), RollingExtreme(day * 86400, maximum=True)) for day in days}
+
+    def update(self, timestamp: float, long: float, short: float) -> None:
+        minute = int(timestamp // 60)
+        if self.minute is None or minute > self.minute:
+            if self.minute is not None:
+                for lows, highs in self.windows.values():
+                    lows.push(self.minute * 60, self.min_long)
+                    highs.push(self.minute * 60, self.max_short)
+            self.minute, self.min_long, self.max_short = minute, long, short
+        else:
+            self.min_long = min(self.min_long, long)
+            self.max_short = max(self.max_short, short)
+
+    def values(self, now: float) -> Dict[int, Tuple[float, float]]:
+        """每个窗口的(做多基差最小值, 做空基差最大值), 包括还没有结束的这一分钟"""
+        result = {}
+        for day, (lows, highs) in self.windows.items():
+            if self.minute is None:
+                continue
+            min_long, max_short = lows.value(now), highs.value(now)
+            result[day] = (
+                self.min_long if min_long is None else min(min_long, self.min_long),
+                self.max_short if max_short is None else max(max_short, self.max_short),
+            )
+        return result
+
+
+class BasisEngine(object):
+    """只重新计算ticker有变化的基差"""
+
+    def __init__(self):
+        self.redis = RedisHelper()
+        self.basises: Dict[int, BasisModel] = {}
+        # 基差 -> 两个合约和现货的ticker位置
+        self.legs: Dict[int, List[TickerKey]] = {}
+        # ticker位置 -> 用到这个ticker的基差
+        self.index: Dict[TickerKey, Set[int]] = defaultdict(set)
+        # ticker位置 -> (ticker, ticker的时间, ticker的时间戳)
+        self.tickers: Dict[TickerKey, Tuple[dict, datetime, float]] = {}
+        # 基差 -> 最新的基差tick, 和BASIS:TICKER里的一样
+        self.ticks: Dict[int, dict] = {}
+        self.extremes: Dict[int, BasisExtremes] = {}
+        # BASIS:MAX_MIN里已经写入的值
+        self.max_min: Dict[str, Tuple[float, float]] = {}
+        # 有推送的ticker哈希 -> 频道
+        self.streamed = {ticker_key(market_type): update_channel(market_type) for market_type in BookTickerConfig.MARKET_TYPES}
+
+    def new_extremes(self) -> BasisExtremes:
+        return BasisExtremes(BasisEngineConfig.MAX_MIN_DAYS)
+
+    def reload(self) -> None:
+        """重新读取基差对, 重建ticker到基差的索引"""
+        basises = {}
+        legs = {}
+        index = defaultdict(set)
+        for model in Basis.get_basis_models():
+            try:
+                keys = [(redis_key, symbol.upper()) for redis_key, symbol in Basis.ticker_keys(model)]
+            except Exception as e:
+                logger.error(f'{model.underlying}:{e}')
+                continue
+            basises[model.id] = model
+            legs[model.id] = keys
+            for key in keys:
+                index[key].add(model.id)
+        removed = set(self.ticks) - set(basises)
+        self.basises, self.legs, self.index = basises, legs, index
+        for basis_id in basises:
+            if basis_id not in self.extremes:
+                self.extremes[basis_id] = self.new_extremes()
+        self.tickers = {key: value for key, value in self.tickers.items() if key in index}
+        self.write({}, removed)
+        logger.info(f'读取基差对成功:{len(basises)}个')
+
+        # 第一次读取或者有新的基差对, 把所有的ticker读一遍
+        keys = defaultdict(set)
+        for redis_key, symbol in index:
+            keys[redis_key].add(symbol)
+        self.fetch(keys)
+        self.write(*self.compute(basises))
+
+    def seed(self, days: Optional[int] = None) -> None:
+        """用数据库里的基差tick初始化滚动的最大值最小值, 只在启动的时候读一次"""
+        days = days or max(BasisEngineConfig.MAX_MIN_DAYS)
+        start = datetime.now(CHINA_TIMEZONE).replace(tzinfo=None) - timedelta(days=days)
+        count = 0
+        with session_socpe() as sc:
+            query = sc.query(
+                BasisTickerModel.basis_id,
+                BasisTickerModel.timestamp,
+                BasisTickerModel.long,
+                BasisTickerModel.short,
+            ).filter(BasisTickerModel.timestamp > start).order_by(BasisTickerModel.timestamp)
+            for basis_id, timestamp, long, short in query.yield_per(10000):
+                if basis_id not in self.extremes:
+                    self.extremes[basis_id] = self.new_extremes()
+                # 数据库里是北京时间
+                self.extremes[basis_id].update((timestamp - timedelta(hours=8) - EPOCH).total_seconds(), long, short)
+                count += 1
+        logger.info(f'读取{days}日基差tick成功:{count}条')
+
+    def fetch(self, keys: Dict[str, Iterable[str]]) -> Set[int]:
+        """从redis读取ticker, 返回ticker有变化的基差"""
+        keys = {redis_key: list(symbols) for redis_key, symbols in keys.items() if symbols}
+        with self.redis.pipeline() as pipe:
+            for redis_key, symbols in keys.items():
+                pipe.hmget(redis_key, symbols)
+        affected = set()
+        for (redis_key, symbols), tickers in zip(keys.items(), pipe.results):
+            for symbol, ticker in zip(symbols, tickers):
+                key = (redis_key, symbol)
+                if ticker is None:
+                    continue
+                old = self.tickers.get(key)
+                if old is not None and old[0] == ticker:
+                    continue
+                timestamp = parse_timestamp(ticker['timestamp'])
+                self.tickers[key] = (ticker, timestamp, (timestamp - EPOCH).total_seconds())
+                affected |= self.index.get(key, set())
+        return affected
+
+    def is_delayed(self, basis_id: int, now: float) -> bool:
+        delay = 0
+        for key in self.legs[basis_id][:2]:
+            delay += abs(now - self.tickers[key][2])
+        return delay >= BasisEngineConfig.MAX_DELAY
+
+    def compute(self, basis_ids: Iterable[int]) -> Tuple[Dict[int, dict], Set[int]]:
+        """重新计算基差, 返回(更新的基差, 需要删除的基差)"""
+        now = time.time()
+        updated, removed = {}, set()
+        for basis_id in basis_ids:
+            basis = self.basises.get(basis_id)
+            if basis is None:
+                continue
+            legs = [self.tickers.get(key) for key in self.legs[basis_id]]
+            if any(leg is None for leg in legs) or self.is_delayed(basis_id, now):
+                removed.add(basis_id)
+                continue
+            (ticker1, timestamp1, seconds1), (ticker2, _, _), (ticker_spot, _, _) = legs
+            try:
+                tick = Basis.basis_data(basis, ticker1, ticker2, ticker_spot, timestamp1)
+            except Exception as e:
+                logger.error(f'{basis.underlying}:{e}')
+                removed.add(basis_id)
+                continue
+            updated[basis_id] = tick
+            self.extremes[basis_id].update(seconds1, tick['long'], tick['short'])
+        return updated, removed & set(self.ticks)
+
+    def changed_max_min(self, basis_ids: Iterable[int]) -> Dict[str, dict]:
+        now = time.time()
+        timestamp = datetime.now(CHINA_TIMEZONE)
+        data = {}
+        for basis_id in basis_ids:
+            extremes = self.extremes.get(basis_id)
+            if extremes is None:
+                continue
+            for day, value in extremes.values(now).items():
+                name = f"{basis_id}:{day}"
+                if self.max_min.get(name) == value:
+                    continue
+                self.max_min[name] = value
+                data[name] = {
+                    'basis_id': basis_id,
+                    'min_long': value[0],
+                    'max_short': value[1],
+                    'timestamp': timestamp
+                }
+        return data
+
+    def write(self, updated: Dict[int, dict], removed: Set[int]) -> None:
+        """只写入变化的基差"""
+        if not updated and not removed:
+            return
+        self.ticks.update(updated)
+        for basis_id in removed:
+            self.ticks.pop(basis_id, None)
+        max_min = self.changed_max_min(updated)
+        with self.redis.pipeline() as pipe:
+            pipe.hmset('BASIS:TICKER', updated)
+            for basis_id in removed:
+                pipe.hdel('BASIS:TICKER', basis_id)
+            pipe.hmset('BASIS:MAX_MIN', max_min)
+
+    def check_delay(self) -> None:
+        """没有新的ticker的基差也会过期"""
+        now = time.time()
+        removed = {basis_id for basis_id in self.ticks if self.is_delayed(basis_id, now)}
+        self.write({}, removed)
+
+    def every_minute(self) -> None:
+        """基差tick入库, 刷新所有基差的最大值最小值(过期的值要移出窗口)"""
+        if self.ticks:
+            Basis.ticks_to_db(self.ticks.values())
+        max_min = self.changed_max_min(self.basises)
+        if max_min:
+            self.redis.hmset('BASIS:MAX_MIN', max_min)
+
+    def polled_keys(self) -> Dict[str, Set[str]]:
+        """没有推送的ticker"""
+        keys = defaultdict(set)
+        for redis_key, symbol in self.index:
+            if redis_key not in self.streamed:
+                keys[redis_key].add(symbol)
+        return keys
+
+    def run(self) -> None:
+        self.seed()
+        # 上一次运行留下的基差可能已经不存在了
+        self.redis.connection.delete('BASIS:TICKER')
+        self.reload()
+        channels = {channel: redis_key for redis_key, channel in self.streamed.items()}
+        pubsub = self.redis.connection.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(*channels)
+        polled = self.polled_keys()
+        now = time.time()
+        next_poll, next_check, next_reload = now, now + 1, now + BasisEngineConfig.RELOAD_INTERVAL
+        minute = int(now // 60)
+        while True:
+            try:
+                changed = defaultdict(set)
+                message = pubsub.get_message(timeout=BasisEngineConfig.POLL_INTERVAL)
+                while message:
+                    redis_key = channels[message['channel']]
+                    for symbol in self.redis.deserialize(message['data']):
+                        if (redis_key, symbol) in self.index:
+                            changed[redis_key].add(symbol)
+                    message = pubsub.get_message()
+                now = time.time()
+                if now >= next_poll:
+                    for redis_key, symbols in polled.items():
+                        changed[redis_key] |= symbols
+                    next_poll = now + BasisEngineConfig.POLL_INTERVAL
+                if changed:
+                    self.write(*self.compute(self.fetch(changed)))
+                if now >= next_check:
+                    self.check_delay()
+                    next_check = now + 1
+                if int(now // 60) != minute:
+                    minute = int(now // 60)
+                    self.every_minute()
+                if now >= next_reload:
+                    self.reload()
+                    polled = self.polled_keys()
+                    next_reload = now + BasisEngineConfig.RELOAD_INTERVAL
+            except Exception as e:
+                logger.error(f'基差计算出错:{e}', exc_info=True)
+                time.sleep(1)
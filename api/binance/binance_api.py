@@ -13,6 +13,7 @@ from pytz import utc
 
 from api.base_api import OrderType, Direction
 from api.binance.base_request import BinanceRequest
+from api.binance.kline_downloader import BinanceKlineDownloader
 from base.config import socks, BASE_DIR
 from base.consts import WeComAgent, WeComPartment
 from db.cache import RedisHelper
@@ -94,35 +95,12 @@ class BinanceApi(BinanceRequest):
                 except Exception as e:
                     self.logger.error(f"获取K线异常:{e} 开始第{i}次重试", exc_info=True)
                     await asyncio.sleep(10)
-        df = pd.DataFrame(data)
-        df = df[[0, 1, 2, 3, 4, 7]]
-        if self.symbol.market_type == self.MarketType.COIN_FUTURE:
-            df.fillna(method='pad', inplace=True)
-            df[7] = round(df[7].astype(float) * df[4].astype(float) / 10000, 1)
-        else:
-            df[7] = round(df[7].astype(float) / 10000, 1)
-
-        df.columns = ['candle_begin_time', 'open', 'high', 'low', 'close', 'volume']
-        df['candle_begin_time'] = pd.to_datetime(df['candle_begin_time'], unit='ms')
-        df.sort_values(['candle_begin_time'], inplace=True)
-        df.drop_duplicates(['candle_begin_time'], 'last', inplace=True)
+        df = self.parse_kline(data)
         self.logger.info(f'获取{self.symbol}-{timeframe.upper()} K线数据完毕，共计{len(df)}条记录')
         if to_db:
             """数据入库"""
-            with session_socpe() as sc:
-                for d in df.values:
-                    kline_data = {
-                        'symbol_id': self.symbol.id,
-                        'timeframe': timeframe,
-                        'candle_begin_time': str(d[0]),
-                        'open': d[1],
-                        'high': d[2],
-                        'low': d[3],
-                        'close': d[4],
-                        'volume': d[5]
-                    }
-                    sc.merge(KlineModel(**kline_data))
-            self.logger.info(f'{self.symbol}-{timeframe.upper()} K线数据入库完毕，共计{len(data)}条记录')
+            count = KlineModel.to_db(df, self.symbol.id, timeframe)
+            self.logger.info(f'{self.symbol}-{timeframe.upper()} K线数据入库完毕，共计{count}条记录')
 
         if to_local:
             filename = f"{self.symbol.id}___{start_date}___{end_date}___{timeframe}.csv".replace(" ", "-")
@@ -136,6 +114,28 @@ class BinanceApi(BinanceRequest):
 
         return df
 
+    async def synchronize_kline(self, timeframe='1m', sc=None):
+        """
+        同步kline的接口,从数据库最后一根K线开始并发分页下载并入库
+        """
+        return await BinanceKlineDownloader(self, timeframe).download()
+
+    def parse_kline(self, data: list) -> pd.DataFrame:
+        """把币安返回的K线转换成DataFrame,成交量换算成成交额,单位万"""
+        df = pd.DataFrame(data)
+        df = df[[0, 1, 2, 3, 4, 7]]
+        if self.symbol.market_type == self.MarketType.COIN_FUTURE:
+            df.fillna(method='pad', inplace=True)
+            df[7] = round(df[7].astype(float) * df[4].astype(float) / 10000, 1)
+        else:
+            df[7] = round(df[7].astype(float) / 10000, 1)
+
+        df.columns = ['candle_begin_time', 'open', 'high', 'low', 'close', 'volume']
+        df['candle_begin_time'] = pd.to_datetime(df['candle_begin_time'], unit='ms')
+        df.sort_values(['candle_begin_time'], inplace=True)
+        df.drop_duplicates(['candle_begin_time'], 'last', inplace=True)
+        return df
+
     @classmethod
     async def get_symbols(cls, market_type: str, to_db: bool = True):
         """获取所有的交易对
@@ -397,7 +397,7 @@ class BinanceApi(BinanceRequest):
         del data['币本位按BTC计算']
         if to_db:
             with session_socpe() as sc:
-                sc.add(BalanceModel(**data))
+                BalanceModel.add_balance(data, sc=sc)
         return data
 
     async def get_all_accounts(self):
@@ -632,9 +632,11 @@ class BinanceApi(BinanceRequest):
             self.logger.error(e, exc_info=True)
 
     async def get_listen_key(self, market_type: str, rds=True):
+        # 直接用api key生成的客户端没有api id,不能读写按api id缓存的listen key,否则不同账户会共用LISTENKEY:NONE
+        cached = self.api.id is not None
         name = f"LISTENKEY:{self.api.id}:{market_type}".upper()
         redis = RedisHelper()
-        listen_key = redis.get(name)
+        listen_key = redis.get(name) if cached else None
         if (listen_key is not None) & rds:
             return listen_key
         else:
@@ -644,7 +646,8 @@ class BinanceApi(BinanceRequest):
                 path = f'{self.get_url(market_type)}/v1/listenKey'
             header = {'X-MBX-APIKEY': str(self.api.api_key)}
             listen_key = (await request(self.POST, path, timeout=15, headers=header, proxy=socks))['listenKey']
-            redis.set(name, listen_key, 60 * 55)
+            if cached:
+                redis.set(name, listen_key, 60 * 55)
             return listen_key
 
     @classmethod
@@ -934,7 +937,7 @@ class BinanceApi(BinanceRequest):
             })
         if start_time:
             param.update({
-                'startTime': arrow.get(start_time, tzinfo='Asia/Hong_Kong').timestamp * 1000
+                'startTime': int(arrow.get(start_time, tzinfo='Asia/Hong_Kong').timestamp() * 1000)
             })
         if end_time:
             param.update({
@@ -1,20 +1,240 @@
+"""币安组合stream推送
+
+一个连接订阅多个stream, 收到的数据分发给进程内的多个消费者。
+每个消费者有自己的缓冲区和处理任务, 处理慢的消费者不会影响连接和其他消费者,
+缓冲区满了之后怎么处理由消费者的StreamPolicy决定:
+    LATEST: 每个stream只保留最新的一条, 适合深度快照、ticker
+    BOUNDED: 有长度限制的队列, 满了丢掉最旧的一条
+    LOSSLESS: 不丢数据, 适合成交、增量深度
+
+收到的原始数据只解析stream名称用来分发, 消费者真正处理的时候才解析JSON, 被覆盖或者丢掉的数据不用解析。
+每个消费者统计收到、处理、丢弃的数量、队列长度和延迟, 通过stats()读取。
+"""
 import asyncio
+import json
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Executor
 from concurrent.futures.process import ProcessPoolExecutor
-from typing import List, Callable
+from typing import Any, Callable, Deque, Dict, List, Optional
 
-import simplejson as json
 import websockets
 
 from base.config import logger
-from base.consts import BinanceWebsocketUri
+from base.consts import BinanceWebsocketConfig, BinanceWebsocketUri, StreamPolicy
+
+try:
+    from orjson import loads
+except ImportError:
+    from json import loads
+
+# 组合stream推送的格式是 {"stream":"<streamName>","data":<rawPayload>}
+STREAM_PREFIX = '{"stream":"'
+
+
+class StreamMessage(object):
+    """一条推送, data第一次读取的时候才解析"""
+    __slots__ = ("stream", "raw", "received", "_data")
+
+    def __init__(self, raw: str, received: Optional[float] = None):
+        self.raw = raw
+        self.received = time.time() if received is None else received
+        self._data = None
+        if raw.startswith(STREAM_PREFIX):
+            self.stream = raw[len(STREAM_PREFIX):raw.index('"', len(STREAM_PREFIX))]
+        else:
+            self.stream = self.data.get("stream", "") if isinstance(self.data, dict) else ""
+
+    @property
+    def data(self) -> Any:
+        if self._data is None:
+            data = loads(self.raw)
+            # 给数据解包
+            if isinstance(data, dict) and data.get("stream"):
+                data = data.get("data")
+            self._data = data
+        return self._data
+
+
+class LatencyStats(object):
+    """延迟统计, 单位毫秒"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.last = value
+        if value > self.max:
+            self.max = value
+
+    def to_dict(self) -> dict:
+        return {
+            "avg": round(self.total / self.count, 3) if self.count else 0,
+            "max": round(self.max, 3),
+            "last": round(self.last, 3),
+        }
+
+
+class StreamConsumer(object):
+    """一个消费者, 按自己的policy缓存推送并依次交给callback处理
+
+    callback的参数是解包之后的数据。协程函数在事件循环里执行,
+    普通函数在executor里执行, executor为None的时候用默认的线程池。
+    """
+
+    def __init__(self, name: str, callback: Callable, streams: Optional[List[str]] = None,
+                 policy: str = StreamPolicy.LATEST, maxsize: int = BinanceWebsocketConfig.QUEUE_SIZE,
+                 executor: Optional[Executor] = None):
+        if policy not in (StreamPolicy.LATEST, StreamPolicy.BOUNDED, StreamPolicy.LOSSLESS):
+            raise ValueError(f"不支持的policy:{policy}")
+        if policy == StreamPolicy.BOUNDED and maxsize <= 0:
+            raise ValueError(f"BOUNDED队列的长度必须大于0:{maxsize}")
+        self.name = name
+        self.callback = callback
+        self.streams = set(streams) if streams else None
+        self.policy = policy
+        self.maxsize = maxsize
+        self.executor = executor
+        self.is_coroutine = asyncio.iscoroutinefunction(callback)
+        # LATEST: stream -> 最新的一条; BOUNDED/LOSSLESS: 按收到的顺序排队
+        self.latest: Dict[str, StreamMessage] = OrderedDict()
+        self.queue: Deque[StreamMessage] = deque()
+        self.ready: Optional[asyncio.Event] = None
+        self.received = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.errors = 0
+        self.max_depth = 0
+        # 从收到推送到处理完成
+        self.latency = LatencyStats()
+        # 从交易所的事件时间(E)到处理完成, 包含网络延迟和本地时钟误差
+        self.event_latency = LatencyStats()
+
+    def accept(self, stream: str) -> bool:
+        return self.streams is None or stream in self.streams
+
+    @property
+    def depth(self) -> int:
+        return len(self.latest) if self.policy == StreamPolicy.LATEST else len(self.queue)
+
+    def put(self, message: StreamMessage) -> None:
+        self.received += 1
+        if self.policy == StreamPolicy.LATEST:
+            if message.stream in self.latest:
+                self.dropped += 1
+                del self.latest[message.stream]
+            self.latest[message.stream] = message
+        else:
+            if self.policy == StreamPolicy.BOUNDED and len(self.queue) >= self.maxsize:
+                self.queue.popleft()
+                self.dropped += 1
+            self.queue.append(message)
+            if self.policy == StreamPolicy.LOSSLESS and len(self.queue) == BinanceWebsocketConfig.QUEUE_WARNING_SIZE:
+                logger.warning(f"Websocket消费者处理太慢,队列长度:{self.name},{len(self.queue)}")
+        self.max_depth = max(self.max_depth, self.depth)
+        if self.ready is not None:
+            self.ready.set()
+
+    def get(self) -> Optional[StreamMessage]:
+        if self.policy == StreamPolicy.LATEST:
+            if not self.latest:
+                return None
+            return self.latest.popitem(last=False)[1]
+        if not self.queue:
+            return None
+        return self.queue.popleft()
+
+    async def handle(self, message: StreamMessage) -> None:
+        try:
+            data = message.data
+            if self.is_coroutine:
+                await self.callback(data)
+            else:
+                await asyncio.get_running_loop().run_in_executor(self.executor, self.callback, data)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Websocket消费者处理错误:{self.name},{e}", exc_info=True)
+            return
+        self.delivered += 1
+        now = time.time()
+        self.latency.add((now - message.received) * 1000)
+        if isinstance(data, dict) and data.get("E"):
+            self.event_latency.add(now * 1000 - data["E"])
+
+    async def run(self) -> None:
+        self.ready = asyncio.Event()
+        while True:
+            message = self.get()
+            if message is None:
+                self.ready.clear()
+                await self.ready.wait()
+                continue
+            await self.handle(message)
+
+    def stats(self) -> dict:
+        return {
+            "policy": self.policy,
+            "received": self.received,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "latency_ms": self.latency.to_dict(),
+            "event_latency_ms": self.event_latency.to_dict(),
+        }
 
 
 class BinanceWebsokcetService(object):
     def __init__(self):
-        # TODO: update me
-        self.url = 'test'
+        self.consumers: List[StreamConsumer] = []
+        self.reconnects = 0
+
+    def subscribe(self, callback: Callable, streams: Optional[List[str]] = None, policy: str = StreamPolicy.LATEST,
+                  maxsize: int = BinanceWebsocketConfig.QUEUE_SIZE, executor: Optional[Executor] = None,
+                  name: Optional[str] = None) -> StreamConsumer:
+        """添加消费者, 要在start_bianace_websocket之前调用
 
-    async def start_bianace_websocket(self, market_type: str, stream_names: List[str], callback: Callable):
+        Args:
+            callback: 处理函数, 参数是解包之后的数据
+            streams: 只接收这些stream, 为None的时候接收全部
+            policy: StreamPolicy
+            maxsize: BOUNDED队列的长度
+            executor: 执行普通函数的executor
+            name: 名称, 用在日志和统计里
+
+        Returns:
+            消费者
+        """
+        consumer = StreamConsumer(name or getattr(callback, "__name__", str(len(self.consumers))), callback,
+                                  streams, policy, maxsize, executor)
+        self.consumers.append(consumer)
+        return consumer
+
+    def dispatch(self, raw: str) -> StreamMessage:
+        message = StreamMessage(raw)
+        for consumer in self.consumers:
+            if consumer.accept(message.stream):
+                consumer.put(message)
+        return message
+
+    def stats(self) -> Dict[str, dict]:
+        """每个消费者的统计数据"""
+        return {consumer.name: consumer.stats() for consumer in self.consumers}
+
+    async def log_stats(self) -> None:
+        while True:
+            await asyncio.sleep(BinanceWebsocketConfig.STATS_INTERVAL)
+            logger.info(f"Websocket统计:重连{self.reconnects}次,{self.stats()}")
+
+    async def listen(self, uri: str, stream_names: List[str]) -> None:
         # 订阅单一stream格式为 / ws / < streamName >
         # 组合streams的URL格式为 / stream?streams = < streamName1 > / < streamName2 > / < streamName3 >
         # 订阅组合streams时, 事件payload会以这样的格式封装
@@ -23,51 +243,36 @@ class BinanceWebsokcetService(object):
         # 每个到dstream.binance.com的链接有效期不超过24小时, 请妥善处理断线重连。
         # 服务端每5分钟会发送ping帧，客户端应当在15分钟内回复pong帧，否则服务端会主动断开链接。允许客户端发送不成对的pong帧(即客户端可以以高于15分钟每次的频率发送pong帧保持链接)。
         # 单个连接最多可以订阅200个Streams。
-        uri = BinanceWebsocketUri.__dict__[market_type] + f"/stream?streams={'/'.join(stream_names)}"
         subscribe = {
             "method": "SUBSCRIBE",
             "params": stream_names,
             "id": 1
         }
-        loop = asyncio.get_running_loop()
-        future = loop.create_future()
-        future.set_result("Done")
         while 1:
             try:
                 async with websockets.connect(uri) as websocket:
                     await websocket.send(json.dumps(subscribe))
                     while 1:
-                        r = await asyncio.wait_for(websocket.recv(), timeout=5)
-                        data = json.loads(r)
-
-                        # 给数据解包
-                        if data.get("stream"):
-                            data = data.get("data")
-
-                        if future.done():
-                            future = loop.run_in_executor(
-                                self.executor,
-                                callback,
-                                data
-                            )
-
-                        # print(self.queue)
-                        # if self.queue.qsize() == 0:
-                        #     self.queue.put(data)
-                        # else:
-                        #     print("1")
-
-                        # # 处理K线的逻辑
-                        # if data.get("e") == "kline":
-                        #     # for Kline,check if this kline finished
-                        #     if data.get('k').get("x"):
-                        #         func(data)
-                        #
-                        # # 处理Depth数据的逻辑
-                        # if data.get("e") == "depthUpdate":
-                        #     func(data.get("a"))
+                        self.dispatch(await asyncio.wait_for(websocket.recv(), timeout=BinanceWebsocketConfig.RECV_TIMEOUT))
+            except asyncio.CancelledError:
+                raise
             except Exception as e:
+                self.reconnects += 1
                 logger.error(f"连接币安Websocket错误:{e}", stack_info=True)
+                await asyncio.sleep(1)
+
+    async def start_bianace_websocket(self, market_type: str, stream_names: List[str], callback: Optional[Callable] = None):
+        """连接并把推送分发给所有消费者, 传了callback的时候按之前的方式添加一个LATEST的消费者"""
+        if callback is not None:
+            self.subscribe(callback, executor=getattr(self, "executor", None))
+        if not self.consumers:
+            raise ValueError("没有消费者, 先调用subscribe")
+        uri = BinanceWebsocketUri.__dict__[market_type] + f"/stream?streams={'/'.join(stream_names)}"
+        await asyncio.gather(
+            self.listen(uri, stream_names),
+            self.log_stats(),
+            *[consumer.run() for consumer in self.consumers]
+        )
 
     async def main(self, market_type: str, stream_names: List[str], call_back_function: Callable):
         """start everything
@@ -76,7 +281,3 @@ class BinanceWebsokcetService(object):
         self.stream_names = stream_names
         self.executor = ProcessPoolExecutor(max_workers=1)
         await self.start_bianace_websocket(market_type=self.market_type, stream_names=self.stream_names, callback=call_back_function)
-
-
-if __name__ == '__main__':
-    BinanceWebsokcetService.main()
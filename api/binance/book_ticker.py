@@ -0,0 +1,136 @@
+"""币安最优挂单推送
+
+通过 !bookTicker 推送维护现货、U本位合约和币本位合约所有交易对的最优挂单,
+代替每0.5秒轮询一次 /ticker/bookTicker 接口。
+
+内存里保存每个交易对的最新挂单, 只有挂单变化的交易对才会写入redis,
+每隔FLUSH_INTERVAL用一个pipeline批量写入 BINANCE:TICKER:{市场}, 格式和BinanceApi.get_tickers一样,
+写入之后在 BINANCE:TICKER:{市场}:UPDATE 频道发布变化的交易对, 基差等计算可以订阅之后只计算变化的部分。
+"""
+import asyncio
+import time
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import websockets
+
+from api.binance.binance_api import BinanceApi
+from base.config import logger
+from base.consts import BookTickerConfig
+from db.cache import RedisHelper
+
+try:
+    from orjson import loads
+except ImportError:
+    from json import loads
+
+# (买一价, 买一量, 卖一价, 卖一量), 保持推送里的字符串, 比较是否变化的时候不用转换
+Quote = Tuple[str, str, str, str]
+
+
+def ticker_key(market_type: str) -> str:
+    return f'{BinanceApi.EXCHANGE}:TICKER:{market_type}'.upper()
+
+
+def update_channel(market_type: str) -> str:
+    return BookTickerConfig.UPDATE_CHANNEL.format(ticker_key(market_type))
+
+
+class BookTickerService(object):
+    """订阅 !bookTicker 并把变化的挂单批量写入redis"""
+
+    def __init__(self, market_types: Optional[List[str]] = None, flush_interval: float = BookTickerConfig.FLUSH_INTERVAL):
+        self.market_types = market_types or BookTickerConfig.MARKET_TYPES
+        self.flush_interval = flush_interval
+        self.redis = RedisHelper()
+        # 市场 -> 交易对 -> 挂单
+        self.books: Dict[str, Dict[str, Quote]] = {market_type: {} for market_type in self.market_types}
+        # 市场 -> 交易对 -> 挂单变化的时间(毫秒)
+        self.times: Dict[str, Dict[str, float]] = {market_type: {} for market_type in self.market_types}
+        # 市场 -> 上次写入之后挂单变化的交易对
+        self.changed: Dict[str, Set[str]] = {market_type: set() for market_type in self.market_types}
+
+    def on_message(self, market_type: str, data: dict) -> bool:
+        """更新内存里的挂单, 返回挂单是否变化"""
+        symbol = data['s']
+        quote = (data['b'], data['B'], data['a'], data['A'])
+        book = self.books[market_type]
+        if book.get(symbol) == quote:
+            return False
+        book[symbol] = quote
+        # 现货的推送没有时间, 和get_tickers一样用本地时间
+        self.times[market_type][symbol] = data.get('T') or time.time() * 1000
+        self.changed[market_type].add(symbol)
+        return True
+
+    def ticker(self, market_type: str, symbol: str) -> dict:
+        bid, bid_qty, ask, ask_qty = self.books[market_type][symbol]
+        return BinanceApi.ticker_process({
+            'time': self.times[market_type][symbol],
+            'symbol': symbol,
+            'bidPrice': bid,
+            'bidQty': bid_qty,
+            'askPrice': ask,
+            'askQty': ask_qty,
+        })
+
+    def flush(self) -> int:
+        """把变化的挂单写入redis并发布通知, 返回写入的交易对数量
+
+        写入成功之后才清空变化的交易对, 写入失败的话下次flush重新写入, 不然不活跃的交易对会一直是旧的挂单
+        """
+        flushed: Dict[str, Set[str]] = {}
+        with self.redis.pipeline() as pipe:
+            for market_type in self.market_types:
+                symbols = self.changed[market_type]
+                if not symbols:
+                    continue
+                flushed[market_type] = set(symbols)
+                pipe.hmset(ticker_key(market_type), {symbol: self.ticker(market_type, symbol) for symbol in symbols})
+                pipe.publish(update_channel(market_type), sorted(symbols))
+        for market_type, symbols in flushed.items():
+            self.changed[market_type] -= symbols
+        return sum(len(symbols) for symbols in flushed.values())
+
+    async def listen(self, market_type: str) -> None:
+        url = f"{BinanceApi.get_ws_url(market_type)}/ws/!bookTicker"
+        while True:
+            try:
+                async with websockets.connect(url) as ws:
+                    logger.info(f"最优挂单推送连接成功:{market_type}")
+                    while True:
+                        data = loads(await asyncio.wait_for(ws.recv(), BookTickerConfig.RECV_TIMEOUT))
+                        self.on_message(market_type, data)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # 币安的连接24小时之后会断开, 重连之后继续用内存里的挂单比较
+                logger.error(f"最优挂单推送断开,正在重连:{market_type},{e}")
+                await asyncio.sleep(1)
+
+    async def keep_flush(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"最优挂单写入redis失败:{e}", exc_info=True)
+
+    async def run(self) -> None:
+        await asyncio.gather(self.keep_flush(), *[self.listen(market_type) for market_type in self.market_types])
+
+
+def ticker_updates(market_types: List[str]) -> Iterator[Tuple[str, List[str]]]:
+    """订阅挂单变化的通知
+
+    Returns:
+        (市场, 挂单变化的交易对)
+    """
+    redis = RedisHelper()
+    channels = {update_channel(market_type): market_type for market_type in market_types}
+    pubsub = redis.connection.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(*channels)
+    try:
+        for message in pubsub.listen():
+            yield channels[message['channel']], redis.deserialize(message['data'])
+    finally:
+        pubsub.close()
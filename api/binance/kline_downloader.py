@@ -0,0 +1,199 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import arrow
+import pandas as pd
+from sqlalchemy import func
+
+from api.binance.base_request import BinanceRequest
+from base.consts import BinanceKlineDownloadConfig
+from db.db_context import session_socpe
+from db.model import KlineModel
+
+
+class WeightLimiter(object):
+    """按币安每分钟请求权重限速的令牌桶,同一个市场的所有下载任务共用一个"""
+    limiters: Dict[str, "WeightLimiter"] = {}
+
+    def __init__(self, weight_per_minute: int):
+        self.capacity = weight_per_minute
+        self.tokens = weight_per_minute
+        self.updated = time.monotonic()
+        self.loop = None
+        self.lock = None
+
+    @classmethod
+    def get(cls, market_type: str) -> "WeightLimiter":
+        if market_type not in cls.limiters:
+            cls.limiters[market_type] = cls(BinanceKlineDownloadConfig.WEIGHT_PER_MINUTE[market_type])
+        return cls.limiters[market_type]
+
+    async def acquire(self, weight: int) -> None:
+        loop = asyncio.get_event_loop()
+        if self.loop is not loop:
+            # asyncio.Lock绑定事件循环,每次asyncio.run都要重新创建
+            self.loop, self.lock = loop, asyncio.Lock()
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.capacity / 60)
+                self.updated = now
+                if self.tokens >= weight:
+                    self.tokens -= weight
+                    return
+                await asyncio.sleep((weight - self.tokens) * 60 / self.capacity)
+
+
+class BinanceKlineDownloader(object):
+    """并发分页下载币安K线
+
+    把时间区间切成一页一页的窗口,通过信号量控制同时在途的页数,并按市场的权重预算限速。
+    每页下载完成后按时间顺序依次入库,所以数据库里最后一根K线之前的数据一定是完整的,
+    程序中断后从最后入库的K线继续下载即可。
+    """
+
+    def __init__(self, api: BinanceRequest, timeframe: str = '1m',
+                 concurrency: int = BinanceKlineDownloadConfig.CONCURRENCY,
+                 limit: int = BinanceKlineDownloadConfig.LIMIT):
+        self.api = api
+        self.symbol = api.symbol
+        self.timeframe = timeframe
+        self.concurrency = concurrency
+        self.limit = limit
+        self.granularity = api.parse_time_frame(timeframe) * 1000
+        self.limiter = WeightLimiter.get(self.symbol.market_type)
+        self.path = f'{api.get_url(self.symbol.market_type)}/v1/klines'
+
+    @property
+    def weight(self) -> int:
+        """每页请求的权重"""
+        if self.symbol.market_type == self.api.MarketType.SPOT:
+            return 1
+        if self.limit < 100:
+            return 1
+        elif self.limit < 500:
+            return 2
+        elif self.limit <= 1000:
+            return 5
+        return 10
+
+    def get_last_candle_time(self, start: datetime = None, end: datetime = None) -> Optional[datetime]:
+        """数据库里[start, end]区间内最后一根K线的时间"""
+        with session_socpe() as sc:
+            query = sc.query(func.max(KlineModel.candle_begin_time)).filter(
+                KlineModel.symbol_id == self.symbol.id, KlineModel.timeframe == self.timeframe)
+            if start:
+                query = query.filter(KlineModel.candle_begin_time >= start)
+            if end:
+                query = query.filter(KlineModel.candle_begin_time <= end)
+            return query.scalar()
+
+    def split_windows(self, start_time: int, end_time: int) -> List[Tuple[int, int]]:
+        """把[start_time, end_time)切成每页limit根K线的窗口,单位毫秒"""
+        step = self.granularity * self.limit
+        return [(t, min(t + step, end_time) - 1) for t in range(start_time, end_time, step)]
+
+    async def fetch_page(self, start_time: int, end_time: int) -> pd.DataFrame:
+        param = {
+            'symbol': self.symbol.symbol,
+            'startTime': start_time,
+            'endTime': end_time,
+            'interval': self.timeframe,
+            'limit': self.limit
+        }
+        interval = BinanceKlineDownloadConfig.RETRY_INTERVAL
+        for i in range(BinanceKlineDownloadConfig.RETRY_TIMES):
+            await self.limiter.acquire(self.weight)
+            try:
+                data = await self.api.public_request_get(self.path, data=param)
+                if not data:
+                    return pd.DataFrame()
+                return self.api.parse_kline(data)
+            except Exception as e:
+                self.api.logger.error(f"获取K线异常:{e} 开始第{i + 1}次重试,{interval}秒后重试")
+                await asyncio.sleep(interval)
+                interval *= 2
+        raise Exception(f"获取{self.symbol}-{self.timeframe.upper()} K线失败:"
+                        f"{pd.to_datetime(start_time, unit='ms')} - {pd.to_datetime(end_time, unit='ms')}")
+
+    async def download(self, start_date: str = None, end_date: str = None, resume: bool = True) -> int:
+        """下载K线并入库
+
+        Args:
+            start_date: K线起始时间,"%Y-%m-%d %H:%M:%S",不传则从数据库最后一根K线开始
+            end_date: K线结束时间,"%Y-%m-%d %H:%M:%S",不传则到当前时间
+            resume: 是否从区间内最后入库的K线继续下载
+
+        Returns:
+            入库的K线条数
+
+        """
+        end = arrow.get(end_date).datetime.replace(tzinfo=None) if end_date else datetime.utcnow()
+        start = arrow.get(start_date).datetime.replace(tzinfo=None) if start_date else None
+        if resume or not start:
+            last_candle_time = self.get_last_candle_time(start, end)
+            if last_candle_time:
+                start = last_candle_time
+        if not start:
+            start = datetime(2019, 1, 1)
+        windows = self.split_windows(int(arrow.get(start).timestamp() * 1000), int(arrow.get(end).timestamp() * 1000))
+        self.api.logger.info(f'开始下载{self.symbol}-{self.timeframe.upper()} K线:{start} - {end},共{len(windows)}页')
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        loop = asyncio.get_event_loop()
+        lock = asyncio.Lock()
+        finished_pages: Dict[int, pd.DataFrame] = {}
+        next_page = 0
+        count = 0
+
+        async def save_pages():
+            """按顺序把已经下载好的页入库,入库后才释放信号量,保证等待入库的页数也受并发数限制"""
+            nonlocal next_page, count
+            async with lock:
+                while next_page in finished_pages:
+                    df = finished_pages.pop(next_page)
+                    if df.shape[0] > 0:
+                        count += await loop.run_in_executor(None, KlineModel.to_db, df, self.symbol.id, self.timeframe)
+                        self.api.logger.info(f'{self.symbol}-{self.timeframe.upper()} K线已入库到'
+                                             f'{df["candle_begin_time"].iloc[-1]}')
+                    next_page += 1
+                    semaphore.release()
+
+        errors = []
+
+        async def download_page(index: int, window: Tuple[int, int]):
+            try:
+                finished_pages[index] = await self.fetch_page(*window)
+                await save_pages()
+            except Exception as e:
+                # 释放信号量让主循环醒过来,停止派发新的页
+                errors.append(e)
+                semaphore.release()
+                raise
+
+        tasks = []
+        try:
+            for index, window in enumerate(windows):
+                await semaphore.acquire()
+                if errors:
+                    raise errors[0]
+                tasks.append(asyncio.ensure_future(download_page(index, window)))
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+        self.api.logger.info(f'{self.symbol}-{self.timeframe.upper()} K线下载完毕,共计入库{count}条记录')
+        return count
+
+    @classmethod
+    async def download_symbols(cls, apis: List[BinanceRequest], timeframe: str = '1m', start_date: str = None,
+                               end_date: str = None) -> Dict[str, int]:
+        """同时下载多个交易对,同一个市场的交易对共用权重预算"""
+        results = await asyncio.gather(
+            *[cls(api, timeframe).download(start_date, end_date) for api in apis], return_exceptions=True)
+        for api, result in zip(apis, results):
+            if isinstance(result, Exception):
+                api.logger.error(f'{api.symbol}-{timeframe.upper()} K线下载失败:{result}')
+        return {api.symbol.symbol: result for api, result in zip(apis, results) if not isinstance(result, Exception)}
@@ -152,7 +152,7 @@ class CcfoxApi(CcfoxRequest):
         del data['timestamp']
         if to_db:
             with session_socpe() as sc:
-                sc.add(BalanceModel(**data))
+                BalanceModel.add_balance(data, sc=sc)
         return data
 
     async def get_all_accounts(self):
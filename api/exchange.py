@@ -10,6 +10,7 @@ from api.huobi.huobi_api import HuobiApi
 from api.okex.okex_api import OkexApi
 from db.db_context import session_socpe
 from db.model import ExchangeAPIModel, SymbolModel
+from db.symbol_registry import symbol_registry
 
 
 def get_api(api_id: int):
@@ -75,8 +76,7 @@ def ExchangeWithSymbolID(symbol_id: int):
         交易所的API（只可以调用不需要鉴权的接口）
 
     """
-    with session_socpe() as sc:
-        symbol: SymbolModel = SymbolModel.get_by_id(symbol_id, sc=sc)
+    symbol: SymbolModel = symbol_registry.get_by_id(symbol_id)
     if symbol:
         return BinanceApi(api=None, symbol=symbol)
     else:
@@ -65,20 +65,8 @@ class InvestingRequest(BaseApi):
 
                     if to_db:
                         """数据入库"""
-                        with session_socpe() as sc:
-                            for d in df.values:
-                                kline_data = {
-                                    'symbol_id': 3020,
-                                    'timeframe': timeframe,
-                                    'candle_begin_time': str(d[0]),
-                                    'open': d[1],
-                                    'high': d[2],
-                                    'low': d[3],
-                                    'close': d[4],
-                                    'volume': 0
-                                }
-                                sc.merge(KlineModel(**kline_data))
-                        self.logger.info(f'{self.symbol}-{timeframe.upper()} K线数据入库完毕，共计{len(df.values)}条记录')
+                        count = KlineModel.to_db(df.assign(volume=0), 3020, timeframe)
+                        self.logger.info(f'{self.symbol}-{timeframe.upper()} K线数据入库完毕，共计{count}条记录')
                     break
                 except Exception as e:
                     self.logger.error(f"获取K线异常:{e} 开始第{i}次重试", exc_info=True)
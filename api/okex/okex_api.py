@@ -122,20 +122,8 @@ class OkexApi(OkexRequest):
 
         if to_db:
             """数据入库"""
-            with session_socpe() as sc:
-                for d in df.values:
-                    kline_data = {
-                        'symbol_id': self.symbol.id,
-                        'timeframe': timeframe,
-                        'candle_begin_time': datetime.strptime(d[0], "%Y-%m-%dT%H:%M:%S.000Z"),
-                        'open': d[1],
-                        'high': d[2],
-                        'low': d[3],
-                        'close': d[4],
-                        'volume': d[5]
-                    }
-                    sc.merge(KlineModel(**kline_data))
-            self.logger.info(f'{self.symbol}-{timeframe.upper()} K线数据入库完毕，共计{len(data)}条记录')
+            count = KlineModel.to_db(df, self.symbol.id, timeframe)
+            self.logger.info(f'{self.symbol}-{timeframe.upper()} K线数据入库完毕，共计{count}条记录')
         return df
 
     @sc_wrapper
@@ -441,7 +429,7 @@ class OkexApi(OkexRequest):
         del data['timestamp']
         if to_db:
             with session_socpe() as sc:
-                sc.add(BalanceModel(**data))
+                BalanceModel.add_balance(data, sc=sc)
         return data
 
     async def get_all_positions(self):
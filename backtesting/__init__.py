@@ -10,7 +10,7 @@ except ImportError:
     pass  # Package not installed
 from datetime import datetime, timedelta
 from pprint import pformat
-from typing import Type, Callable, Optional
+from typing import Type, Callable, Optional, Union
 
 import numpy as np
 import pandas as pd
@@ -174,7 +174,7 @@ def run_backtest(
         detail: str = False,
         basis: Optional[pd.DataFrame] = None,
         factor_df: Optional[pd.DataFrame] = None,
-        volume_kline=False,
+        volume_kline: Union[bool, float, pd.DataFrame] = False,
         fixed_commission=None,
 ) -> pd.Series:
     """运行一次回测
@@ -182,7 +182,7 @@ def run_backtest(
     Args:
         custom_data: 自己定义的data
         is_basis: 是否是基差算法
-        volume_kline: 基于交易量的K线
+        volume_kline: 基于交易量的K线, 传入数字表示每根K线的成交量, 传入df表示已经聚合好的K线
         factor_df: 因子数据
         basis: 基差数据
         strategy: 策略类
@@ -208,7 +208,10 @@ def run_backtest(
         data = basis
     elif isinstance(volume_kline, pd.DataFrame):
         logger.info("正在使用交易量的K线数据进行回测")
-        data = volume_df(symbol_id, volume=250)
+        data = volume_kline
+    elif volume_kline and not isinstance(volume_kline, bool):
+        logger.info(f"正在使用交易量的K线数据进行回测,每根K线的交易量:{volume_kline}")
+        data = volume_df(symbol_id, start_time=start_time, end_time=end_time, volume=volume_kline)
     else:
         data = get_kline(symbol_id, start_time, end_time, timeframe)
 
@@ -0,0 +1,311 @@
+"""
+Fast-path simulation for signal-style strategies.
+
+`Backtest.run` calls `Broker.next()` and `Strategy.next()` for every bar,
+slicing every indicator and creating `Order`/`Trade` objects along the way.
+When the strategy's orders are fully known up front (a
+`backtesting.lib.SignalStrategy` or a target-position array), the same
+market-order/fill/commission/margin rules can be replayed in a single pass
+over plain NumPy arrays, which is what `simulate` does.
+
+The loop is a single kernel over flat lists and arrays. It is compiled with
+Numba when it is installed (an optional dependency); otherwise the same
+kernel runs as plain Python over Python floats.
+
+The rules mirror `backtesting.backtesting.Broker` exactly (FIFO closing,
+partial closes, fractional sizing against available margin, bankruptcy),
+so `Backtest.run_fast` produces the same trades and equity curve as
+`Backtest.run` for these strategies.
+"""
+import warnings
+from math import copysign, isnan
+from types import FunctionType
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+class SimulationResult(NamedTuple):
+    equity: np.ndarray
+    position: np.ndarray
+    cash: float
+    # Closed trades: (size, entry_bar, exit_bar, entry_price, exit_price)
+    closed_trades: List[tuple]
+    # Trades still open at the end: (size, entry_bar, entry_price)
+    open_trades: List[tuple]
+
+
+# The kernel keeps trades in parallel lists, indexed by position:
+#   ids, sizes, float flags, entry prices, entry bars
+# Float flags record whether `Broker` would hold the size as a float rather
+# than an int (e.g. sizes of partial closes), so the trades frame matches.
+# `totals` holds the running aggregates of `Broker._add_trade` and the cash:
+#   [size sum, abs(size) sum, entry value sum, cash]
+
+def _add_trade(totals, n_trades, size, price, sign):
+    totals[0] += sign * size
+    totals[1] += sign * abs(size)
+    if n_trades:
+        totals[2] += sign * size * price
+    else:
+        totals[2] = 0.
+
+
+def _equity(totals, n_trades, price):
+    if not n_trades:
+        return totals[3]
+    return totals[3] + (totals[0] * price - totals[2])
+
+
+def _find(ids, trade_id):
+    # Trade ids are appended in increasing order, so `ids` is sorted
+    low, high = 0, len(ids)
+    while low < high:
+        middle = (low + high) // 2
+        if ids[middle] < trade_id:
+            low = middle + 1
+        else:
+            high = middle
+    if low < len(ids) and ids[low] == trade_id:
+        return low
+    return -1
+
+
+def _close_trade(ids, sizes, floats, prices, bars, closed_sizes, closed_floats, closed_bars, closed_prices,
+                 totals, j, price, time_index):
+    ids.pop(j)
+    size = sizes.pop(j)
+    is_float = floats.pop(j)
+    entry_price = prices.pop(j)
+    entry_bar = bars.pop(j)
+    _add_trade(totals, len(sizes), size, entry_price, -1.)
+    closed_sizes.append(size)
+    closed_floats.append(is_float)
+    closed_bars.append(entry_bar)
+    closed_bars.append(time_index)
+    closed_prices.append(entry_price)
+    closed_prices.append(price)
+    totals[3] += size * (price - entry_price)
+
+
+def _reduce_trade(ids, sizes, floats, prices, bars, closed_sizes, closed_floats, closed_bars, closed_prices,
+                  totals, j, price, size, size_is_float, time_index):
+    size_left = sizes[j] + size
+    if not size_left:
+        _close_trade(ids, sizes, floats, prices, bars, closed_sizes, closed_floats, closed_bars, closed_prices,
+                     totals, j, price, time_index)
+        return
+    _add_trade(totals, len(sizes), sizes[j], prices[j], -1.)
+    sizes[j] = size_left
+    floats[j] = floats[j] or size_is_float
+    _add_trade(totals, len(sizes), size_left, prices[j], 1.)
+    # Close a copy of the reduced part, like `Broker._reduce_trade`
+    ids.append(-1)
+    sizes.append(-size)
+    floats.append(size_is_float)
+    prices.append(prices[j])
+    bars.append(bars[j])
+    _add_trade(totals, len(sizes), -size, prices[j], 1.)
+    _close_trade(ids, sizes, floats, prices, bars, closed_sizes, closed_floats, closed_bars, closed_prices,
+                 totals, len(sizes) - 1, price, time_index)
+
+
+def _simulate(open_, close, start, cash, commission, leverage, trade_on_close, hedging, is_basis,
+              use_target, entry_size, exit_portion, target_position):
+    n = len(close)
+    equity = np.full(n, np.nan)
+    position_history = np.full(n, np.nan)
+    totals = np.zeros(4)
+    totals[3] = cash
+
+    # Empty lists with a fixed element type
+    ids, sizes, floats, prices, bars = [0], [0.], [False], [0.], [0]
+    closed_sizes, closed_floats, closed_bars, closed_prices = [0.], [False], [0], [0.]
+    # Orders placed at the previous bar: parent trade id (-1 for none) and size
+    order_parents, order_sizes = [0], [0.]
+    for values in (ids, bars, closed_bars, order_parents):
+        values.clear()
+    for values in (sizes, prices, closed_sizes, closed_prices, order_sizes):
+        values.clear()
+    for values in (floats, closed_floats):
+        values.clear()
+    next_id = 0
+
+    for i in range(start, n):
+        last_price = close[i]
+
+        # Broker.next(): fill market orders
+        if len(order_sizes):
+            price = close[i - 1] if trade_on_close else open_[i]
+            time_index = i - 1 if trade_on_close else i
+            for k in range(len(order_sizes)):
+                parent = order_parents[k]
+                size = order_sizes[k]
+                if is_basis:
+                    adjusted_price = price + copysign(10., size)
+                else:
+                    adjusted_price = price * (1 + copysign(commission, size))
+
+                if parent >= 0:
+                    j = _find(ids, parent)
+                    if j >= 0:
+                        _reduce_trade(ids, sizes, floats, prices, bars, closed_sizes, closed_floats, closed_bars,
+                                      closed_prices, totals, j, adjusted_price, size, True, time_index)
+                    continue
+
+                if -1 < size < 1:
+                    if adjusted_price == 0:
+                        size = 0.
+                    else:
+                        margin_available = max(0., _equity(totals, len(sizes), last_price) - totals[1] * last_price / leverage)
+                        size = copysign(float(int((margin_available * leverage * abs(size)) // adjusted_price)), size)
+                    if not size:
+                        continue
+                need_size = float(int(size))
+                need_is_float = False
+
+                if not hedging:
+                    # Without hedging, all open trades are in the same direction, so either
+                    # none of them is closed or they are closed FIFO from the front
+                    while len(sizes) and (sizes[0] > 0) != (size > 0):
+                        if abs(need_size) >= abs(sizes[0]):
+                            trade_size = sizes[0]
+                            need_is_float = need_is_float or floats[0]
+                            _close_trade(ids, sizes, floats, prices, bars, closed_sizes, closed_floats, closed_bars,
+                                         closed_prices, totals, 0, adjusted_price, time_index)
+                            need_size += trade_size
+                        else:
+                            _reduce_trade(ids, sizes, floats, prices, bars, closed_sizes, closed_floats, closed_bars,
+                                          closed_prices, totals, 0, adjusted_price, need_size, need_is_float, time_index)
+                            need_size = 0.
+                            break
+
+                margin_available = max(0., _equity(totals, len(sizes), last_price) - totals[1] * last_price / leverage)
+                if abs(need_size) * adjusted_price > margin_available * leverage:
+                    continue
+                if need_size:
+                    ids.append(next_id)
+                    next_id += 1
+                    sizes.append(need_size)
+                    floats.append(need_is_float)
+                    prices.append(adjusted_price)
+                    bars.append(time_index)
+                    _add_trade(totals, len(sizes), need_size, adjusted_price, 1.)
+            order_parents.clear()
+            order_sizes.clear()
+
+        current_equity = _equity(totals, len(sizes), last_price)
+        equity[i] = current_equity
+        position_history[i] = totals[0]
+        if current_equity <= 0:
+            # Same as Broker.next(): close trades while iterating the live list
+            j = 0
+            while j < len(sizes):
+                _close_trade(ids, sizes, floats, prices, bars, closed_sizes, closed_floats, closed_bars,
+                             closed_prices, totals, j, last_price, i)
+                j += 1
+            totals[3] = 0.
+            equity[i:] = 0.
+            break
+
+        # Strategy.next(): place orders for the next bar
+        if use_target:
+            target = target_position[i]
+            if not isnan(target) and target != totals[0]:
+                order_parents.append(-1)
+                order_sizes.append(target - totals[0])
+            continue
+
+        portion = exit_portion[i]
+        if portion > 0 or portion < 0:
+            # Trade.close() inserts in front of the order queue, which is empty here,
+            # so the close orders end up in reverse order of the trades
+            for j in range(len(sizes) - 1, -1, -1):
+                if (sizes[j] > 0) == (portion > 0):
+                    # np.rint rounds half to even, like Python's round()
+                    size = copysign(max(1., np.rint(abs(sizes[j]) * abs(portion))), -sizes[j])
+                    order_parents.append(ids[j])
+                    order_sizes.append(size)
+        size = entry_size[i]
+        if size > 0 or size < 0:
+            order_parents.append(-1)
+            order_sizes.append(size)
+
+    return (equity, position_history, totals[3], closed_sizes, closed_floats, closed_bars, closed_prices,
+            sizes, floats, bars, prices)
+
+
+def _compile():
+    """
+    Compile the kernel and its helpers with Numba.
+
+    Numba resolves the helpers through the kernel's globals, so the compiled
+    copies get their own namespace and the Python functions stay usable.
+    """
+    namespace = dict(globals())
+    for function in (_add_trade, _equity, _find, _close_trade, _reduce_trade, _simulate):
+        copy = FunctionType(function.__code__, namespace, function.__name__)
+        namespace[function.__name__] = numba.njit(cache=True)(copy)
+    return namespace['_simulate']
+
+
+_simulate_jit = _compile() if numba is not None else None
+
+
+def _size(size: float, is_float: bool):
+    return size if is_float else int(size)
+
+
+def simulate(open_: np.ndarray, close: np.ndarray, start: int, *,
+             cash: float, commission: float, leverage: float,
+             trade_on_close: bool, hedging: bool, is_basis: bool,
+             entry_size: Optional[np.ndarray] = None,
+             exit_portion: Optional[np.ndarray] = None,
+             target_position: Optional[np.ndarray] = None,
+             jit: bool = True) -> SimulationResult:
+    """
+    Replay market orders decided at each bar's close.
+
+    In signal mode (`entry_size`, `exit_portion`), the semantics are those of
+    `backtesting.lib.SignalStrategy.next`. In target mode (`target_position`),
+    an order for `target_position[i] - position` units is placed at bar `i`
+    (NaN means "keep the current position").
+
+    The kernel is compiled with Numba when it is installed and `jit` is true,
+    and runs as plain Python otherwise.
+    """
+    use_target = target_position is not None
+    if use_target:
+        entry_size = exit_portion = np.zeros(0)
+    else:
+        target_position = np.zeros(0)
+        if exit_portion is None:
+            exit_portion = np.zeros(len(close))
+    arrays = [np.ascontiguousarray(a, dtype=float) for a in (open_, close, entry_size, exit_portion, target_position)]
+    args = (start, float(cash), float(commission), float(leverage),
+            bool(trade_on_close), bool(hedging), bool(is_basis), use_target)
+
+    if jit and _simulate_jit is not None:
+        with warnings.catch_warnings():
+            # The kernel passes its own lists to the helpers, which Numba warns about when compiling
+            warnings.simplefilter('ignore', numba.NumbaPendingDeprecationWarning)
+            result = _simulate_jit(*arrays[:2], *args, *arrays[2:])
+    else:
+        # Python floats are much cheaper than NumPy scalars in a scalar loop
+        arrays = [a.tolist() for a in arrays]
+        result = _simulate(*arrays[:2], *args, *arrays[2:])
+    (equity, position_history, cash, closed_sizes, closed_floats, closed_bars, closed_prices,
+     sizes, floats, bars, prices) = result
+
+    return SimulationResult(
+        equity=equity,
+        position=position_history,
+        cash=cash,
+        closed_trades=[(_size(closed_sizes[k], closed_floats[k]), closed_bars[2 * k], closed_bars[2 * k + 1],
+                        closed_prices[2 * k], closed_prices[2 * k + 1]) for k in range(len(closed_sizes))],
+        open_trades=[(_size(sizes[k], floats[k]), bars[k], prices[k]) for k in range(len(sizes))])
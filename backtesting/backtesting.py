@@ -569,12 +569,12 @@ class Position:
     @property
     def size(self) -> float:
         """Position size in units of asset. Negative if position is short."""
-        return sum(trade.size for trade in self.__broker.trades)
+        return self.__broker._size_sum
 
     @property
     def pl(self) -> float:
         """Profit (positive) or loss (negative) of the current position in cash units."""
-        return sum(trade.pl for trade in self.__broker.trades)
+        return self.__broker.position_pl
 
     @property
     def pl_pct(self) -> float:
@@ -947,6 +947,14 @@ class Broker:
         self.closed_trades = []  # type: List[Trade]
         self.is_basis = is_basis
 
+        # 持仓的累计量,开仓/减仓/平仓的时候增量更新,每根K线计算权益不用再遍历所有持仓
+        # 持仓总数量(带方向)
+        self._size_sum = 0
+        # sum(size * entry_price)
+        self._entry_value_sum = 0.
+        # sum(abs(size)),用于计算占用的保证金
+        self._abs_size_sum = 0
+
     def __repr__(self):
         return '<Broker: {:.0f}{:+.1f} ({} trades)>'.format(
             self.cash, self.position.pl, len(self.trades))
@@ -1005,16 +1013,33 @@ class Broker:
         """
         return self.data.Close[-1]
 
+    def _add_trade(self, trade: Trade, sign: int = 1):
+        """把一笔持仓加到(sign=-1时减掉)累计量里"""
+        self._size_sum += sign * trade.size
+        self._abs_size_sum += sign * abs(trade.size)
+        if self.trades:
+            self._entry_value_sum += sign * trade.size * trade.entry_price
+        else:
+            # 没有持仓的时候清零,避免浮点误差累积
+            self._entry_value_sum = 0.
+
+    @property
+    def position_pl(self) -> float:
+        """所有持仓的收益/亏损 = sum(size * (price - entry_price))"""
+        if not self.trades:
+            return 0
+        return self._size_sum * self.last_price - self._entry_value_sum
+
     @property
     def equity(self) -> float:
         """总权益的 = 余额 + 每笔交易的收益/亏损 求和
         """
-        return self.cash + sum(trade.pl for trade in self.trades)
+        return self.cash + self.position_pl
 
     @property
     def margin_available(self) -> float:
         # From https://github.com/QuantConnect/Lean/pull/3768
-        margin_used = sum(trade.value / self.leverage for trade in self.trades)
+        margin_used = self._abs_size_sum * self.last_price / self.leverage
         return max(0, self.equity - margin_used)
 
     def next(self):
@@ -1199,7 +1224,9 @@ class Broker:
             close_trade = trade
         else:
             # Reduce existing trade ...
+            self._add_trade(trade, -1)
             trade._replace(size=size_left)
+            self._add_trade(trade)
             if trade._sl_order:
                 trade._sl_order._replace(size=-trade.size)
             if trade._tp_order:
@@ -1208,11 +1235,13 @@ class Broker:
             # ... by closing a reduced copy of it
             close_trade = trade._copy(size=-size, sl_order=None, tp_order=None)
             self.trades.append(close_trade)
+            self._add_trade(close_trade)
 
         self._close_trade(close_trade, price, time_index)
 
     def _close_trade(self, trade: Trade, price: float, time_index: int):
         self.trades.remove(trade)
+        self._add_trade(trade, -1)
         if trade._sl_order:
             self.orders.remove(trade._sl_order)
         if trade._tp_order:
@@ -1224,6 +1253,7 @@ class Broker:
     def _open_trade(self, price: float, size: int, sl: float, tp: float, time_index: int):
         trade = Trade(self, size, price, time_index)
         self.trades.append(trade)
+        self._add_trade(trade)
         # Create SL/TP (bracket) orders.
         # Make sure SL order is created first so it gets adversarially processed before TP order
         # in case of an ambiguous tie (both hit within a single bar).
@@ -1386,22 +1416,7 @@ class Backtest:
             _trades                       Size  EntryB...
             dtype: object
         """
-        data = _Data(self.data.copy(deep=False))
-        broker = self.broker(data=data)  # type: Broker
-        strategy = self.strategy(broker, data, kwargs)  # type: Strategy
-
-        strategy.init()
-        data._update()  # Strategy.init might have changed/added to data.df
-
-        # Indicators used in Strategy.next()
-        indicator_attrs = {attr: indicator
-                           for attr, indicator in strategy.__dict__.items()
-                           if isinstance(indicator, _Indicator)}.items()
-
-        # Skip first few candles where indicators are still "warming up"
-        # +1 to have at least two entries available
-        start = 1 + max((np.isnan(indicator.astype(float)).argmin(axis=-1).max()
-                         for _, indicator in indicator_attrs), default=0)
+        data, broker, strategy, indicator_attrs, start = self._init_strategy(kwargs)
 
         # Disable "invalid value encountered in ..." warnings. Comparison
         # np.nan >= 3 is not invalid; it's Falsx.
@@ -1430,15 +1445,96 @@ class Backtest:
         self.results = self._compute_stats(broker, strategy)
         return self.results
 
+    def _init_strategy(self, kwargs):
+        data = _Data(self.data.copy(deep=False))
+        broker = self.broker(data=data)  # type: Broker
+        strategy = self.strategy(broker, data, kwargs)  # type: Strategy
+
+        strategy.init()
+        data._update()  # Strategy.init might have changed/added to data.df
+
+        # Indicators used in Strategy.next()
+        indicator_attrs = {attr: indicator
+                           for attr, indicator in strategy.__dict__.items()
+                           if isinstance(indicator, _Indicator)}.items()
+
+        # Skip first few candles where indicators are still "warming up"
+        # +1 to have at least two entries available
+        start = 1 + max((np.isnan(indicator.astype(float)).argmin(axis=-1).max()
+                         for _, indicator in indicator_attrs), default=0)
+        return data, broker, strategy, indicator_attrs, start
+
+    def run_fast(self, target_position: Sequence[float] = None, **kwargs) -> pd.Series:
+        """
+        Run the backtest of a signal-style strategy in a single pass over NumPy arrays,
+        without calling `Strategy.next` for every bar.
+
+        Applicable when the orders are known in advance:
+
+        * the strategy is a `backtesting.lib.SignalStrategy` that doesn't override `next`, or
+        * `target_position` is given: an array (same length as data) of the desired
+          position in whole units at each bar's close, NaN to keep the current position.
+          The strategy is then only initialized (e.g. for its indicators) and its `next`
+          is not used.
+
+        Only market orders are simulated (no SL/TP, limit or stop orders).
+        The pass is compiled with [Numba](https://numba.pydata.org) when it is
+        installed, which makes parameter sweeps much faster.
+        Returns the same statistics `pd.Series` as `backtesting.backtesting.Backtest.run`.
+        """
+        from ._fast import simulate
+        from .lib import SignalStrategy
+
+        data, broker, strategy, _, start = self._init_strategy(kwargs)
+        if broker.exclusive_orders:
+            raise ValueError('`run_fast` does not support `exclusive_orders`')
+        if target_position is not None:
+            target_position = np.asarray(target_position, dtype=float)
+            if target_position.shape != (len(self.data),):
+                raise ValueError('`target_position` must have the same length as data')
+            valid = target_position[~np.isnan(target_position)]
+            if (valid != np.round(valid)).any():
+                raise ValueError('`target_position` must be whole numbers of units')
+            signals = dict(target_position=target_position)
+        elif isinstance(strategy, SignalStrategy) and type(strategy).next is SignalStrategy.next:
+            entry_size, exit_portion = strategy._signal_arrays()
+            signals = dict(entry_size=entry_size, exit_portion=exit_portion)
+        else:
+            raise TypeError('`run_fast` requires `target_position` or a SignalStrategy '
+                            'that does not override `next`')
+
+        with np.errstate(invalid='ignore'):
+            result = simulate(self.data.Open.values.astype(float), self.data.Close.values.astype(float), start,
+                              cash=broker.cash, commission=broker.commission, leverage=broker.leverage,
+                              trade_on_close=broker.trade_on_close, hedging=broker.hedging,
+                              is_basis=broker.is_basis, **signals)
+
+        broker._equity = result.equity
+        broker.position_history = result.position
+        broker.cash = result.cash
+        broker.closed_trades = [
+            Trade(broker, size, entry_price, entry_bar)._replace(exit_price=exit_price, exit_bar=exit_bar)
+            for size, entry_bar, exit_bar, entry_price, exit_price in result.closed_trades]
+        for size, entry_bar, entry_price in result.open_trades:
+            broker._open_trade(entry_price, size, None, None, entry_bar)
+
+        self.results = self._compute_stats(broker, strategy)
+        return self.results
+
     def optimize(self,
                  maximize: Union[str, Callable[[pd.Series], float]] = 'SQN',
                  constraint: Callable[[dict], bool] = None,
                  return_heatmap: bool = False,
+                 method: str = 'grid',
+                 max_tries: Union[int, float] = None,
+                 prune: float = None,
+                 prune_ratio: float = .5,
+                 random_state: int = None,
                  **kwargs) -> Union[pd.Series, Tuple[pd.Series, pd.Series]]:
         """
         Optimize strategy parameters to an optimal combination using
-        parallel exhaustive search. Returns result `pd.Series` of
-        the best run.
+        parallel exhaustive, random or adaptive search. Returns result
+        `pd.Series` of the best run.
 
         `maximize` is a string key from the
         `backtesting.backtesting.Backtest.run`-returned results series,
@@ -1453,10 +1549,32 @@ class Backtest:
 
         If `return_heatmap` is `True`, besides returning the result
         series, an additional `pd.Series` is returned with a multiindex
-        of all admissible parameter combinations, which can be further
+        of all tried parameter combinations, which can be further
         inspected or projected onto 2D to plot a heatmap
         (see `backtesting.lib.plot_heatmaps()`).
 
+        `method` is `"grid"` to try admissible combinations (in random
+        order when `max_tries` is given), or `"adaptive"` to spend most
+        of the budget around the best combinations found so far, i.e. on
+        neighbouring positions in the passed collections of values.
+
+        `max_tries` is the budget of parameter combinations to try.
+        An int is the number of combinations, a float in (0, 1] is the
+        fraction of all admissible combinations. By default, `"grid"`
+        tries all admissible combinations and `"adaptive"` at most 200.
+
+        If `prune` is a fraction in (0, 1), each combination is first
+        backtested on that leading fraction of data only. Combinations
+        scoring below the `prune_ratio` quantile of prefix scores seen
+        so far, or making no trades on the prefix, are not backtested on
+        the full data and remain NaN in the heatmap.
+
+        `random_state` seeds the sampling for reproducible results.
+
+        The result records the number of backtests actually run on the
+        full data as `_evaluations` and on the data prefix as
+        `_prefix_evaluations`.
+
         Additional keyword arguments represent strategy arguments with
         list-like collections of possible values. For example, the following
         code finds and returns the "best" of the 7 admissible (of the
@@ -1465,10 +1583,6 @@ class Backtest:
             backtest.optimize(sma1=[5, 10, 15], sma2=[10, 20, 40],
                               constraint=lambda p: p.sma1 < p.sma2)
 
-        .. TODO::
-            Add parameter `max_tries: Union[int, float] = None` which switches
-            from exhaustive grid search to random search. See notes in the source.
-
         .. TODO::
             Improve multiprocessing/parallel execution on Windos with start method 'spawn'.
         """
@@ -1501,6 +1615,13 @@ class Backtest:
                             "of strategy parameters and returns a bool whether "
                             "the combination of parameters is admissible or not")
 
+        if method not in ('grid', 'adaptive'):
+            raise ValueError('`method` must be "grid" or "adaptive"')
+        if prune is not None and not 0 < prune < 1:
+            raise ValueError('`prune` must be a fraction of data in (0, 1)')
+        if not 0 <= prune_ratio < 1:
+            raise ValueError('`prune_ratio` must be a quantile in [0, 1)')
+
         def _tuple(x):
             return x if isinstance(x, Sequence) and not isinstance(x, str) else (x,)
 
@@ -1516,32 +1637,162 @@ class Backtest:
         if not param_combos:
             raise ValueError('No admissible parameter combinations to test')
 
-        if len(param_combos) > 300:
-            warnings.warn('Searching for best of {} configurations.'.format(len(param_combos)),
+        if max_tries is None:
+            max_tries = len(param_combos) if method == 'grid' else 200
+        elif isinstance(max_tries, float) and 0 < max_tries <= 1:
+            max_tries = max(1, int(round(max_tries * len(param_combos))))
+        elif isinstance(max_tries, Number) and max_tries >= 1:
+            max_tries = int(max_tries)
+        else:
+            raise ValueError('`max_tries` must be a positive int or a fraction in (0, 1]')
+        max_tries = min(max_tries, len(param_combos))
+
+        if max_tries > 300:
+            warnings.warn('Searching for best of {} configurations.'.format(max_tries),
                           stacklevel=2)
 
-        heatmap = pd.Series(np.nan,
+        if method == 'grid' and max_tries == len(param_combos) and prune is None:
+            # Exhaustive search
+            tried = list(range(len(param_combos)))
+            scores = self._evaluate(self, param_combos, maximize)
+            n_evaluations, n_prefix_evaluations = len(tried), 0
+        else:
+            # Positions of each combination's values in the passed collections,
+            # which define the neighbourhoods for adaptive sampling
+            positions = [{value: i for i, value in enumerate(_tuple(v))} for v in kwargs.values()]
+            grid = np.array([[pos[value] for pos, value in zip(positions, params.values())]
+                             for params in param_combos])
+            tried, scores, n_evaluations, n_prefix_evaluations = self._search(
+                param_combos, grid, maximize, method, max_tries, prune, prune_ratio,
+                np.random.RandomState(random_state))
+
+        heatmap = pd.Series(scores,
                             name=maximize_key,
-                            index=pd.MultiIndex.from_tuples([p.values() for p in param_combos],
+                            index=pd.MultiIndex.from_tuples([param_combos[i].values() for i in tried],
                                                             names=next(iter(param_combos)).keys()))
 
-        # TODO: add parameter `max_tries:Union[int, float]=None` which switches
-        # exhaustive grid search to random search. This might need to avoid
-        # returning NaNs in stats on runs with no trades to differentiate those
-        # from non-tested parameter combos in heatmap.
+        best_params = heatmap.idxmax() if heatmap.notnull().any() else np.nan
+
+        if pd.isnull(best_params):
+            # No trade was made in any of the runs. Just make a random
+            # run so we get some, if empty, results
+            self.run(**param_combos[tried[0]])  # type: ignore
+        else:
+            # Re-run best strategy so that the next .plot() call will render it
+            self.run(**dict(zip(heatmap.index.names, best_params)))
+
+        self.results.loc['_evaluations'] = n_evaluations
+        self.results.loc['_prefix_evaluations'] = n_prefix_evaluations
+
+        if return_heatmap:
+            return self.results, heatmap
+        return self.results
+
+    def _search(self, param_combos, grid, maximize, method, max_tries, prune, prune_ratio, random):
+        """
+        Try `max_tries` of `param_combos` in rounds, optionally pruning
+        each round on a data prefix. `grid` holds the positions of each
+        combination's values, used to sample neighbourhoods of the best
+        combinations when `method` is `"adaptive"`.
+        Returns tried combination indices, their scores and the numbers
+        of full-data and prefix backtests.
+        """
+        order = iter(random.permutation(len(param_combos)))
+        lookup = {tuple(row): i for i, row in enumerate(grid)}
+        sizes = grid.max(axis=0) + 1
+        tried = {}  # type: Dict[int, float]
+        prefix_scores = []  # type: List[float]
+        n_evaluations = n_prefix_evaluations = 0
+
+        prefix_bt = None
+        if prune is not None:
+            prefix_bt = copy(self)
+            prefix_bt.data = self.data.iloc[:max(2, int(len(self.data) * prune))]
+            prefix_bt.broker = partial(self.broker, index=prefix_bt.data.index)
+
+        # Several rounds so that pruning thresholds and adaptive sampling
+        # can learn from previous rounds
+        round_size = max_tries if method == 'grid' and prune is None else max(1, -(-max_tries // 5))
+
+        def _random(n, exclude):
+            candidates = []
+            while len(candidates) < n:
+                i = next(order, None)
+                if i is None:
+                    break
+                if i not in tried and i not in exclude:
+                    candidates.append(i)
+            return candidates
+
+        def _adaptive(n):
+            finite = [(score, i) for i, score in tried.items() if np.isfinite(score)]
+            if not finite:
+                return _random(n, ())
+            finite.sort(reverse=True)
+            elites = [i for _, i in finite[:max(1, len(finite) // 5)]]
+            # Shrink the neighbourhood as the budget is being spent
+            radius = np.maximum(1, np.round(sizes * .25 * (1 - len(tried) / max_tries))).astype(int)
+            # Keep a quarter of each round for exploration
+            n_local = n - n // 4
+            candidates = []
+            for _ in range(20 * n_local):
+                if len(candidates) == n_local:
+                    break
+                row = grid[elites[random.randint(len(elites))]]
+                row = np.clip(row + random.randint(-radius, radius + 1), 0, sizes - 1)
+                i = lookup.get(tuple(row))
+                if i is not None and i not in tried and i not in candidates:
+                    candidates.append(i)
+            return candidates + _random(n - len(candidates), set(candidates))
+
+        while len(tried) < max_tries:
+            n = min(round_size, max_tries - len(tried))
+            candidates = _adaptive(n) if method == 'adaptive' else _random(n, ())
+            if not candidates:
+                break
+            survivors = candidates
+            if prefix_bt is not None:
+                values = self._evaluate(prefix_bt, [param_combos[i] for i in candidates], maximize)
+                n_prefix_evaluations += len(candidates)
+                prefix_scores.extend(value for value in values if np.isfinite(value))
+                if prefix_scores:
+                    threshold = np.quantile(prefix_scores, prune_ratio)
+                    survivors = [i for i, value in zip(candidates, values) if value >= threshold]
+                else:
+                    survivors = []
+            for i in candidates:
+                tried[i] = np.nan
+            if survivors:
+                values = self._evaluate(self, [param_combos[i] for i in survivors], maximize)
+                n_evaluations += len(survivors)
+                tried.update(zip(survivors, values))
+
+        indices = sorted(tried)
+        return indices, [tried[i] for i in indices], n_evaluations, n_prefix_evaluations
+
+    @staticmethod
+    def _evaluate(bt, param_combos, maximize):
+        """Return `maximize` scores of backtests of `param_combos`, NaN where no trades were made."""
 
         def _batch(seq):
             n = np.clip(len(seq) // (os.cpu_count() or 1), 5, 300)
             for i in range(0, len(seq), n):
                 yield seq[i:i + n]
 
+        scores = [np.nan] * len(param_combos)
+        offsets = {}
+
         # Save necessary objects into "global" state; pass into concurrent executor
         # (and thus pickle) nothing but two numbers; receive nothing but numbers.
         # With start method "fork", children processes will inherit parent address space
         # in a copy-on-write manner, achieving better performance/RAM benefit.
         backtest_uuid = np.random.random()
         param_batches = list(_batch(param_combos))
-        Backtest._mp_backtests[backtest_uuid] = (self, param_batches, maximize)  # type: ignore
+        offset = 0
+        for batch_index, batch in enumerate(param_batches):
+            offsets[batch_index] = offset
+            offset += len(batch)
+        Backtest._mp_backtests[backtest_uuid] = (bt, param_batches, maximize)  # type: ignore
         try:
             # If multiprocessing start method is 'fork' (i.e. on POSIX), use
             # a pool of processes to compute results in parallel.
@@ -1552,32 +1803,17 @@ class Backtest:
                                for i in range(len(param_batches))]
                     for future in _tqdm(as_completed(futures), total=len(futures)):
                         batch_index, values = future.result()
-                        for value, params in zip(values, param_batches[batch_index]):
-                            heatmap[tuple(params.values())] = value
+                        scores[offsets[batch_index]:offsets[batch_index] + len(values)] = values
             else:
                 if os.name == 'posix':
                     warnings.warn("For multiprocessing support in `Backtest.optimize()` "
                                   "set multiprocessing start method to 'fork'.")
                 for batch_index in _tqdm(range(len(param_batches))):
                     _, values = Backtest._mp_task(backtest_uuid, batch_index)
-                    for value, params in zip(values, param_batches[batch_index]):
-                        heatmap[tuple(params.values())] = value
+                    scores[offsets[batch_index]:offsets[batch_index] + len(values)] = values
         finally:
             del Backtest._mp_backtests[backtest_uuid]
-
-        best_params = heatmap.idxmax()
-
-        if pd.isnull(best_params):
-            # No trade was made in any of the runs. Just make a random
-            # run so we get some, if empty, results
-            self.run(**param_combos[0])  # type: ignore
-        else:
-            # Re-run best strategy so that the next .plot() call will render it
-            self.run(**dict(zip(heatmap.index.names, best_params)))
-
-        if return_heatmap:
-            return self.results, heatmap
-        return self.results
+        return scores
 
     @staticmethod
     def _mp_task(backtest_uuid, batch_index):
@@ -1619,6 +1855,9 @@ class Backtest:
             index=index)
 
         trades = broker.closed_trades
+        # Index once for all trades instead of per-trade `entry_time`/`exit_time` lookups
+        entry_times = index[[t.entry_bar for t in trades]] if trades else []
+        exit_times = index[[t.exit_bar for t in trades]] if trades else []
         trades_df = pd.DataFrame({
             'Size': [t.size for t in trades],
             'EntryBar': [t.entry_bar for t in trades],
@@ -1627,8 +1866,8 @@ class Backtest:
             'ExitPrice': [t.exit_price for t in trades],
             'PnL': [t.pl for t in trades],
             'ReturnPct': [t.pl_pct for t in trades],
-            'EntryTime': [t.entry_time for t in trades],
-            'ExitTime': [t.exit_time for t in trades],
+            'EntryTime': entry_times,
+            'ExitTime': exit_times,
         })
         trades_df['Duration'] = trades_df['ExitTime'] - trades_df['EntryTime']
 
@@ -1,12 +1,13 @@
 """Everything Related To BT backtest
 """
+import os
 from typing import List, Optional, Dict, Tuple
 import pandas as pd
 
 import bt
-from base.consts import BacktestConfig
+from base.consts import BacktestConfig, AnalyseConfig
 from base.config import logger
-from util.cointegration_util import CointegrationCalculator
+from util.cointegration_util import CointegrationCalculator, load_screened_results
 from util.kline_util import get_kline_symbol_market
 from backtesting.CombinationAlgo import CombinationAlgo
 
@@ -36,21 +37,24 @@ def run_bt_backtest(algo: Optional[bt.Algo] = None, symbol_names: Optional[List[
     # TODO:implement me
     data = make_backtest_data()
 
-    pair_names = BacktestConfig.BACKTEST_SYMBOL_PAIRS
-
     analyse_results: Dict[Tuple[str]:pd.DataFrame] = {}
 
-    for pair in pair_names:
-        symbol_1 = pair[0] + "USDT"
-        symbol_2 = pair[1] + "USDT"
-        calculator = CointegrationCalculator(data=data, symbol_1=symbol_1, symbol_2=symbol_2, feature_columns=["BTCUSDT", "ETHUSDT"])
-        analyse_result = calculator.calculate()
-        analyse_result.dropna(inplace=True)
-        analyse_result = analyse_result[~analyse_result.index.duplicated()]
-        print(symbol_1, symbol_2, calculator.symbol_1, symbol_2)
-        assert symbol_1 == calculator.symbol_1, "wrong order"
-        assert symbol_2 == calculator.symbol_2, "wrong order"
-        analyse_results[(calculator.symbol_1, calculator.symbol_2)] = analyse_result
+    if os.path.isfile(AnalyseConfig.PAIR_SCREENING_RESULT_PATH):
+        # 使用generate_all_combination_info筛选出来的组合
+        logger.info(f"使用筛选出来的组合:{AnalyseConfig.PAIR_SCREENING_RESULT_PATH}")
+        analyse_results = {pair: result for pair, result in load_screened_results().items() if set(pair) <= set(data.columns)}
+    else:
+        for pair in BacktestConfig.BACKTEST_SYMBOL_PAIRS:
+            symbol_1 = pair[0] + "USDT"
+            symbol_2 = pair[1] + "USDT"
+            calculator = CointegrationCalculator(data=data, symbol_1=symbol_1, symbol_2=symbol_2, feature_columns=["BTCUSDT", "ETHUSDT"])
+            analyse_result = calculator.calculate()
+            analyse_result.dropna(inplace=True)
+            analyse_result = analyse_result[~analyse_result.index.duplicated()]
+            print(symbol_1, symbol_2, calculator.symbol_1, symbol_2)
+            assert symbol_1 == calculator.symbol_1, "wrong order"
+            assert symbol_2 == calculator.symbol_2, "wrong order"
+            analyse_results[(calculator.symbol_1, calculator.symbol_2)] = analyse_result
 
     logger.info(f"Trading Pairs:{analyse_results.keys()}")
 
@@ -332,6 +332,13 @@ class SignalStrategy(Strategy):
                 lambda: pd.Series(exit_portion, dtype=float).replace(0, np.nan),
                 name='exit portion', plot=plot, overlay=False, scatter=True, color='black')
 
+    def _signal_arrays(self):
+        """Full entry/exit signal arrays, used by `backtesting.backtesting.Backtest.run_fast`."""
+        entry_size = np.asarray(self.__entry_signal, dtype=float)
+        exit_portion = (np.asarray(self.__exit_signal, dtype=float)
+                        if isinstance(self.__exit_signal, np.ndarray) else None)
+        return entry_size, exit_portion
+
     def next(self):
         super().next()
 
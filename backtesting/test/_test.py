@@ -5,6 +5,7 @@ import time
 import unittest
 import warnings
 from contextlib import contextmanager
+from functools import partial
 from glob import glob
 from runpy import run_path
 from tempfile import NamedTemporaryFile, gettempdir
@@ -15,6 +16,7 @@ import numpy as np
 import pandas as pd
 
 from backtesting import Backtest, Strategy
+from backtesting.backtesting import Broker
 from backtesting._util import _Indicator, _as_str, _Array, try_
 from backtesting.lib import (
     OHLCV_AGG,
@@ -377,6 +379,46 @@ class TestBacktest(TestCase):
         bt = Backtest(GOOG, SmaCross, commission=.002)
         bt.run()
 
+    def test_incremental_equity(self):
+        class ReferenceBroker(Broker):
+            """Recomputes the aggregates by iterating over all open trades"""
+            @property
+            def position_pl(self):
+                return sum(trade.pl for trade in self.trades)
+
+            @property
+            def margin_available(self):
+                margin_used = sum(trade.value / self.leverage for trade in self.trades)
+                return max(0, self.equity - margin_used)
+
+        class Grid(Strategy):
+            def init(self):
+                self.sma = self.Indicator(SMA, self.data.Close, 5)
+
+            def next(self):
+                if len(self.data) % 7 == 0 and self.trades:
+                    self.trades[0].close(.5)
+                if self.data.Close[-1] < self.sma[-1]:
+                    self.open_long(size=3, tp=self.data.Close[-1] * 1.03)
+                elif self.data.Close[-1] > self.sma[-1] * 1.01:
+                    self.open_short(size=2, sl=self.data.Close[-1] * 1.05)
+                if len(self.data) % 50 == 0:
+                    self.position.close()
+
+        for strategy, kwargs in ((SmaCross, dict(commission=.002)),
+                                 (Grid, dict(hedging=True, margin_rate=.1)),
+                                 (SmaCross, dict(margin_rate=.5, trade_on_close=False))):
+            with self.subTest(strategy=strategy.__name__, **kwargs):
+                bt = Backtest(GOOG, strategy, **kwargs)
+                stats = bt.run()
+                bt.broker = partial(ReferenceBroker, **bt.broker.keywords)
+                expected = bt.run()
+                self.assertGreater(len(stats._trades), 10)
+                # Trades must be identical, the equity curve may only differ by float rounding
+                pd.testing.assert_frame_equal(stats._trades, expected._trades)
+                np.testing.assert_allclose(stats._equity_curve['Equity'].values,
+                                           expected._equity_curve['Equity'].values, rtol=1e-12)
+
 
 class TestStrategy(TestCase):
     def _Backtest(self, strategy_coroutine, **kwargs):
@@ -464,6 +506,36 @@ class TestOptimize(TestCase):
         with _tempfile() as f:
             bt.plot(filename=f, open_browser=False)
 
+    def test_optimize_sampling(self):
+        bt = Backtest(GOOG.iloc[:300], SmaCross)
+        OPT_PARAMS = dict(fast=range(2, 20, 2), slow=range(5, 50, 5),
+                          constraint=lambda d: d.fast < d.slow)
+
+        self.assertRaises(ValueError, bt.optimize, method='missing', **OPT_PARAMS)
+        self.assertRaises(ValueError, bt.optimize, max_tries=0, **OPT_PARAMS)
+        self.assertRaises(ValueError, bt.optimize, prune=1, **OPT_PARAMS)
+
+        full, full_heatmap = bt.optimize(return_heatmap=True, **OPT_PARAMS)
+        self.assertEqual(full['_evaluations'], len(full_heatmap))
+        self.assertEqual(full['_prefix_evaluations'], 0)
+
+        res, heatmap = bt.optimize(max_tries=20, random_state=0, return_heatmap=True, **OPT_PARAMS)
+        self.assertEqual(len(heatmap), 20)
+        self.assertEqual(res['_evaluations'], 20)
+        self.assertTrue(all(fast < slow for fast, slow in heatmap.index))
+        pd.testing.assert_series_equal(heatmap, full_heatmap[heatmap.index])
+
+        res2, heatmap2 = bt.optimize(max_tries=20, random_state=0, return_heatmap=True, **OPT_PARAMS)
+        pd.testing.assert_series_equal(heatmap, heatmap2)
+
+        res, heatmap = bt.optimize(method='adaptive', max_tries=.5, prune=.5, random_state=0,
+                                   return_heatmap=True, **OPT_PARAMS)
+        self.assertEqual(len(heatmap), round(len(full_heatmap) / 2))
+        self.assertEqual(res['_prefix_evaluations'], len(heatmap))
+        self.assertEqual(res['_evaluations'], heatmap.notnull().sum())
+        self.assertLess(res['_evaluations'], len(heatmap))
+        self.assertEqual(res['SQN'], heatmap.max())
+
     def test_nowrite_df(self):
         # Test we don't write into passed data df by default.
         # Important for copy-on-write in Backtest.optimize()
@@ -717,6 +789,49 @@ class TestLib(TestCase):
         stats = Backtest(GOOG, S).run()
         self.assertEqual(stats['# Trades'], 1180)
 
+    def test_SignalStrategy_run_fast(self):
+        class S(SignalStrategy):
+            def init(self):
+                sma = self.data.Close.s.rolling(10).mean()
+                entry = np.where(self.data.Close > sma, 2, np.where(self.data.Close < sma * .98, -.2, 0))
+                self.set_signal(entry, np.where(self.data.Close < sma, .5, 0))
+
+        for kwargs in (dict(), dict(commission=.002, trade_on_close=False), dict(hedging=True, margin_rate=.2)):
+            with self.subTest(**kwargs):
+                bt = Backtest(GOOG, S, **kwargs)
+                expected, stats = bt.run(), bt.run_fast()
+                # Same kernel, run as plain Python when Numba is not installed
+                with patch('backtesting._fast._simulate_jit', None):
+                    python_stats = bt.run_fast()
+                for stats in (stats, python_stats):
+                    pd.testing.assert_frame_equal(stats._trades, expected._trades)
+                    pd.testing.assert_frame_equal(stats._equity_curve, expected._equity_curve)
+                    pd.testing.assert_series_equal(stats.drop(['_strategy', '_equity_curve', '_trades']),
+                                                   expected.drop(['_strategy', '_equity_curve', '_trades']))
+
+        class Target(Strategy):
+            def init(self):
+                self.sma = self.Indicator(SMA, self.data.Close, 10)
+
+            def next(self):
+                target = 5 if self.data.Close[-1] > self.sma[-1] else -5
+                if self.position.size != target:
+                    size = target - self.position.size
+                    if size > 0:
+                        self.open_long(size=size)
+                    else:
+                        self.open_short(size=-size)
+
+        bt = Backtest(GOOG, Target, commission=.001)
+        sma = GOOG.Close.rolling(10).mean()
+        stats = bt.run_fast(target_position=np.where(GOOG.Close > sma, 5, -5))
+        expected = bt.run()
+        pd.testing.assert_frame_equal(stats._trades, expected._trades)
+        pd.testing.assert_frame_equal(stats._equity_curve, expected._equity_curve)
+
+        with self.assertRaises(TypeError):
+            Backtest(GOOG, SmaCross).run_fast()
+
     def test_TrailingStrategy(self):
         class S(TrailingStrategy):
             def init(self):
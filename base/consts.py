@@ -54,6 +54,17 @@ class ExecutionConfig(object):
     MAX_TRADING_DURATION = 20
     COOLDOWN_TIME = 0.2
     SPLIT_SYMBOL = "_"
+    # 是否用grpc.aio启动服务,所有请求跑在同一个事件循环里
+    AIO = False
+    # grpc.aio模式下同时处理的最大请求数,None表示不限制
+    MAX_CONCURRENT_RPCS = None
+    # 缓存的交易所客户端数量和空闲多久后移除(秒)
+    CLIENT_REGISTRY_SIZE = 512
+    CLIENT_IDLE_TIMEOUT = 60 * 30
+    # listen key 60分钟过期,每30分钟续期一次
+    LISTEN_KEY_KEEPALIVE = 60 * 30
+    # 等待用户数据流推送成交和持仓的时间,超时改用REST查询
+    FILL_TIMEOUT = 3
 
 
 class RobotConfig(object):
@@ -83,6 +94,16 @@ class ExecutionTestAccount(object):
     passphrase = "123456"
 
 
+class HttpSessionConfig(object):
+    # 连接池的总连接数和每个host的连接数
+    LIMIT = 100
+    LIMIT_PER_HOST = 20
+    # DNS解析结果缓存的秒数
+    TTL_DNS_CACHE = 300
+    # 空闲连接保持的秒数
+    KEEPALIVE_TIMEOUT = 60
+
+
 class RequestMethod:
     POST = 'POST'
     GET = 'GET'
@@ -148,19 +169,85 @@ class BinanceWebsocketUri(object):
     coin_future = "wss://dstream.binance.com"
 
 
+class StreamPolicy(object):
+    # 只保留每个stream最新的一条, 处理不过来的时候旧的数据直接覆盖, 适合深度快照、ticker
+    LATEST = "latest"
+    # 有长度限制的队列, 满了之后丢掉最旧的一条
+    BOUNDED = "bounded"
+    # 不限长度的队列, 不丢数据, 适合成交、增量深度
+    LOSSLESS = "lossless"
+
+
+class BinanceWebsocketConfig(object):
+    # 超过这么久(秒)没有收到推送就重新连接
+    RECV_TIMEOUT = 30
+    # BOUNDED队列的默认长度
+    QUEUE_SIZE = 1000
+    # LOSSLESS队列超过这个长度的时候打印警告
+    QUEUE_WARNING_SIZE = 10000
+    # 打印统计数据的间隔(秒)
+    STATS_INTERVAL = 60
+
+
+class BookTickerConfig(object):
+    # 行情有变化之后最多等这么久(秒)批量写入redis
+    FLUSH_INTERVAL = 0.05
+    MARKET_TYPES = ["spot", "usdt_future", "coin_future"]
+    # 超过这么久(秒)没有收到推送就重新连接
+    RECV_TIMEOUT = 30
+    # 写入 BINANCE:TICKER:{市场} 之后在 BINANCE:TICKER:{市场}:UPDATE 频道发布变化的交易对
+    UPDATE_CHANNEL = "{}:UPDATE"
+
+
+class BasisEngineConfig(object):
+    # 没有websocket推送的交易所(okex)轮询ticker的间隔(秒)
+    POLL_INTERVAL = 0.5
+    # 两个合约的ticker延时之和超过这么多秒就不计算基差
+    MAX_DELAY = 200
+    # 重新读取BASIS:SYMBOL的间隔(秒)
+    RELOAD_INTERVAL = 600
+    # 滚动计算最大值最小值的天数
+    MAX_MIN_DAYS = [1, 7, 30]
+
+
+class RollupConfig(object):
+    # 基差和资金曲线降采样保存的周期(秒), 每个周期保存第一条数据
+    TIMEFRAMES = {"1m": 60, "5m": 300, "15m": 900, "30m": 1800, "1h": 3600, "1d": 86400}
+    # 曲线接口最多返回的点数
+    MAX_POINTS = 10000
+
+
+class BinanceKlineDownloadConfig(object):
+    # 同时在途(请求中或等待入库)的K线分页数
+    CONCURRENCY = 8
+    # 每页K线数量,合约接口1000条以内权重为5,超过1000条权重翻倍
+    LIMIT = 1000
+    # 每分钟请求权重预算,币安现货上限1200,合约上限2400,只用一半,剩下的留给下单和查询接口
+    WEIGHT_PER_MINUTE = {"spot": 600, "usdt_future": 1200, "coin_future": 1200}
+    RETRY_TIMES = 6
+    # 失败重试的初始等待秒数,每次翻倍
+    RETRY_INTERVAL = 1
+
+
 class HuobiWebsocketUri(object):
     coin_perpetual = "wss://api.hbdm.com/swap-ws"
     usdt_perpetual = "wss://api.hbdm.com/linear-swap-ws"
 
 
 class PreProcessConfig(object):
-    DEBUG = True
-    # DEBUG = False
+    # DEBUG = True
+    DEBUG = False
     RESAMPLE_VOLUME = 200
     VOLUME_RESULT_PATH = os.path.join(BASE_DIR, "cache", "preprocess_volume_result.csv")
     MINUTE_RESULT_PATH = os.path.join(BASE_DIR, "cache", "preprocess_minute_result.csv")
 
 
+class KlineStoreConfig(object):
+    # 本地K线列式存储的根目录,每个交易对每个周期一个目录,按年分区
+    ROOT_PATH = os.path.join(BASE_DIR, "cache", "kline_store")
+    COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+
+
 class TrainerConfig(object):
     numeric_columns = [
         "max_change",
@@ -249,6 +336,27 @@ class AnalyseConfig(object):
     # ROLLING_LENGTH = 60 * 24 * 7
     ROLLING_LENGTH = 24 * 30 * 3
     ROLLING_MODELING_RESULT_PATH = os.path.join(BASE_DIR, "cache", "rolling_modeling_result.csv")
+    # 组合筛选的结果
+    PAIR_SCREENING_RESULT_PATH = os.path.join(BASE_DIR, "cache", "pair_screening_result.csv")
+    # 组合筛选的进程数
+    SCREEN_WORKERS = os.cpu_count()
+
+
+class RedisCodecConfig(object):
+    # redis里的值写入时的编码: json(之前的格式, 没有标记) / orjson
+    # 读取时按标记自动识别, 所以先升级所有读取的程序, 再切换写入的编码
+    # orjson会把NaN和Infinity写成null, 读出来是None, 切换之前确认写入的值里没有NaN
+    CODEC = "json"
+    # DataFrame的编码: pickle / arrow(需要安装pyarrow, 没有安装时用pickle)
+    DATAFRAME_CODEC = "arrow"
+
+
+class SymbolRegistryConfig(object):
+    # 进程内交易对缓存的有效期(秒), 没有收到变更通知的时候最多晚这么久刷新
+    TTL = 600
+    # 交易对表每次更新之后版本号加一, 并且在频道上发布新的版本号
+    VERSION_KEY = "SYMBOL:VERSION"
+    CHANNEL = "SYMBOL:CHANGED"
 
 
 class RedisKeys(object):
@@ -1,13 +1,14 @@
 import functools
+import time
 from datetime import datetime
-from typing import Dict
+from typing import Dict, List
 
 import sqlalchemy.types as types
-from sqlalchemy import Column, Integer, text, Boolean
+from sqlalchemy import Column, Integer, text, Boolean, bindparam
 from sqlalchemy.dialects.mysql import TIMESTAMP
 from sqlalchemy.orm import Session
 
-from db.db_context import session_socpe
+from db.db_context import session_socpe, logger
 
 
 class ChoiceType(types.TypeDecorator):
@@ -129,6 +130,53 @@ class ModelMethod(object):
         sc.commit()
         return query.first()
 
+    @classmethod
+    @sc_wrapper
+    def bulk_upsert(cls, rows: List[Dict], chunk_size: int = 5000, update: bool = True, sc: Session = None) -> int:
+        """按主键批量插入,主键冲突时更新其余字段
+
+        每个分块执行一次executemany并提交,中途失败时已经提交的分块不受影响,重跑也不会产生重复数据
+
+        Args:
+            rows: 要写入的数据,每条数据的字段必须一致
+            chunk_size: 每个分块的条数
+            update: 为False时主键冲突的数据保持不变
+            sc: 数据库session
+
+        Returns:
+            写入的条数
+
+        """
+        if not rows:
+            return 0
+        start = time.time()
+        table = cls.__table__
+        dialect = sc.get_bind().dialect
+        quote = dialect.identifier_preparer.quote
+        columns = list(rows[0].keys())
+        keys = [column.name for column in table.primary_key.columns]
+        updates = [column for column in columns if column not in keys] if update else []
+        if dialect.name == 'mysql':
+            if updates:
+                upsert = "ON DUPLICATE KEY UPDATE " + ", ".join(f"{quote(c)}=VALUES({quote(c)})" for c in updates)
+            else:
+                upsert = f"ON DUPLICATE KEY UPDATE {quote(keys[0])}={quote(keys[0])}"
+        else:
+            conflict = f"ON CONFLICT ({', '.join(quote(c) for c in keys)}) DO "
+            if updates:
+                upsert = conflict + "UPDATE SET " + ", ".join(f"{quote(c)}=excluded.{quote(c)}" for c in updates)
+            else:
+                upsert = conflict + "NOTHING"
+        sql = text(f"INSERT INTO {quote(table.name)} ({', '.join(quote(c) for c in columns)}) "
+                   f"VALUES ({', '.join(':' + c for c in columns)}) {upsert}")
+        sql = sql.bindparams(*[bindparam(c, type_=table.c[c].type) for c in columns])
+        for i in range(0, len(rows), chunk_size):
+            sc.execute(sql, rows[i:i + chunk_size])
+            sc.commit()
+        duration = max(time.time() - start, 1e-6)
+        logger.info(f"{table.name}批量入库完毕,共计{len(rows)}条记录,耗时{duration:.2f}秒,{len(rows) / duration:.0f}条/秒")
+        return len(rows)
+
 
 class BaseModel(ModelMethod):
     id = Column(Integer, primary_key=True)
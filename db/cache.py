@@ -1,14 +1,13 @@
 """Redis Utilities
 """
-import json
-import pickle
-from datetime import datetime, date
-from typing import Any, Optional, Dict, Union
+from typing import Any, Optional, Dict, Union, List, Iterable, Iterator, Callable
 
-import pandas as pd
 import redis
 
 from base.config import redis_cfg
+from base.consts import RedisCodecConfig
+from db import codec
+from db.codec import CJsonEncoder  # noqa: F401
 
 
 def singleton(cls):
@@ -25,14 +24,115 @@ def singleton(cls):
     return _singleton
 
 
-class CJsonEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, datetime):
-            return obj.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
-        elif isinstance(obj, date):
-            return obj.strftime('%Y-%m-%d')
-        else:
-            return json.JSONEncoder.default(self, obj)
+# 写入时使用的编码, 读取时按值前面的标记自动选择
+VALUE_CODEC = codec.get_codec(RedisCodecConfig.CODEC)
+DATAFRAME_CODEC = codec.get_codec(RedisCodecConfig.DATAFRAME_CODEC)
+
+
+def _key(key: Union[str, int, float]) -> str:
+    """redis里的key和哈希的key都是大写的"""
+    return str(key).upper()
+
+
+class RedisPipeline(object):
+    """和RedisHelper一样的读写方法, 命令先缓存在pipeline里, execute或者离开with的时候一次发送
+
+    用法:
+        with redis.pipeline() as pipe:
+            pipe.hget("A", "x")
+            pipe.hset("B", "y", 1)
+        a, _ = pipe.results
+
+    transaction为True的时候用MULTI/EXEC包起来, 所有命令原子执行
+    """
+
+    def __init__(self, helper: "RedisHelper", transaction: bool = False):
+        self.helper = helper
+        self.pipe = helper.connection.pipeline(transaction=transaction)
+        self.decoders: List[Callable[[Any], Any]] = []
+        self.results: List[Any] = []
+
+    def __enter__(self) -> "RedisPipeline":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        try:
+            if exc_type is None:
+                self.execute()
+        finally:
+            self.pipe.reset()
+
+    def __len__(self) -> int:
+        return len(self.decoders)
+
+    def _raw(self, data: Any) -> Any:
+        return data
+
+    def _value(self, data: Any) -> Any:
+        if data is None:
+            return data
+        return self.helper.deserialize(data)
+
+    def _values(self, data: Optional[List[Any]]) -> Optional[List[Any]]:
+        if data is None:
+            return data
+        return [self._value(x) for x in data]
+
+    def _hash(self, data: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        if data is None:
+            return data
+        return {k: self.helper.deserialize(v) for k, v in data.items()}
+
+    def execute(self) -> List[Any]:
+        """发送缓存的命令, 返回每个命令反序列化之后的结果"""
+        if not self.decoders:
+            self.results = []
+            return self.results
+        data = self.pipe.execute()
+        self.results = [decoder(x) for decoder, x in zip(self.decoders, data)]
+        self.decoders = []
+        return self.results
+
+    def set(self, redis_key: Union[str, int], value: Any, ex: Optional[int] = None) -> None:
+        self.pipe.set(_key(redis_key), self.helper.serialize(value), ex=ex)
+        self.decoders.append(self._raw)
+
+    def get(self, redis_key: Union[str, int]) -> None:
+        self.pipe.get(_key(redis_key))
+        self.decoders.append(self._value)
+
+    def delete(self, redis_key: Union[str, int]) -> None:
+        self.pipe.delete(_key(redis_key))
+        self.decoders.append(self._raw)
+
+    def hget(self, redis_key: Union[str, int], key: Union[str, int, float]) -> None:
+        self.pipe.hget(_key(redis_key), _key(key))
+        self.decoders.append(self._value)
+
+    def hmget(self, redis_key: Union[str, int], keys: Iterable[Union[str, int, float]]) -> None:
+        self.pipe.hmget(_key(redis_key), [_key(key) for key in keys])
+        self.decoders.append(self._values)
+
+    def hgetall(self, redis_key: Union[str, int]) -> None:
+        self.pipe.hgetall(_key(redis_key))
+        self.decoders.append(self._hash)
+
+    def hset(self, redis_key: Union[str, int], key: Union[str, int, float], value: Any) -> None:
+        self.pipe.hset(_key(redis_key), _key(key), self.helper.serialize(value))
+        self.decoders.append(self._raw)
+
+    def hmset(self, redis_key: Union[str, int], data: dict) -> None:
+        if data:
+            self.pipe.hmset(_key(redis_key), {k: self.helper.serialize(v) for k, v in data.items()})
+            self.decoders.append(self._raw)
+
+    def hdel(self, redis_key: Union[str, int], key: Union[str, int, float]) -> None:
+        self.pipe.hdel(_key(redis_key), _key(key))
+        self.decoders.append(self._raw)
+
+    def publish(self, channel: str, message: Any) -> None:
+        self.pipe.publish(_key(channel), self.helper.serialize(message))
+        self.decoders.append(self._raw)
 
 
 @singleton
@@ -41,24 +141,18 @@ class RedisHelper(object):
         self.pool = redis.ConnectionPool(**redis_cfg)
 
     @staticmethod
-    def serialize(data: Any):
+    def serialize(data: Any) -> str:
         """序列化数据
-        把除了整数以外的数据都变成字符串
+        DataFrame用DATAFRAME_CODEC, 其他的用VALUE_CODEC, 结果前面带一个字符的格式标记
         """
-        if isinstance(data, pd.DataFrame):
-            return pickle.dumps(data)
-        else:
-            return json.dumps(data, cls=CJsonEncoder)
+        return codec.encode(data, VALUE_CODEC, DATAFRAME_CODEC)
 
     @staticmethod
-    def deserialize(data: bytes) -> Any:
+    def deserialize(data: Union[str, bytes]) -> Any:
         """反序列化数据
-        把字符串变回原来的数据
+        按格式标记解码, 没有标记的是之前写入的JSON或者pickle
         """
-        if isinstance(data, str):
-            return json.loads(data)
-        else:
-            return pickle.loads(data)
+        return codec.decode(data)
 
     @property
     def connection(self) -> redis.StrictRedis:
@@ -68,6 +162,24 @@ class RedisHelper(object):
         rds = redis.StrictRedis(connection_pool=self.pool)
         return rds
 
+    def pipeline(self, transaction: bool = False) -> RedisPipeline:
+        """
+        批量发送命令,一次网络往返
+        """
+        return RedisPipeline(self, transaction=transaction)
+
+    def transaction(self) -> RedisPipeline:
+        """
+        批量发送命令,并且原子执行
+        """
+        return self.pipeline(transaction=True)
+
+    def scan_iter(self, match: str, count: int = 1000) -> Iterator[str]:
+        """
+        用SCAN遍历匹配的key,不会像KEYS一样阻塞redis
+        """
+        return self.connection.scan_iter(match=match, count=count)
+
     def set(self, redis_key: Union[str, int], value: Any, ex: Optional[int] = None) -> None:
         """
         设字符串的值,ex表示过期时间，如果没有就是不过期
@@ -91,6 +203,15 @@ class RedisHelper(object):
             return data
         return self.deserialize(data)
 
+    def hmget(self, redis_key: Union[str, int], keys: Iterable[Union[str, int, float]]) -> List[Any]:
+        """
+        一次取哈希里面的多个值,和keys的顺序一样,不存在的是None
+        """
+        keys = [_key(key) for key in keys]
+        if not keys:
+            return []
+        return [None if x is None else self.deserialize(x) for x in self.connection.hmget(_key(redis_key), keys)]
+
     def hgetall(self, redis_key: Union[str, int]) -> Optional[Dict[str, Any]]:
         """
         取哈希里面的所有的值
@@ -126,5 +247,11 @@ class RedisHelper(object):
         """
         return self.connection.hdel(str(redis_key).upper(), str(key).upper())
 
+    def publish(self, channel: str, message: Any) -> int:
+        """
+        在频道上发布消息, 订阅的地方用deserialize解码
+        """
+        return self.connection.publish(_key(channel), self.serialize(message))
+
 
 rds = RedisHelper()
@@ -0,0 +1,151 @@
+"""Redis value codecs
+
+写入redis的值第一个字符是格式标记, 读取的时候按标记选择解码方式。
+连接池用的是decode_responses=True, 所以编码的结果都是字符串, 二进制的数据用base64转成字符串。
+没有标记的值是之前写入的JSON字符串或者pickle的bytes, 仍然可以正常读取。
+"""
+import base64
+import json
+import pickle
+from datetime import datetime, date
+from typing import Any, Dict, Union
+
+import pandas as pd
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+
+class CJsonEncoder(json.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, datetime):
+            return obj.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+        elif isinstance(obj, date):
+            return obj.strftime('%Y-%m-%d')
+        else:
+            return json.JSONEncoder.default(self, obj)
+
+
+def _orjson_default(obj):
+    """和CJsonEncoder的时间格式保持一致, 读取的地方会用strptime解析"""
+    if isinstance(obj, datetime):
+        return obj.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+    elif isinstance(obj, date):
+        return obj.strftime('%Y-%m-%d')
+    raise TypeError(f"Object of type {obj.__class__.__name__} is not JSON serializable")
+
+
+class Codec(object):
+    """编解码器, tag是写在值前面的一个字符, 空字符串表示没有标记"""
+    name = ""
+    tag = ""
+
+    def encode(self, data: Any) -> str:
+        raise NotImplementedError
+
+    def decode(self, data: str) -> Any:
+        raise NotImplementedError
+
+
+class JsonCodec(Codec):
+    """之前的格式, 没有标记"""
+    name = "json"
+
+    def encode(self, data: Any) -> str:
+        return json.dumps(data, cls=CJsonEncoder)
+
+    def decode(self, data: str) -> Any:
+        return json.loads(data)
+
+
+class OrjsonCodec(Codec):
+    """orjson编码, 内容还是标准的JSON, 没有安装orjson的时候用json解码
+
+    和json不一样, orjson不支持NaN和Infinity, 会写成null, 读出来是None。
+    """
+    name = "orjson"
+    tag = "\x01"
+    option = (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY) if orjson else 0
+
+    def encode(self, data: Any) -> str:
+        if orjson is None:
+            return self.tag + json.dumps(data, cls=CJsonEncoder)
+        return self.tag + orjson.dumps(data, default=_orjson_default, option=self.option).decode()
+
+    def decode(self, data: str) -> Any:
+        if orjson is None:
+            return json.loads(data[1:])
+        return orjson.loads(data[1:])
+
+
+class PickleCodec(Codec):
+    """DataFrame用pickle保存, base64之后才能用decode_responses的连接读取"""
+    name = "pickle"
+    tag = "\x02"
+
+    def encode(self, data: Any) -> str:
+        return self.tag + base64.b64encode(pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)).decode()
+
+    def decode(self, data: str) -> Any:
+        return pickle.loads(base64.b64decode(data[1:]))
+
+
+class ArrowCodec(Codec):
+    """DataFrame用Arrow IPC保存, 需要安装pyarrow"""
+    name = "arrow"
+    tag = "\x03"
+
+    def encode(self, data: pd.DataFrame) -> str:
+        # from_pandas会把index保存在schema的metadata里, 读取的时候还原
+        table = pyarrow.Table.from_pandas(data)
+        sink = pyarrow.BufferOutputStream()
+        with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return self.tag + base64.b64encode(sink.getvalue().to_pybytes()).decode()
+
+    def decode(self, data: str) -> pd.DataFrame:
+        return pyarrow.ipc.open_stream(base64.b64decode(data[1:])).read_all().to_pandas()
+
+
+CODECS: Dict[str, Codec] = {codec.name: codec for codec in (JsonCodec(), OrjsonCodec(), PickleCodec(), ArrowCodec())}
+TAGGED_CODECS: Dict[str, Codec] = {codec.tag: codec for codec in CODECS.values() if codec.tag}
+
+
+def get_codec(name: str) -> Codec:
+    if name == "arrow" and pyarrow is None:
+        # 没有安装pyarrow的时候DataFrame仍然用pickle
+        name = "pickle"
+    if name not in CODECS:
+        raise ValueError(f"不支持的编码格式:{name}, 只能是{list(CODECS)}")
+    return CODECS[name]
+
+
+def encode(data: Any, codec: Codec, dataframe_codec: Codec) -> str:
+    if isinstance(data, pd.DataFrame):
+        return dataframe_codec.encode(data)
+    return codec.encode(data)
+
+
+def decode(data: Union[str, bytes]) -> Any:
+    """按照第一个字符的标记解码, 没有标记的按之前的格式解码"""
+    if isinstance(data, bytes):
+        # 不是decode_responses的连接
+        codec = TAGGED_CODECS.get(data[:1].decode("latin-1"))
+        if codec:
+            return codec.decode(data.decode())
+        # 之前用pickle保存的DataFrame, 协议2以上以\x80开头, 其余的是没有标记的JSON
+        if data[:1] == b"\x80":
+            return pickle.loads(data)
+        return json.loads(data)
+    codec = TAGGED_CODECS.get(data[:1])
+    if codec:
+        return codec.decode(data)
+    return json.loads(data)
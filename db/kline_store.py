@@ -0,0 +1,165 @@
+"""K线本地列式存储
+
+每个(symbol_id, timeframe)对应一个目录,目录下按年分区,每个分区把每一列单独保存成一个.npy文件,
+读取时通过内存映射打开,并且只打开和查询区间有交集的分区。
+meta.json记录已经从数据库同步过的时间区间,查询区间超出的部分(头部或尾部)才会去数据库补齐。
+"""
+import json
+import os
+import shutil
+import uuid
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from base.config import logger
+from base.consts import KlineStoreConfig
+
+INDEX_COLUMN = "candle_begin_time"
+META_FILE = "meta.json"
+
+TimeType = Union[str, datetime, pd.Timestamp]
+
+
+class KlineStore(object):
+    """按交易对和周期保存K线,任意[start, end]区间都从同一份数据里切片"""
+
+    def __init__(self, root_path: str = KlineStoreConfig.ROOT_PATH, columns: List[str] = None):
+        self.root_path = root_path
+        self.columns = columns or KlineStoreConfig.COLUMNS
+
+    def _symbol_path(self, symbol_id: int, timeframe: str) -> str:
+        return os.path.join(self.root_path, str(symbol_id), timeframe)
+
+    def _partition_path(self, symbol_id: int, timeframe: str, partition: int) -> str:
+        return os.path.join(self._symbol_path(symbol_id, timeframe), str(partition))
+
+    def _list_partitions(self, symbol_id: int, timeframe: str) -> List[int]:
+        path = self._symbol_path(symbol_id, timeframe)
+        if not os.path.isdir(path):
+            return []
+        return sorted(int(name) for name in os.listdir(path) if name.isdigit())
+
+    @staticmethod
+    def _partition_keys(index: np.ndarray) -> np.ndarray:
+        """每根K线所在的分区(年份)"""
+        return index.astype("datetime64[Y]").astype(np.int64) + 1970
+
+    def get_meta(self, symbol_id: int, timeframe: str) -> Optional[Dict[str, pd.Timestamp]]:
+        """获取已经同步过的时间区间,没有同步过返回None"""
+        path = os.path.join(self._symbol_path(symbol_id, timeframe), META_FILE)
+        if not os.path.isfile(path):
+            return None
+        with open(path) as f:
+            meta = json.load(f)
+        return {"start": pd.Timestamp(meta["start"]), "end": pd.Timestamp(meta["end"])}
+
+    def _set_meta(self, symbol_id: int, timeframe: str, start: pd.Timestamp, end: pd.Timestamp) -> None:
+        path = self._symbol_path(symbol_id, timeframe)
+        os.makedirs(path, exist_ok=True)
+        tmp_path = os.path.join(path, f"{META_FILE}.{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"start": str(start), "end": str(end)}, f)
+        os.replace(tmp_path, os.path.join(path, META_FILE))
+
+    def _read_partition(self, path: str, start: np.datetime64 = None, end: np.datetime64 = None) -> pd.DataFrame:
+        """读取一个分区,只把[start, end]内的行从内存映射里拷贝出来"""
+        index = np.load(os.path.join(path, f"{INDEX_COLUMN}.npy"), mmap_mode="r")
+        left = 0 if start is None else np.searchsorted(index, start, side="left")
+        right = len(index) if end is None else np.searchsorted(index, end, side="right")
+        data = {column: np.array(np.load(os.path.join(path, f"{column}.npy"), mmap_mode="r")[left:right])
+                for column in self.columns}
+        return pd.DataFrame(data, index=pd.DatetimeIndex(np.array(index[left:right]), name=INDEX_COLUMN))
+
+    def _write_partition(self, path: str, df: pd.DataFrame) -> None:
+        """先写到临时目录再替换,避免读到写了一半的分区"""
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        os.makedirs(tmp_path)
+        np.save(os.path.join(tmp_path, f"{INDEX_COLUMN}.npy"), df.index.values.astype("datetime64[ns]"))
+        for column in self.columns:
+            np.save(os.path.join(tmp_path, f"{column}.npy"), df[column].values.astype(np.float64))
+        if os.path.isdir(path):
+            old_path = f"{path}.{uuid.uuid4().hex}.old"
+            os.rename(path, old_path)
+            os.rename(tmp_path, path)
+            shutil.rmtree(old_path, ignore_errors=True)
+        else:
+            os.rename(tmp_path, path)
+
+    def read(self, symbol_id: int, timeframe: str, start_date: TimeType, end_date: TimeType) -> pd.DataFrame:
+        """读取本地已有的[start_date, end_date]的K线,不会访问数据库"""
+        start = np.datetime64(pd.Timestamp(start_date), "ns")
+        end = np.datetime64(pd.Timestamp(end_date), "ns")
+        start_year, end_year = self._partition_keys(np.array([start, end]))
+        frames = []
+        for partition in self._list_partitions(symbol_id, timeframe):
+            if partition < start_year or partition > end_year:
+                continue
+            df = self._read_partition(self._partition_path(symbol_id, timeframe, partition), start, end)
+            if df.shape[0] > 0:
+                frames.append(df)
+        if not frames:
+            return pd.DataFrame(columns=self.columns, index=pd.DatetimeIndex([], name=INDEX_COLUMN), dtype=np.float64)
+        return pd.concat(frames)
+
+    def write(self, symbol_id: int, timeframe: str, df: pd.DataFrame) -> None:
+        """把K线合并进本地存储,同一根K线以新写入的数据为准,只改动涉及到的分区"""
+        if df.shape[0] == 0:
+            return
+        df = df[self.columns]
+        keys = self._partition_keys(df.index.values.astype("datetime64[ns]"))
+        for partition in np.unique(keys):
+            part = df[keys == partition]
+            path = self._partition_path(symbol_id, timeframe, int(partition))
+            if os.path.isdir(path):
+                part = pd.concat([self._read_partition(path), part])
+                part = part[~part.index.duplicated(keep="last")]
+            self._write_partition(path, part.sort_index())
+
+    def load(self, symbol_id: int, timeframe: str, start_date: TimeType, end_date: TimeType,
+             loader: Callable[[pd.Timestamp, pd.Timestamp], pd.DataFrame]) -> pd.DataFrame:
+        """读取[start_date, end_date]的K线,本地没有覆盖到的头部和尾部通过loader补齐后再切片
+
+        Args:
+            symbol_id: 交易对ID
+            timeframe: K线周期
+            start_date: 开始时间
+            end_date: 结束时间
+            loader: 从数据源读取[start, end]K线的函数,返回以candle_begin_time为索引的DataFrame
+
+        Returns:
+            以candle_begin_time为索引的K线
+        """
+        start = pd.Timestamp(start_date)
+        end = pd.Timestamp(end_date)
+        meta = self.get_meta(symbol_id, timeframe)
+        if meta is None:
+            df = loader(start, end)
+            if df.shape[0] == 0:
+                return df
+            self.write(symbol_id, timeframe, df)
+            covered_start, covered_end = start, df.index[-1]
+        else:
+            covered_start, covered_end = meta["start"], meta["end"]
+            if start < covered_start:
+                logger.info(f"本地K线缺少头部数据,从数据源补齐:{start} - {covered_start}")
+                self.write(symbol_id, timeframe, loader(start, covered_start))
+                covered_start = start
+            if end > covered_end:
+                # 尾部只记录到真正拿到的最后一根K线,之后新入库的K线下次还会补进来
+                logger.info(f"本地K线缺少尾部数据,从数据源补齐:{covered_end} - {end}")
+                df = loader(covered_end, end)
+                self.write(symbol_id, timeframe, df)
+                if df.shape[0] > 0:
+                    covered_end = max(covered_end, df.index[-1])
+        self._set_meta(symbol_id, timeframe, covered_start, covered_end)
+        return self.read(symbol_id, timeframe, start, end)
+
+    def invalidate(self, symbol_id: int, timeframe: str) -> None:
+        """删除某个交易对某个周期的本地K线"""
+        shutil.rmtree(self._symbol_path(symbol_id, timeframe), ignore_errors=True)
+
+
+kline_store = KlineStore()
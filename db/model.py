@@ -1,11 +1,12 @@
 # coding: utf-8 import sys
 import json
-from datetime import datetime
-from typing import Optional
+import re
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
 
 import pandas as pd
-from sqlalchemy import Column, DateTime, Float, String, Integer, SmallInteger, Boolean, JSON, text, \
-    PrimaryKeyConstraint, TEXT
+from sqlalchemy import Column, DateTime, Float, String, Integer, SmallInteger, BigInteger, Boolean, JSON, text, \
+    PrimaryKeyConstraint, TEXT, func
 from sqlalchemy.dialects.mysql import TIMESTAMP, DATETIME
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import Session, aliased
@@ -13,7 +14,7 @@ from tqdm import tqdm
 
 from api.binance.future_util import BinanceFutureUtil
 from api.okex.future_util import OkexFutureUtil, MarketType
-from base.consts import BacktestConfig, RobotStatus, EXCHANGE
+from base.consts import BacktestConfig, RobotStatus, EXCHANGE, RollupConfig
 from db.base_model import BaseModelAndTime, BaseModel, ModelMethod, sc_wrapper
 from db.cache import RedisHelper, rds
 from db.db_context import session_socpe, logger
@@ -21,6 +22,82 @@ from db.db_context import session_socpe, logger
 Base = declarative_base()
 metadata = Base.metadata
 
+EPOCH = datetime(1970, 1, 1)
+
+
+def timeframe_seconds(timeframe: str) -> int:
+    """1m/5m/1h/4h/1d 这样的周期转换成秒"""
+    match = re.fullmatch(r"(\d+)([mhd])", timeframe)
+    if not match or not int(match.group(1)):
+        raise ValueError(f"周期格式不正确:{timeframe}")
+    return int(match.group(1)) * {"m": 60, "h": 3600, "d": 86400}[match.group(2)]
+
+
+def bucket_time(timestamp: datetime, seconds: int) -> datetime:
+    """timestamp所在周期的开始时间"""
+    total = int((timestamp - EPOCH).total_seconds())
+    return EPOCH + timedelta(seconds=total - total % seconds)
+
+
+class RollupMixin(ModelMethod):
+    """降采样的曲线, 主键是(key_column, timeframe, time_column)
+
+    每条数据写入的时候同时写入RollupConfig.TIMEFRAMES的每个周期, 每个周期只保留第一条,
+    查询的时候在主键上按时间范围扫描, 不需要扫描全部的历史数据。
+    """
+    key_column = ""
+    time_column = "timestamp"
+    value_columns: List[str] = []
+
+    @classmethod
+    @sc_wrapper
+    def rollup(cls, rows: List[Dict], sc: Session = None) -> int:
+        """把新数据合并到每个周期
+
+        Args:
+            rows: 包括key_column, time_column和value_columns的数据
+            sc: 数据库session
+
+        Returns:
+            写入的条数
+        """
+        data = []
+        for timeframe, seconds in RollupConfig.TIMEFRAMES.items():
+            for row in rows:
+                item = {column: row[column] for column in [cls.key_column] + cls.value_columns}
+                item['timeframe'] = timeframe
+                item[cls.time_column] = bucket_time(row[cls.time_column], seconds)
+                data.append(item)
+        return cls.bulk_upsert(data, update=False, sc=sc)
+
+    @classmethod
+    @sc_wrapper
+    def get_line(cls, key, timeframe: str, start_time: Optional[datetime] = None, end_time: Optional[datetime] = None,
+                 limit: int = RollupConfig.MAX_POINTS, sc: Session = None) -> Dict[str, list]:
+        """按列返回[start_time, end_time]里最后limit个点
+
+        没有保存的周期(比如4h)从能整除它的最大的周期里取
+        """
+        seconds = timeframe_seconds(timeframe)
+        stored, stored_seconds = max(((name, value) for name, value in RollupConfig.TIMEFRAMES.items()
+                                      if seconds % value == 0), key=lambda x: x[1], default=(None, 0))
+        if stored is None:
+            raise ValueError(f"不支持的周期:{timeframe}")
+        time_column = getattr(cls, cls.time_column)
+        query = sc.query(time_column, *[getattr(cls, column) for column in cls.value_columns]).filter(
+            getattr(cls, cls.key_column) == key, cls.timeframe == stored)
+        if start_time:
+            query = query.filter(time_column >= start_time)
+        if end_time:
+            query = query.filter(time_column <= end_time)
+        rows = query.order_by(time_column.desc()).limit(limit * (seconds // stored_seconds)).all()[::-1]
+        if seconds != stored_seconds:
+            rows = [row for row in rows if int((row[0] - EPOCH).total_seconds()) % seconds == 0][-limit:]
+        columns = [cls.time_column] + cls.value_columns
+        data = {column: list(values) for column, values in zip(columns, zip(*rows))} if rows else {column: [] for column in columns}
+        data[cls.time_column] = [str(x) for x in data[cls.time_column]]
+        return data
+
 
 class ExchangeModel(Base, BaseModelAndTime):
     __tablename__ = 'exchange'
@@ -153,6 +230,41 @@ class KlineModel(Base, ModelMethod):
         df = pd.DataFrame(cls.to_dicts(data))
         return df
 
+    @classmethod
+    @sc_wrapper
+    def to_db(cls, df: pd.DataFrame, symbol_id: int, timeframe: str, chunk_size: int = 5000, sc: Session = None) -> int:
+        """K线批量入库
+
+        Args:
+            df: 包含candle_begin_time,open,high,low,close,volume列的K线
+            symbol_id: 交易对ID
+            timeframe: K线周期
+            chunk_size: 每次executemany的条数
+            sc: 数据库session
+
+        Returns:
+            入库的条数
+
+        """
+        if df.shape[0] == 0:
+            return 0
+        candle_begin_time = pd.to_datetime(df['candle_begin_time'])
+        if candle_begin_time.dt.tz is not None:
+            candle_begin_time = candle_begin_time.dt.tz_convert(None)
+        data = pd.DataFrame({
+            'symbol_id': symbol_id,
+            'timeframe': timeframe,
+            'candle_begin_time': candle_begin_time.dt.to_pydatetime(),
+            'open': df['open'].astype(float).values,
+            'high': df['high'].astype(float).values,
+            'low': df['low'].astype(float).values,
+            'close': df['close'].astype(float).values,
+            'volume': df['volume'].astype(float).values,
+        })
+        data.drop_duplicates(['candle_begin_time'], keep='last', inplace=True)
+        data = data.astype(object).where(data.notnull(), None)
+        return cls.bulk_upsert(data.to_dict('records'), chunk_size=chunk_size, sc=sc)
+
     @classmethod
     @sc_wrapper
     def get_symbol_kline_per_page(cls, symbol_id: int, timeframe: str, start_date: str, end_date: str,
@@ -312,6 +424,28 @@ class BasisTickerModel(Base, BaseModel):
     best_short_qty = Column(Float('11, 5'), nullable=False, comment='做空对应的量')
 
 
+class BasisTickerRollupModel(Base, RollupMixin):
+    """基差ticker按周期降采样"""
+    __tablename__ = 'basis_ticker_rollup'
+    __table_args__ = (
+        PrimaryKeyConstraint('basis_id', 'timeframe', 'timestamp'),
+        {},
+    )
+    key_column = "basis_id"
+    value_columns = ["long", "short", "price1", "price2", "spot", "best_long_qty", "best_short_qty"]
+
+    basis_id = Column(SmallInteger, nullable=False, comment='基差ID')
+    timeframe = Column(String(3), nullable=False, comment='周期，1m,5m,15m,30m,1h,1d')
+    timestamp = Column(DateTime, nullable=False, comment='周期开始时间')
+    long = Column(SmallInteger, nullable=False, comment='做多基差')
+    short = Column(SmallInteger, nullable=False, comment='做空基差')
+    price1 = Column(Float('11, 5'), nullable=False, comment='future1最新价')
+    price2 = Column(Float('11, 5'), nullable=False, comment='future2最新价')
+    spot = Column(Float('11, 5'), comment='现货行情')
+    best_long_qty = Column(Float('11, 5'), nullable=False, comment='做多对应的量')
+    best_short_qty = Column(Float('11, 5'), nullable=False, comment='做空对应的量')
+
+
 class CombinationIndexSymbolModel(Base, BaseModelAndTime):
     """
     配对的symbol
@@ -397,6 +531,57 @@ class HistoryOrderModel(Base):
         logger.info('订单入库成功！')
 
 
+class TradeFillModel(Base, ModelMethod):
+    """
+    成交记录, 按账户和交易对保存已经同步过的成交, 之后只需要从最后一条成交往后取
+    """
+    __tablename__ = 'trade_fill'
+    __table_args__ = (
+        PrimaryKeyConstraint('api_id', 'symbol_id', 'trade_id'),
+        {},
+    )
+    api_id = Column(Integer, comment='交易所账户')
+    symbol_id = Column(SmallInteger, comment='交易对ID')
+    trade_id = Column(BigInteger, comment='交易所提供的成交ID')
+    order_id = Column(BigInteger, comment='交易所提供的订单ID')
+    # 价格和数量保存交易所返回的字符串, 读取之后和直接从接口取的一样
+    price = Column(String(32), comment='成交价格')
+    qty = Column(String(32), comment='成交数量')
+    quote_qty = Column(String(32), comment='成交金额')
+    is_buyer = Column(Boolean, comment='是否买单')
+    time = Column(BigInteger, index=True, comment='成交时间,毫秒')
+
+    @classmethod
+    @sc_wrapper
+    def last_trade_id(cls, api_id: int, symbol_id: int, sc: Session = None) -> Optional[int]:
+        """已经同步的最后一条成交ID, 还没有同步过返回None"""
+        return sc.query(func.max(cls.trade_id)).filter(cls.api_id == api_id, cls.symbol_id == symbol_id).scalar()
+
+    @classmethod
+    def add_trades(cls, api_id: int, symbol_id: int, trades: List[Dict]) -> int:
+        """币安 myTrades/userTrades 返回的成交入库, 已经存在的成交忽略"""
+        return cls.bulk_upsert([{
+            'api_id': api_id,
+            'symbol_id': symbol_id,
+            'trade_id': trade['id'],
+            'order_id': trade['orderId'],
+            'price': trade['price'],
+            'qty': trade['qty'],
+            'quote_qty': trade['quoteQty'],
+            'is_buyer': trade['isBuyer'],
+            'time': trade['time'],
+        } for trade in trades], update=False)
+
+    @classmethod
+    @sc_wrapper
+    def get_trades(cls, api_id: int, symbol_id: int, start_time: int = 0, sc: Session = None) -> pd.DataFrame:
+        """start_time(毫秒)之后的成交, 列名和币安接口返回的一样"""
+        rows = sc.query(cls.trade_id, cls.order_id, cls.price, cls.qty, cls.quote_qty, cls.is_buyer, cls.time).filter(
+            cls.api_id == api_id, cls.symbol_id == symbol_id, cls.time >= start_time
+        ).order_by(cls.trade_id).all()
+        return pd.DataFrame(rows, columns=['id', 'orderId', 'price', 'qty', 'quoteQty', 'isBuyer', 'time'])
+
+
 class BalanceModel(Base, BaseModel):
     """
     历史总权益
@@ -420,6 +605,41 @@ class BalanceModel(Base, BaseModel):
         obj: cls = sc.query(cls).filter(cls.api_id == api_id).first()
         return obj
 
+    @classmethod
+    @sc_wrapper
+    def add_balance(cls, data: Dict, sc: Session = None) -> "BalanceModel":
+        """资金快照入库, 同时更新降采样的资金曲线"""
+        obj = cls(**data)
+        sc.add(obj)
+        sc.flush()
+        BalanceRollupModel.rollup([{
+            'api_id': str(obj.api_id),
+            'create_time': obj.create_time,
+            'amount': obj.amount,
+            'price': obj.price,
+            'balance': round(obj.amount * obj.price, 1),
+        }], sc=sc)
+        return obj
+
+
+class BalanceRollupModel(Base, RollupMixin):
+    """历史总权益按周期降采样"""
+    __tablename__ = 'balance_rollup'
+    __table_args__ = (
+        PrimaryKeyConstraint('api_id', 'timeframe', 'create_time'),
+        {},
+    )
+    key_column = "api_id"
+    time_column = "create_time"
+    value_columns = ["amount", "price", "balance"]
+
+    api_id = Column(String(23), nullable=False, comment='交易所账户')
+    timeframe = Column(String(3), nullable=False, comment='周期，1m,5m,15m,30m,1h,1d')
+    create_time = Column(DateTime, nullable=False, comment='周期开始时间')
+    amount = Column(Float('11, 3'), nullable=False, comment='数量')
+    price = Column(Float('11, 3'), nullable=False, comment='币价')
+    balance = Column(Float('11, 1'), nullable=False, comment='权益')
+
 
 class ExchangeAPIModel(Base, BaseModelAndTime):
     """
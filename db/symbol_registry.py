@@ -0,0 +1,131 @@
+"""进程内的交易对缓存
+
+交易对表很少变化, 但是下单、取K线、启动机器人的时候都要查询, 所以每个进程只从数据库加载一次,
+之后按id和(exchange, market_type, symbol)从内存里查找。
+
+交易对入库之后调用publish_symbol_change, redis里的版本号加一并且在频道上通知,
+订阅到通知的进程下次查询的时候重新加载。收不到通知的时候(redis断开等)超过TTL也会重新加载。
+"""
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from base.config import logger
+from base.consts import SymbolRegistryConfig
+from db.cache import RedisHelper
+from db.model import SymbolModel
+
+SymbolKey = Tuple[str, str, str]
+
+
+def symbol_key(exchange: str, market_type: str, symbol: str) -> SymbolKey:
+    """和SymbolModel.get_symbol一样处理ccfox的交易对名称"""
+    if exchange == "ccfox":
+        market_type = "ccfox"
+        symbol = symbol.replace("USDT", "/USDT")
+    return exchange, market_type, symbol
+
+
+def publish_symbol_change() -> None:
+    """交易对表更新之后通知所有进程重新加载"""
+    try:
+        connection = RedisHelper().connection
+        version = connection.incr(SymbolRegistryConfig.VERSION_KEY)
+        connection.publish(SymbolRegistryConfig.CHANNEL, version)
+    except Exception as e:
+        logger.error(f"发布交易对变更通知失败:{e}")
+
+
+class SymbolRegistry(object):
+    """按id和(exchange, market_type, symbol)索引的交易对缓存
+
+    缓存的是已经脱离session的SymbolModel, 只能读取字段, 不要修改。
+    内存里没有的交易对会再查一次数据库, 查到之后加入缓存。
+    """
+
+    def __init__(self, ttl: float = SymbolRegistryConfig.TTL):
+        self.ttl = ttl
+        self.by_id: Dict[int, SymbolModel] = {}
+        self.by_key: Dict[SymbolKey, SymbolModel] = {}
+        self.loaded_at: Optional[float] = None
+        self.version: Optional[str] = None
+        self.lock = threading.RLock()
+        self.listener = None
+
+    def _add(self, symbol: SymbolModel) -> None:
+        self.by_id[symbol.id] = symbol
+        self.by_key[(symbol.exchange, symbol.market_type, symbol.symbol)] = symbol
+
+    def _subscribe(self) -> None:
+        """在后台线程订阅变更通知, redis不可用的时候只靠TTL刷新"""
+        if self.listener is not None:
+            return
+        try:
+            pubsub = RedisHelper().connection.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{SymbolRegistryConfig.CHANNEL: self._on_message})
+            self.listener = pubsub.run_in_thread(sleep_time=1, daemon=True)
+        except Exception as e:
+            logger.error(f"订阅交易对变更通知失败:{e}")
+
+    def _on_message(self, message: dict) -> None:
+        if message.get("data") != self.version:
+            self.invalidate()
+
+    def _current_version(self) -> Optional[str]:
+        try:
+            version = RedisHelper().connection.get(SymbolRegistryConfig.VERSION_KEY)
+        except Exception:
+            return None
+        return None if version is None else str(version)
+
+    def load(self) -> None:
+        """从数据库加载全部交易对"""
+        with self.lock:
+            self._subscribe()
+            # 先读版本号, 加载过程中发生的变更会让下一次查询再加载一次
+            version = self._current_version()
+            symbols = SymbolModel.get_all_data()
+            self.by_id, self.by_key = {}, {}
+            for symbol in symbols:
+                self._add(symbol)
+            self.version = version
+            self.loaded_at = time.monotonic()
+            logger.info(f"加载交易对成功:{len(symbols)}个, 版本:{version}")
+
+    def invalidate(self) -> None:
+        """下一次查询的时候重新加载"""
+        self.loaded_at = None
+
+    def _ensure_loaded(self) -> None:
+        loaded_at = self.loaded_at
+        if loaded_at is None or time.monotonic() - loaded_at > self.ttl:
+            self.load()
+
+    def get_by_id(self, id: int) -> Optional[SymbolModel]:
+        if not id:
+            return None
+        self._ensure_loaded()
+        symbol = self.by_id.get(id)
+        if symbol is None:
+            symbol = SymbolModel.get_by_id(id)
+            if symbol is not None:
+                with self.lock:
+                    self._add(symbol)
+        return symbol
+
+    def get_symbol(self, exchange: str, market_type: str, symbol: str) -> Optional[SymbolModel]:
+        self._ensure_loaded()
+        result = self.by_key.get(symbol_key(exchange, market_type, symbol))
+        if result is None:
+            result = SymbolModel.get_symbol(exchange=exchange, market_type=market_type, symbol=symbol)
+            if result is not None:
+                with self.lock:
+                    self._add(result)
+        return result
+
+    def all(self) -> List[SymbolModel]:
+        self._ensure_loaded()
+        return list(self.by_id.values())
+
+
+symbol_registry = SymbolRegistry()
@@ -0,0 +1,95 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+from api.base_api import BaseApi
+from api.exchange import SimpleExchangeAPI
+from base.config import execution_logger as logger
+from base.consts import ExecutionConfig
+from db.model import SymbolModel
+
+ClientKey = Tuple[str, str, int]
+
+
+class ClientEntry(object):
+    """缓存的交易所客户端"""
+
+    def __init__(self, client: BaseApi, secret_key: str, passphrase: str):
+        self.client = client
+        self.secret_key = secret_key
+        self.passphrase = passphrase
+        self.last_used = time.monotonic()
+
+
+class ExchangeClientRegistry(object):
+    """按(exchange, api_key, symbol_id)缓存交易所客户端的LRU表
+
+    客户端里保存了签名用的key,http请求通过SessionManager共用同一个事件循环的session,
+    所以同一个账户同一个交易对的请求可以一直复用同一个客户端。
+    超过max_size时淘汰最久没用的客户端,超过idle_timeout没用的客户端在下次访问时清理掉。
+    """
+
+    def __init__(self, max_size: int = ExecutionConfig.CLIENT_REGISTRY_SIZE,
+                 idle_timeout: float = ExecutionConfig.CLIENT_IDLE_TIMEOUT):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.entries: "OrderedDict[ClientKey, ClientEntry]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _evict_idle(self, now: float) -> None:
+        """最久没用的在最前面,从前往后清理过期的客户端"""
+        while self.entries:
+            key, entry = next(iter(self.entries.items()))
+            if now - entry.last_used < self.idle_timeout:
+                break
+            self.entries.popitem(last=False)
+            self.expirations += 1
+            logger.info(f"交易所客户端空闲超时,移除:{key[0]}-{key[2]}")
+
+    def _get_entry(self, api_key: str, secret_key: str, passphrase: str, symbol: SymbolModel) -> ClientEntry:
+        key = (symbol.exchange, api_key, symbol.id)
+        now = time.monotonic()
+        with self.lock:
+            self._evict_idle(now)
+            entry = self.entries.get(key)
+            # 同一个api_key换了secret_key的话重新生成客户端
+            if entry and entry.secret_key == secret_key and entry.passphrase == passphrase:
+                self.hits += 1
+                self.entries.move_to_end(key)
+            else:
+                self.misses += 1
+                client = SimpleExchangeAPI(exchange=symbol.exchange, api_key=api_key, secret_key=secret_key, passphrase=passphrase, symbol=symbol)
+                entry = ClientEntry(client=client, secret_key=secret_key, passphrase=passphrase)
+                self.entries[key] = entry
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_size:
+                    self.entries.popitem(last=False)
+                    self.evictions += 1
+            entry.last_used = now
+            return entry
+
+    def get(self, api_key: str, secret_key: str, passphrase: str, symbol: SymbolModel) -> BaseApi:
+        """获取交易所客户端,没有缓存的时候新建一个"""
+        return self._get_entry(api_key=api_key, secret_key=secret_key, passphrase=passphrase, symbol=symbol).client
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    def metrics(self) -> Dict[str, float]:
+        """缓存命中情况"""
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
@@ -19,7 +19,7 @@ DESCRIPTOR = _descriptor.FileDescriptor(
   syntax='proto3',
   serialized_options=None,
   create_key=_descriptor._internal_create_key,
-  serialized_pb=b'\n\x19\x65xecution/execution.proto\"x\n\x11MultipleOrderInfo\x12\x0f\n\x07\x61pi_key\x18\x01 \x01(\t\x12\x12\n\nsecret_key\x18\x02 \x01(\t\x12\x12\n\npassphrase\x18\x03 \x01(\t\x12\x12\n\nsymbol_ids\x18\x04 \x03(\x05\x12\x16\n\x0etarget_amounts\x18\x05 \x03(\x01\"\x94\x01\n\nTargetInfo\x12\x16\n\x0etarget_percent\x18\x01 \x01(\x01\x12\x11\n\tdirection\x18\x02 \x01(\t\x12\x0f\n\x07\x61pi_key\x18\x03 \x01(\t\x12\x12\n\nsecret_key\x18\x04 \x01(\t\x12\x12\n\npassphrase\x18\x05 \x01(\t\x12\x0f\n\x07percent\x18\x06 \x01(\x01\x12\x11\n\tsymbol_id\x18\x07 \x01(\x05\"B\n\nAdjustInfo\x12\x0f\n\x07percent\x18\x01 \x01(\x01\x12\x11\n\tlongitude\x18\x02 \x01(\x05\x12\x10\n\x08robot_id\x18\x03 \x01(\x05\"z\n\tOrderInfo\x12\x11\n\tsymbol_id\x18\x01 \x01(\x05\x12\x11\n\tdirection\x18\x02 \x01(\t\x12\x0f\n\x07\x61pi_key\x18\x03 \x01(\t\x12\x12\n\nsecret_key\x18\x04 \x01(\t\x12\x12\n\npassphrase\x18\x05 \x01(\t\x12\x0e\n\x06\x61mount\x18\x06 \x01(\x01\"]\n\x0f\x43heckEquityInfo\x12\x11\n\tsymbol_id\x18\x01 \x01(\x05\x12\x0f\n\x07\x61pi_key\x18\x02 \x01(\t\x12\x12\n\nsecret_key\x18\x03 \x01(\t\x12\x12\n\npassphrase\x18\x04 \x01(\t\"_\n\x11\x43heckPositionInfo\x12\x11\n\tsymbol_id\x18\x01 \x01(\x05\x12\x0f\n\x07\x61pi_key\x18\x02 \x01(\t\x12\x12\n\nsecret_key\x18\x03 \x01(\t\x12\x12\n\npassphrase\x18\x04 \x01(\t\"{\n\x16\x43heckBasisPositionInfo\x12\x13\n\x0bsymbol_id_1\x18\x01 \x01(\x05\x12\x13\n\x0bsymbol_id_2\x18\x02 \x01(\x05\x12\x0f\n\x07\x61pi_key\x18\x05 \x01(\t\x12\x12\n\nsecret_key\x18\x06 \x01(\t\x12\x12\n\npassphrase\x18\x07 \x01(\t\"\xc1\x01\n\x0eOrderBasisInfo\x12\x13\n\x0bsymbol_id_1\x18\x01 \x01(\x05\x12\x13\n\x0bsymbol_id_2\x18\x02 \x01(\x05\x12\x13\n\x0b\x64irection_1\x18\x03 \x01(\t\x12\x13\n\x0b\x64irection_2\x18\x04 \x01(\t\x12\x0f\n\x07\x61pi_key\x18\x05 \x01(\t\x12\x12\n\nsecret_key\x18\x06 \x01(\t\x12\x12\n\npassphrase\x18\x07 \x01(\t\x12\x10\n\x08\x61mount_1\x18\x08 \x01(\x01\x12\x10\n\x08\x61mount_2\x18\t \x01(\x01\":\n\x0e\x43heckBasisInfo\x12\x13\n\x0bsymbol_id_1\x18\x01 \x01(\x05\x12\x13\n\x0bsymbol_id_2\x18\x02 \x01(\x05\"\x84\x02\n\x0cTwoOrderInfo\x12\x13\n\x0bsymbol_id_1\x18\x01 \x01(\x05\x12\x13\n\x0bsymbol_id_2\x18\x02 \x01(\x05\x12\x13\n\x0b\x64irection_1\x18\x03 \x01(\t\x12\x13\n\x0b\x64irection_2\x18\x04 \x01(\t\x12\x11\n\tapi_key_1\x18\x05 \x01(\t\x12\x14\n\x0csecret_key_1\x18\x06 \x01(\t\x12\x14\n\x0cpassphrase_1\x18\x07 \x01(\t\x12\x11\n\tapi_key_2\x18\x08 \x01(\t\x12\x14\n\x0csecret_key_2\x18\t \x01(\t\x12\x14\n\x0cpassphrase_2\x18\n \x01(\t\x12\x10\n\x08\x61mount_1\x18\x0b \x01(\x01\x12\x10\n\x08\x61mount_2\x18\x0c \x01(\x01\"\xc3\x01\n\x19\x43heckTwoOrderPositionInfo\x12\x13\n\x0bsymbol_id_1\x18\x01 \x01(\x05\x12\x13\n\x0bsymbol_id_2\x18\x02 \x01(\x05\x12\x11\n\tapi_key_1\x18\x05 \x01(\t\x12\x14\n\x0csecret_key_1\x18\x06 \x01(\t\x12\x14\n\x0cpassphrase_1\x18\x07 \x01(\t\x12\x11\n\tapi_key_2\x18\x08 \x01(\t\x12\x14\n\x0csecret_key_2\x18\t \x01(\t\x12\x14\n\x0cpassphrase_2\x18\n \x01(\t\"\x1b\n\x0bOrderResult\x12\x0c\n\x04\x63ode\x18\x01 \x01(\x05\"@\n\x13\x43heckPositionResult\x12\x13\n\x0blong_amount\x18\x01 \x01(\x01\x12\x14\n\x0cshort_amount\x18\x02 \x01(\x01\"x\n\x18\x43heckBasisPositionResult\x12\x15\n\rlong_amount_1\x18\x01 \x01(\x01\x12\x16\n\x0eshort_amount_1\x18\x02 \x01(\x01\x12\x15\n\rlong_amount_2\x18\x03 \x01(\x01\x12\x16\n\x0eshort_amount_2\x18\x04 \x01(\x01\"^\n\x10\x43heckBasisResult\x12\x0c\n\x04long\x18\x01 \x01(\x01\x12\r\n\x05short\x18\x02 \x01(\x01\x12\x15\n\rbest_long_qty\x18\x03 \x01(\x01\x12\x16\n\x0e\x62\x65st_short_qty\x18\x04 \x01(\x01\"D\n\x11\x43heckEquityResult\x12\x0e\n\x06\x65quity\x18\x01 \x01(\x01\x12\x11\n\tavailable\x18\x02 \x01(\x01\x12\x0c\n\x04\x63ont\x18\x03 \x01(\x01\"\xaf\x01\n\x1e\x43heckBasisPositionEquityResult\x12\x0e\n\x06\x65quity\x18\x01 \x01(\x01\x12\x11\n\tavailable\x18\x02 \x01(\x01\x12\x0c\n\x04\x63ont\x18\x03 \x01(\x01\x12\x15\n\rlong_amount_1\x18\x04 \x01(\x01\x12\x16\n\x0eshort_amount_1\x18\x05 \x01(\x01\x12\x15\n\rlong_amount_2\x18\x06 \x01(\x01\x12\x16\n\x0eshort_amount_2\x18\x07 \x01(\x01\x32\xbb\x05\n\tExecution\x12-\n\x0eTargetPosition\x12\x0b.TargetInfo\x1a\x0c.OrderResult\"\x00\x12-\n\x0e\x41\x64justPosition\x12\x0b.AdjustInfo\x1a\x0c.OrderResult\"\x00\x12#\n\x05Order\x12\n.OrderInfo\x1a\x0c.OrderResult\"\x00\x12\x35\n\x0b\x43heckEquity\x12\x10.CheckEquityInfo\x1a\x12.CheckEquityResult\"\x00\x12;\n\rCheckPosition\x12\x12.CheckPositionInfo\x1a\x14.CheckPositionResult\"\x00\x12\x32\n\nCheckBasis\x12\x0f.CheckBasisInfo\x1a\x11.CheckBasisResult\"\x00\x12-\n\nOrderBasis\x12\x0f.OrderBasisInfo\x1a\x0c.OrderResult\"\x00\x12J\n\x12\x43heckBasisPosition\x12\x17.CheckBasisPositionInfo\x1a\x19.CheckBasisPositionResult\"\x00\x12V\n\x18\x43heckBasisPositionEquity\x12\x17.CheckBasisPositionInfo\x1a\x1f.CheckBasisPositionEquityResult\"\x00\x12\x33\n\rMultipleOrder\x12\x12.MultipleOrderInfo\x1a\x0c.OrderResult\"\x00\x12)\n\x08TwoOrder\x12\r.TwoOrderInfo\x1a\x0c.OrderResult\"\x00\x12P\n\x15\x43heckTwoOrderPosition\x12\x1a.CheckTwoOrderPositionInfo\x1a\x19.CheckBasisPositionResult\"\x00\x62\x06proto3'
+  serialized_pb=b'\n\x19\x65xecution/execution.proto\"x\n\x11MultipleOrderInfo\x12\x0f\n\x07\x61pi_key\x18\x01 \x01(\t\x12\x12\n\nsecret_key\x18\x02 \x01(\t\x12\x12\n\npassphrase\x18\x03 \x01(\t\x12\x12\n\nsymbol_ids\x18\x04 \x03(\x05\x12\x16\n\x0etarget_amounts\x18\x05 \x03(\x01\"\x94\x01\n\nTargetInfo\x12\x16\n\x0etarget_percent\x18\x01 \x01(\x01\x12\x11\n\tdirection\x18\x02 \x01(\t\x12\x0f\n\x07\x61pi_key\x18\x03 \x01(\t\x12\x12\n\nsecret_key\x18\x04 \x01(\t\x12\x12\n\npassphrase\x18\x05 \x01(\t\x12\x0f\n\x07percent\x18\x06 \x01(\x01\x12\x11\n\tsymbol_id\x18\x07 \x01(\x05\"B\n\nAdjustInfo\x12\x0f\n\x07percent\x18\x01 \x01(\x01\x12\x11\n\tlongitude\x18\x02 \x01(\x05\x12\x10\n\x08robot_id\x18\x03 \x01(\x05\"z\n\tOrderInfo\x12\x11\n\tsymbol_id\x18\x01 \x01(\x05\x12\x11\n\tdirection\x18\x02 \x01(\t\x12\x0f\n\x07\x61pi_key\x18\x03 \x01(\t\x12\x12\n\nsecret_key\x18\x04 \x01(\t\x12\x12\n\npassphrase\x18\x05 \x01(\t\x12\x0e\n\x06\x61mount\x18\x06 \x01(\x01\"]\n\x0f\x43heckEquityInfo\x12\x11\n\tsymbol_id\x18\x01 \x01(\x05\x12\x0f\n\x07\x61pi_key\x18\x02 \x01(\t\x12\x12\n\nsecret_key\x18\x03 \x01(\t\x12\x12\n\npassphrase\x18\x04 \x01(\t\"_\n\x11\x43heckPositionInfo\x12\x11\n\tsymbol_id\x18\x01 \x01(\x05\x12\x0f\n\x07\x61pi_key\x18\x02 \x01(\t\x12\x12\n\nsecret_key\x18\x03 \x01(\t\x12\x12\n\npassphrase\x18\x04 \x01(\t\"{\n\x16\x43heckBasisPositionInfo\x12\x13\n\x0bsymbol_id_1\x18\x01 \x01(\x05\x12\x13\n\x0bsymbol_id_2\x18\x02 \x01(\x05\x12\x0f\n\x07\x61pi_key\x18\x05 \x01(\t\x12\x12\n\nsecret_key\x18\x06 \x01(\t\x12\x12\n\npassphrase\x18\x07 \x01(\t\"\xc1\x01\n\x0eOrderBasisInfo\x12\x13\n\x0bsymbol_id_1\x18\x01 \x01(\x05\x12\x13\n\x0bsymbol_id_2\x18\x02 \x01(\x05\x12\x13\n\x0b\x64irection_1\x18\x03 \x01(\t\x12\x13\n\x0b\x64irection_2\x18\x04 \x01(\t\x12\x0f\n\x07\x61pi_key\x18\x05 \x01(\t\x12\x12\n\nsecret_key\x18\x06 \x01(\t\x12\x12\n\npassphrase\x18\x07 \x01(\t\x12\x10\n\x08\x61mount_1\x18\x08 \x01(\x01\x12\x10\n\x08\x61mount_2\x18\t \x01(\x01\":\n\x0e\x43heckBasisInfo\x12\x13\n\x0bsymbol_id_1\x18\x01 \x01(\x05\x12\x13\n\x0bsymbol_id_2\x18\x02 \x01(\x05\"\x84\x02\n\x0cTwoOrderInfo\x12\x13\n\x0bsymbol_id_1\x18\x01 \x01(\x05\x12\x13\n\x0bsymbol_id_2\x18\x02 \x01(\x05\x12\x13\n\x0b\x64irection_1\x18\x03 \x01(\t\x12\x13\n\x0b\x64irection_2\x18\x04 \x01(\t\x12\x11\n\tapi_key_1\x18\x05 \x01(\t\x12\x14\n\x0csecret_key_1\x18\x06 \x01(\t\x12\x14\n\x0cpassphrase_1\x18\x07 \x01(\t\x12\x11\n\tapi_key_2\x18\x08 \x01(\t\x12\x14\n\x0csecret_key_2\x18\t \x01(\t\x12\x14\n\x0cpassphrase_2\x18\n \x01(\t\x12\x10\n\x08\x61mount_1\x18\x0b \x01(\x01\x12\x10\n\x08\x61mount_2\x18\x0c \x01(\x01\"\xc3\x01\n\x19\x43heckTwoOrderPositionInfo\x12\x13\n\x0bsymbol_id_1\x18\x01 \x01(\x05\x12\x13\n\x0bsymbol_id_2\x18\x02 \x01(\x05\x12\x11\n\tapi_key_1\x18\x05 \x01(\t\x12\x14\n\x0csecret_key_1\x18\x06 \x01(\t\x12\x14\n\x0cpassphrase_1\x18\x07 \x01(\t\x12\x11\n\tapi_key_2\x18\x08 \x01(\t\x12\x14\n\x0csecret_key_2\x18\t \x01(\t\x12\x14\n\x0cpassphrase_2\x18\n \x01(\t\"@\n\x0bOrderResult\x12\x0c\n\x04\x63ode\x18\x01 \x01(\x05\x12#\n\x07results\x18\x02 \x03(\x0b\x32\x12.SymbolOrderResult\"v\n\x11SymbolOrderResult\x12\x11\n\tsymbol_id\x18\x01 \x01(\x05\x12\x0c\n\x04\x63ode\x18\x02 \x01(\x05\x12\x15\n\rtarget_amount\x18\x03 \x01(\x01\x12\x13\n\x0blong_amount\x18\x04 \x01(\x01\x12\x14\n\x0cshort_amount\x18\x05 \x01(\x01\"@\n\x13\x43heckPositionResult\x12\x13\n\x0blong_amount\x18\x01 \x01(\x01\x12\x14\n\x0cshort_amount\x18\x02 \x01(\x01\"x\n\x18\x43heckBasisPositionResult\x12\x15\n\rlong_amount_1\x18\x01 \x01(\x01\x12\x16\n\x0eshort_amount_1\x18\x02 \x01(\x01\x12\x15\n\rlong_amount_2\x18\x03 \x01(\x01\x12\x16\n\x0eshort_amount_2\x18\x04 \x01(\x01\"^\n\x10\x43heckBasisResult\x12\x0c\n\x04long\x18\x01 \x01(\x01\x12\r\n\x05short\x18\x02 \x01(\x01\x12\x15\n\rbest_long_qty\x18\x03 \x01(\x01\x12\x16\n\x0e\x62\x65st_short_qty\x18\x04 \x01(\x01\"D\n\x11\x43heckEquityResult\x12\x0e\n\x06\x65quity\x18\x01 \x01(\x01\x12\x11\n\tavailable\x18\x02 \x01(\x01\x12\x0c\n\x04\x63ont\x18\x03 \x01(\x01\"\xaf\x01\n\x1e\x43heckBasisPositionEquityResult\x12\x0e\n\x06\x65quity\x18\x01 \x01(\x01\x12\x11\n\tavailable\x18\x02 \x01(\x01\x12\x0c\n\x04\x63ont\x18\x03 \x01(\x01\x12\x15\n\rlong_amount_1\x18\x04 \x01(\x01\x12\x16\n\x0eshort_amount_1\x18\x05 \x01(\x01\x12\x15\n\rlong_amount_2\x18\x06 \x01(\x01\x12\x16\n\x0eshort_amount_2\x18\x07 \x01(\x01\x32\xbb\x05\n\tExecution\x12-\n\x0eTargetPosition\x12\x0b.TargetInfo\x1a\x0c.OrderResult\"\x00\x12-\n\x0e\x41\x64justPosition\x12\x0b.AdjustInfo\x1a\x0c.OrderResult\"\x00\x12#\n\x05Order\x12\n.OrderInfo\x1a\x0c.OrderResult\"\x00\x12\x35\n\x0b\x43heckEquity\x12\x10.CheckEquityInfo\x1a\x12.CheckEquityResult\"\x00\x12;\n\rCheckPosition\x12\x12.CheckPositionInfo\x1a\x14.CheckPositionResult\"\x00\x12\x32\n\nCheckBasis\x12\x0f.CheckBasisInfo\x1a\x11.CheckBasisResult\"\x00\x12-\n\nOrderBasis\x12\x0f.OrderBasisInfo\x1a\x0c.OrderResult\"\x00\x12J\n\x12\x43heckBasisPosition\x12\x17.CheckBasisPositionInfo\x1a\x19.CheckBasisPositionResult\"\x00\x12V\n\x18\x43heckBasisPositionEquity\x12\x17.CheckBasisPositionInfo\x1a\x1f.CheckBasisPositionEquityResult\"\x00\x12\x33\n\rMultipleOrder\x12\x12.MultipleOrderInfo\x1a\x0c.OrderResult\"\x00\x12)\n\x08TwoOrder\x12\r.TwoOrderInfo\x1a\x0c.OrderResult\"\x00\x12P\n\x15\x43heckTwoOrderPosition\x12\x1a.CheckTwoOrderPositionInfo\x1a\x19.CheckBasisPositionResult\"\x00\x62\x06proto3'
 )
 
 
@@ -770,6 +770,13 @@ _ORDERRESULT = _descriptor.Descriptor(
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
       serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='results', full_name='OrderResult.results', index=1,
+      number=2, type=11, cpp_type=10, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
   ],
   extensions=[
   ],
@@ -783,7 +790,67 @@ _ORDERRESULT = _descriptor.Descriptor(
   oneofs=[
   ],
   serialized_start=1528,
-  serialized_end=1555,
+  serialized_end=1592,
+)
+
+
+_SYMBOLORDERRESULT = _descriptor.Descriptor(
+  name='SymbolOrderResult',
+  full_name='SymbolOrderResult',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  create_key=_descriptor._internal_create_key,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='symbol_id', full_name='SymbolOrderResult.symbol_id', index=0,
+      number=1, type=5, cpp_type=1, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='code', full_name='SymbolOrderResult.code', index=1,
+      number=2, type=5, cpp_type=1, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='target_amount', full_name='SymbolOrderResult.target_amount', index=2,
+      number=3, type=1, cpp_type=5, label=1,
+      has_default_value=False, default_value=float(0),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='long_amount', full_name='SymbolOrderResult.long_amount', index=3,
+      number=4, type=1, cpp_type=5, label=1,
+      has_default_value=False, default_value=float(0),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='short_amount', full_name='SymbolOrderResult.short_amount', index=4,
+      number=5, type=1, cpp_type=5, label=1,
+      has_default_value=False, default_value=float(0),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  serialized_options=None,
+  is_extendable=False,
+  syntax='proto3',
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=1594,
+  serialized_end=1712,
 )
 
 
@@ -821,8 +888,8 @@ _CHECKPOSITIONRESULT = _descriptor.Descriptor(
   extension_ranges=[],
   oneofs=[
   ],
-  serialized_start=1557,
-  serialized_end=1621,
+  serialized_start=1714,
+  serialized_end=1778,
 )
 
 
@@ -874,8 +941,8 @@ _CHECKBASISPOSITIONRESULT = _descriptor.Descriptor(
   extension_ranges=[],
   oneofs=[
   ],
-  serialized_start=1623,
-  serialized_end=1743,
+  serialized_start=1780,
+  serialized_end=1900,
 )
 
 
@@ -927,8 +994,8 @@ _CHECKBASISRESULT = _descriptor.Descriptor(
   extension_ranges=[],
   oneofs=[
   ],
-  serialized_start=1745,
-  serialized_end=1839,
+  serialized_start=1902,
+  serialized_end=1996,
 )
 
 
@@ -973,8 +1040,8 @@ _CHECKEQUITYRESULT = _descriptor.Descriptor(
   extension_ranges=[],
   oneofs=[
   ],
-  serialized_start=1841,
-  serialized_end=1909,
+  serialized_start=1998,
+  serialized_end=2066,
 )
 
 
@@ -1047,10 +1114,11 @@ _CHECKBASISPOSITIONEQUITYRESULT = _descriptor.Descriptor(
   extension_ranges=[],
   oneofs=[
   ],
-  serialized_start=1912,
-  serialized_end=2087,
+  serialized_start=2069,
+  serialized_end=2244,
 )
 
+_ORDERRESULT.fields_by_name['results'].message_type = _SYMBOLORDERRESULT
 DESCRIPTOR.message_types_by_name['MultipleOrderInfo'] = _MULTIPLEORDERINFO
 DESCRIPTOR.message_types_by_name['TargetInfo'] = _TARGETINFO
 DESCRIPTOR.message_types_by_name['AdjustInfo'] = _ADJUSTINFO
@@ -1063,6 +1131,7 @@ DESCRIPTOR.message_types_by_name['CheckBasisInfo'] = _CHECKBASISINFO
 DESCRIPTOR.message_types_by_name['TwoOrderInfo'] = _TWOORDERINFO
 DESCRIPTOR.message_types_by_name['CheckTwoOrderPositionInfo'] = _CHECKTWOORDERPOSITIONINFO
 DESCRIPTOR.message_types_by_name['OrderResult'] = _ORDERRESULT
+DESCRIPTOR.message_types_by_name['SymbolOrderResult'] = _SYMBOLORDERRESULT
 DESCRIPTOR.message_types_by_name['CheckPositionResult'] = _CHECKPOSITIONRESULT
 DESCRIPTOR.message_types_by_name['CheckBasisPositionResult'] = _CHECKBASISPOSITIONRESULT
 DESCRIPTOR.message_types_by_name['CheckBasisResult'] = _CHECKBASISRESULT
@@ -1154,6 +1223,13 @@ OrderResult = _reflection.GeneratedProtocolMessageType('OrderResult', (_message.
   })
 _sym_db.RegisterMessage(OrderResult)
 
+SymbolOrderResult = _reflection.GeneratedProtocolMessageType('SymbolOrderResult', (_message.Message,), {
+  'DESCRIPTOR' : _SYMBOLORDERRESULT,
+  '__module__' : 'execution.execution_pb2'
+  # @@protoc_insertion_point(class_scope:SymbolOrderResult)
+  })
+_sym_db.RegisterMessage(SymbolOrderResult)
+
 CheckPositionResult = _reflection.GeneratedProtocolMessageType('CheckPositionResult', (_message.Message,), {
   'DESCRIPTOR' : _CHECKPOSITIONRESULT,
   '__module__' : 'execution.execution_pb2'
@@ -1198,8 +1274,8 @@ _EXECUTION = _descriptor.ServiceDescriptor(
   index=0,
   serialized_options=None,
   create_key=_descriptor._internal_create_key,
-  serialized_start=2090,
-  serialized_end=2789,
+  serialized_start=2247,
+  serialized_end=2946,
   methods=[
   _descriptor.MethodDescriptor(
     name='TargetPosition',
@@ -1,22 +1,27 @@
 import asyncio
+import threading
 import time
 from binascii import hexlify
 from concurrent import futures
 from datetime import datetime
 from math import ceil
 from os import urandom
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 import grpc
 import numpy as np
 
 from api.base_api import OrderType, Direction, BaseApi
-from api.exchange import SimpleExchangeAPI, ExchangeAPI
+from api.binance.binance_api import BinanceApi
+from api.exchange import ExchangeAPI
 from base.consts import ExecutionConfig, WeComAgent, WeComPartment
 from base.config import execution_logger as logger
 from db.cache import RedisHelper
-from db.model import SymbolModel
+from db.symbol_registry import symbol_registry
 from execution import execution_pb2, execution_pb2_grpc
+from execution.client_registry import ExchangeClientRegistry
+from execution.order_tracker import OrderTracker, OrderTrackerManager
+from util.async_request_util import SessionManager
 from util.wecom_message_util import WeComMessage
 
 
@@ -30,19 +35,88 @@ class ExecutionServicer(execution_pb2_grpc.ExecutionServicer):
 
     def __init__(self):
         logger.info("初始化交易执行服务")
-        self.all_symbol = {symbol.id: symbol.symbol for symbol in SymbolModel.get_all_data()}
-        self.all_symbol_info: Dict[str:SymbolModel] = {symbol.id: symbol for symbol in SymbolModel.get_all_data()}
+        # 加载交易对缓存, 之后的查询都通过symbol_registry, 服务运行期间新增的交易对也能找到
+        symbol_registry.all()
+        self.clients = ExchangeClientRegistry()
+        # 只有grpc.aio模式才跟踪用户数据流
+        self.trackers: Optional[OrderTrackerManager] = None
+        # 线程池模式下所有请求都交给同一个常驻的事件循环执行,这样才能共用http session的连接池
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.loop_lock = threading.Lock()
         logger.info("初始化交易执行服务成功!")
 
+    def run(self, coroutine):
+        """线程池模式下在常驻的事件循环里执行请求,阻塞当前线程直到得到结果
+
+        每个请求都用asyncio.run的话,每次都是新的事件循环和新的session,每一单都要重新做TCP/TLS/代理握手。
+        """
+        with self.loop_lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                self.loop.set_exception_handler(exception_handler)
+                threading.Thread(target=self.loop.run_forever, name="execution-loop", daemon=True).start()
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def stop_loop(self, timeout: float = 5):
+        """关闭常驻事件循环的session并停止事件循环"""
+        with self.loop_lock:
+            loop, self.loop = self.loop, None
+        if loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(SessionManager.close(), loop).result(timeout)
+        except Exception as e:
+            logger.error(f"关闭http session失败:{e}")
+        loop.call_soon_threadsafe(loop.stop)
+
+    def get_client(self, api_key: str, secret_key: str, passphrase: str, symbol_id: int) -> BaseApi:
+        """从缓存里获取交易所客户端,同一个账户同一个交易对的请求复用同一个客户端"""
+        return self.clients.get(api_key=api_key, secret_key=secret_key, passphrase=passphrase, symbol=symbol_registry.get_by_id(symbol_id))
+
+    def get_tracker(self, api: BaseApi) -> Optional[OrderTracker]:
+        if self.trackers is None or api.EXCHANGE != BinanceApi.EXCHANGE:
+            return None
+        return self.trackers.get(api)
+
+    async def wait_fill(self, api: BaseApi, client_oid: str) -> Optional[dict]:
+        """通过用户数据流等待订单结束和成交之后的持仓
+
+        Returns:
+            订单信息,包括成交均价price_avg和成交之后的多仓long和空仓short,没有收到推送返回None,需要改用REST查询
+        """
+        tracker = self.get_tracker(api)
+        if not tracker:
+            return None
+        order = await tracker.wait_order(client_oid)
+        if not order:
+            return None
+        if api.symbol.market_type == BinanceApi.MarketType.SPOT:
+            position = await tracker.wait_position(api.symbol.base_coin.upper(), since=order["timestamp"])
+        else:
+            position = await tracker.wait_position(api.symbol.symbol.upper(), since=order["timestamp"])
+        if not position:
+            return None
+        order["long"], order["short"] = position
+        if api.symbol.market_type == BinanceApi.MarketType.COIN_FUTURE:
+            order["long"], order["short"] = int(order["long"]), int(order["short"])
+        return order
+
+    async def get_filled_position(self, api: BaseApi, client_oid: str) -> (float, float, str):
+        """下单之后的持仓,优先用用户数据流的推送,超时再查REST"""
+        fill = await self.wait_fill(api, client_oid)
+        if fill:
+            return fill["long"], fill["short"], datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+        return await api.get_symbol_position_short_long()
+
     # ========inner class method(TODO : move into mixin)  =====
     @staticmethod
     async def notify(message: str):
         wc = WeComMessage(msg=message, agent=WeComAgent.order, toparty=[WeComPartment.partner])
         await wc.send_markdowm()
 
-    async def create_order(self, api_key: str, secret_key: str, passphrase: str, symbol_id: int, amount: float, direction: str):
-        client_oid = hexlify(urandom(16)).decode('utf-8')
-        api = SimpleExchangeAPI(exchange=self.all_symbol_info[symbol_id].exchange, api_key=api_key, secret_key=secret_key, passphrase=passphrase, symbol=self.all_symbol_info[symbol_id])
+    async def create_order(self, api_key: str, secret_key: str, passphrase: str, symbol_id: int, amount: float, direction: str, client_oid: str = None):
+        client_oid = client_oid or hexlify(urandom(16)).decode('utf-8')
+        api = self.get_client(api_key=api_key, secret_key=secret_key, passphrase=passphrase, symbol_id=symbol_id)
         loop = asyncio.get_event_loop()
         loop.set_exception_handler(exception_handler)
         response = await api.create_order(client_oid=client_oid, amount=amount, price=None, order_type=OrderType.MARKET, direction=direction)
@@ -52,7 +126,7 @@ class ExecutionServicer(execution_pb2_grpc.ExecutionServicer):
         """查询某个symbol的持仓
         """
         logger.info(f"查询某个symbol的持仓{symbol_id}")
-        api = SimpleExchangeAPI(exchange=self.all_symbol_info[symbol_id].exchange, api_key=api_key, secret_key=secret_key, passphrase=passphrase, symbol=self.all_symbol_info[symbol_id])
+        api = self.get_client(api_key=api_key, secret_key=secret_key, passphrase=passphrase, symbol_id=symbol_id)
         long_amount, short_amount, _ = await api.get_symbol_position_short_long()
         return long_amount, short_amount
 
@@ -68,6 +142,107 @@ class ExecutionServicer(execution_pb2_grpc.ExecutionServicer):
         else:
             return 0
 
+    def get_snapshot_position(self, snapshot: Dict[str, dict], symbol_id: int) -> (float, float):
+        """从账户的持仓快照里取出某个symbol的多仓和空仓数量,和get_symbol_position的解析方式一致"""
+        symbol = symbol_registry.get_by_id(symbol_id)
+        if symbol.market_type == BinanceApi.MarketType.SPOT:
+            positions = snapshot[symbol.market_type].get(symbol.base_coin.upper(), [])
+        else:
+            positions = snapshot[symbol.market_type].get(symbol.symbol.upper(), [])
+        long_amount, short_amount = 0, 0
+        for position in positions:
+            amount = int(position["amount"]) if symbol.market_type == BinanceApi.MarketType.COIN_FUTURE else position["amount"]
+            if position.get("direction") == "long":
+                long_amount = amount
+            if position.get("direction") == "short":
+                short_amount = amount
+        return long_amount, short_amount
+
+    async def get_account_snapshot(self, clients: Dict[int, BaseApi]) -> Dict[str, dict]:
+        """一个账户每个市场只查一次全部持仓"""
+        market_clients = {}
+        for client in clients.values():
+            market_clients.setdefault(client.symbol.market_type, client)
+        positions = await asyncio.gather(*[client.get_all_position(market_type, to_redis=False) for market_type, client in market_clients.items()])
+        return dict(zip(market_clients.keys(), positions))
+
+    async def rebalance_symbol(self, client: BaseApi, symbol_id: int, long_amount: float, short_amount: float, target_amount: float) -> bool:
+        """根据快照里的仓位对一个symbol下单,返回是否下了单(下了单就要等下一次快照核对)"""
+        if target_amount > 0 and short_amount > 0:
+            await client.create_order(amount=short_amount, price=None, order_type=OrderType.MARKET, direction=Direction.CLOSE_SHORT)
+        elif target_amount < 0 and long_amount > 0:
+            await client.create_order(amount=long_amount, price=None, order_type=OrderType.MARKET, direction=Direction.CLOSE_LONG)
+        diff, direction, _ = await self.target_current_diff(current_amount_long=long_amount, current_amount_short=short_amount, current_time=None, target_amount=target_amount)
+        if not diff or not direction:
+            return False
+        logger.info(f"开始下单,diff:{diff},方向:{direction},目标数量:{target_amount},symbol_id:{symbol_id}")
+        await client.create_order(amount=abs(diff), price=None, order_type=OrderType.MARKET, direction=direction)
+        return True
+
+    async def rebalance(self, api_key: str, secret_key: str, passphrase: str, symbol_ids: List[int], target_amounts: List[float]) -> execution_pb2.OrderResult:
+        """批量调整多个symbol到目标仓位
+
+        1. 每个市场查一次账户的全部持仓,计算每个symbol需要下单的数量
+        2. 所有symbol同时下单
+        3. 下单之后再查一次全部持仓核对,没有完成的symbol继续下单,直到超过最长交易时间
+
+        只有币安支持一次查询全部持仓,其他交易所的symbol还是逐个调用target_amount
+
+        Returns:
+            OrderResult, code=1全部成功,code=2部分成功,code=0全部失败, results里是每个symbol的结果
+        """
+        targets = dict(zip(symbol_ids, target_amounts))
+        clients = {symbol_id: self.get_client(api_key=api_key, secret_key=secret_key, passphrase=passphrase, symbol_id=symbol_id) for symbol_id in targets}
+        batch_clients = {symbol_id: client for symbol_id, client in clients.items() if client.EXCHANGE == BinanceApi.EXCHANGE}
+        other_ids = [symbol_id for symbol_id in targets if symbol_id not in batch_clients]
+
+        other_task = asyncio.gather(*[
+            self.target_amount(api_key=api_key, secret_key=secret_key, passphrase=passphrase, symbol_id=symbol_id, target_amount=targets[symbol_id])
+            for symbol_id in other_ids
+        ])
+
+        results: Dict[int, execution_pb2.SymbolOrderResult] = {}
+        pending = dict(batch_clients)
+        start_time = time.monotonic()
+        while pending:
+            try:
+                snapshot = await self.get_account_snapshot(pending)
+            except Exception as e:
+                logger.error(f"批量下单查询持仓失败:{e}", stack_info=True)
+                break
+            positions = {symbol_id: self.get_snapshot_position(snapshot, symbol_id) for symbol_id in pending}
+            for symbol_id, (long_amount, short_amount) in positions.items():
+                results[symbol_id] = execution_pb2.SymbolOrderResult(symbol_id=symbol_id, code=0, target_amount=targets[symbol_id], long_amount=long_amount, short_amount=short_amount)
+
+            if time.monotonic() - start_time >= ExecutionConfig.MAX_TRADING_DURATION:
+                break
+
+            need_orders = await asyncio.gather(*[
+                self.rebalance_symbol(client=client, symbol_id=symbol_id, long_amount=positions[symbol_id][0], short_amount=positions[symbol_id][1], target_amount=targets[symbol_id])
+                for symbol_id, client in pending.items()
+            ], return_exceptions=True)
+            for symbol_id, need_order in zip(list(pending), need_orders):
+                if isinstance(need_order, Exception):
+                    logger.error(f"批量下单失败,symbol_id:{symbol_id}:{need_order}")
+                    pending.pop(symbol_id)
+                elif not need_order:
+                    results[symbol_id].code = 1
+                    pending.pop(symbol_id)
+
+        for symbol_id in batch_clients:
+            results.setdefault(symbol_id, execution_pb2.SymbolOrderResult(symbol_id=symbol_id, code=0, target_amount=targets[symbol_id]))
+        for symbol_id, result in zip(other_ids, await other_task):
+            results[symbol_id] = execution_pb2.SymbolOrderResult(symbol_id=symbol_id, code=result.code, target_amount=targets[symbol_id])
+
+        success = sum(result.code for result in results.values())
+        if success == len(targets):
+            code = 1
+        elif success > 0:
+            code = 2
+        else:
+            code = 0
+        return execution_pb2.OrderResult(code=code, results=[results[symbol_id] for symbol_id in targets])
+
     async def create_two_order(self, api_key_1: str, secret_key_1: str, passphrase_1: str, api_key_2: str, secret_key_2: str, passphrase_2: str, symbol_id_1: int, symbol_id_2: int, direction_1: str, direction_2: str,
                                amount_1: float, amount_2: float):
         await asyncio.wait([self.create_order(api_key=api_key_1, secret_key=secret_key_1, passphrase=passphrase_1, symbol_id=symbol_id_1, amount=amount_1, direction=direction_1),
@@ -119,9 +294,9 @@ class ExecutionServicer(execution_pb2_grpc.ExecutionServicer):
         await asyncio.wait([self.create_order(api_key=api_key, secret_key=secret_key, passphrase=passphrase, symbol_id=symbol_id_1, amount=amount_1, direction=direction_1),
                             self.create_order(api_key=api_key, secret_key=secret_key, passphrase=passphrase, symbol_id=symbol_id_2, amount=amount_2, direction=direction_2),
                             self.notify(
-                                message=f"<font color=\"warning\">{self.all_symbol_info[symbol_id_1].exchange}</font>\n"
-                                        f"<font color=\"warning\">{self.all_symbol_info[symbol_id_1].symbol}-{direction_1}-{amount_1}</font>\n"
-                                        f"<font color=\"warning\">{self.all_symbol_info[symbol_id_2].symbol}-{direction_2}-{amount_2}</font>"
+                                message=f"<font color=\"warning\">{symbol_registry.get_by_id(symbol_id_1).exchange}</font>\n"
+                                        f"<font color=\"warning\">{symbol_registry.get_by_id(symbol_id_1).symbol}-{direction_1}-{amount_1}</font>\n"
+                                        f"<font color=\"warning\">{symbol_registry.get_by_id(symbol_id_2).symbol}-{direction_2}-{amount_2}</font>"
                             )])
 
     async def check_basis_position(self, api_key: str, secret_key: str, passphrase: str, symbol_id_1: int, symbol_id_2: int) -> (int, int, int, int):
@@ -134,7 +309,7 @@ class ExecutionServicer(execution_pb2_grpc.ExecutionServicer):
         return symbol_long_1, symbol_short_1, symbol_long_2, symbol_short_2
 
     async def check_equity(self, api_key: str, secret_key: str, passphrase: str, symbol_id: int) -> (float, float, int):
-        api = SimpleExchangeAPI(exchange=self.all_symbol_info[symbol_id].exchange, api_key=api_key, secret_key=secret_key, passphrase=passphrase, symbol=self.all_symbol_info[symbol_id])
+        api = self.get_client(api_key=api_key, secret_key=secret_key, passphrase=passphrase, symbol_id=symbol_id)
         task = api.get_symbol_balance()
         response = await task
         return response
@@ -257,7 +432,9 @@ class ExecutionServicer(execution_pb2_grpc.ExecutionServicer):
         """
         try:
             # 生成用于交易的API
-            api: BaseApi = SimpleExchangeAPI(exchange=self.all_symbol_info[symbol_id].exchange, api_key=api_key, secret_key=secret_key, passphrase=passphrase, symbol=self.all_symbol_info[symbol_id])
+            api: BaseApi = self.get_client(api_key=api_key, secret_key=secret_key, passphrase=passphrase, symbol_id=symbol_id)
+            # 先订阅用户数据流,下单的时候就能收到推送
+            self.get_tracker(api)
 
             current_amount_long, current_amount_short, current_time = await api.get_symbol_position_short_long()
 
@@ -279,9 +456,10 @@ class ExecutionServicer(execution_pb2_grpc.ExecutionServicer):
             while abs(diff) > 0 and trading_duration < ExecutionConfig.MAX_TRADING_DURATION:
                 logger.info(f"开始下单,diff:{diff},方向:{direction},目标数量:{target_amount},symbol_id:{symbol_id}")
                 # 下单
-                await self.create_order(api_key=api_key, secret_key=secret_key, passphrase=passphrase, symbol_id=symbol_id, amount=abs(diff), direction=direction)
-                # 下单之后查询仓位
-                current_amount_long, current_amount_short, current_time = await api.get_symbol_position_short_long()
+                client_oid = hexlify(urandom(16)).decode('utf-8')
+                await self.create_order(api_key=api_key, secret_key=secret_key, passphrase=passphrase, symbol_id=symbol_id, amount=abs(diff), direction=direction, client_oid=client_oid)
+                # 下单之后的仓位
+                current_amount_long, current_amount_short, current_time = await self.get_filled_position(api, client_oid)
                 # 检查交易是否需要执行
                 diff, direction, current_time = await self.target_current_diff(current_amount_long=current_amount_long, current_amount_short=current_amount_short, current_time=current_time, target_amount=target_amount)
                 # 计算交易到目前的用时
@@ -295,7 +473,8 @@ class ExecutionServicer(execution_pb2_grpc.ExecutionServicer):
     async def target_position(self, api_key: str, secret_key: str, passphrase: str, symbol_id: int, direction: str, percent: float):
         try:
             # 计算目标张数
-            api = SimpleExchangeAPI(exchange=self.all_symbol_info[symbol_id].exchange, api_key=api_key, secret_key=secret_key, passphrase=passphrase, symbol=self.all_symbol_info[symbol_id])
+            api = self.get_client(api_key=api_key, secret_key=secret_key, passphrase=passphrase, symbol_id=symbol_id)
+            self.get_tracker(api)
             target_amount = ceil((await api.get_symbol_balance())["cont"] * percent)
 
             # 检查交易是否不需要执行
@@ -307,7 +486,7 @@ class ExecutionServicer(execution_pb2_grpc.ExecutionServicer):
 
             # 记录开始时的价格
             redis = RedisHelper()
-            symbol = self.all_symbol_info[symbol_id]
+            symbol = symbol_registry.get_by_id(symbol_id)
             start_price, market_size, start_time = self.get_latest_price(redis=redis, exchange=symbol.exchange, market_type=symbol.market_type, symbol_name=symbol.symbol, direction=direction)
 
             cooldown = False
@@ -318,7 +497,7 @@ class ExecutionServicer(execution_pb2_grpc.ExecutionServicer):
 
             while trading_duration < ExecutionConfig.MAX_TRADING_DURATION and not trading_finished:
                 if cooldown:
-                    time.sleep(ExecutionConfig.COOLDOWN_TIME)
+                    await asyncio.sleep(ExecutionConfig.COOLDOWN_TIME)
                     current_price, market_size, current_time = self.get_latest_price(redis=redis, exchange=symbol.exchange, market_type=symbol.market_type, symbol_name=symbol.symbol, direction=direction)
                     # 检查价格是否过高或者过低
                     cooldown = self.check_cooldown(start_price=start_price, current_price=current_price, direction=direction)
@@ -340,9 +519,16 @@ class ExecutionServicer(execution_pb2_grpc.ExecutionServicer):
                     order_amount = market_size
 
                 # TODO: 用立即成交取消剩余来替换市价单
-                response = await self.create_order(api_key=api_key, secret_key=secret_key, passphrase=passphrase, symbol_id=symbol_id, amount=order_amount, direction=direction)
-                current_price = (await api.get_order_info(response["order_id"]))["price_avg"]
-                current_amount_long, current_amount_short, current_time = await api.get_symbol_position_short_long()
+                client_oid = hexlify(urandom(16)).decode('utf-8')
+                response = await self.create_order(api_key=api_key, secret_key=secret_key, passphrase=passphrase, symbol_id=symbol_id, amount=order_amount, direction=direction, client_oid=client_oid)
+                fill = await self.wait_fill(api, client_oid)
+                if fill:
+                    current_price = fill["price_avg"]
+                    current_amount_long, current_amount_short = fill["long"], fill["short"]
+                    current_time = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+                else:
+                    current_price = (await api.get_order_info(response["order_id"]))["price_avg"]
+                    current_amount_long, current_amount_short, current_time = await api.get_symbol_position_short_long()
 
                 # 计算交易到目前的用时
                 current_time = datetime.strptime(current_time, "%Y-%m-%dT%H:%M:%S.%fZ")
@@ -365,41 +551,40 @@ class ExecutionServicer(execution_pb2_grpc.ExecutionServicer):
 
     # ==================== gRPC API 基差相关的接口 ============
 
-    def OrderBasis(self, request, context):
+    async def _OrderBasis(self, request, context):
         try:
             logger.info(f"双向下单{request.symbol_id_1}-{request.direction_1}-{request.amount_1}-{request.symbol_id_2}-{request.direction_2}-{request.amount_2}-{request.api_key}-{request.secret_key}-{request.passphrase}")
-            asyncio.run(
-                self.create_basis_order(
-                    api_key=request.api_key,
-                    secret_key=request.secret_key,
-                    passphrase=request.passphrase,
-                    symbol_id_1=request.symbol_id_1,
-                    symbol_id_2=request.symbol_id_2,
-                    amount_1=request.amount_1,
-                    amount_2=request.amount_2,
-                    direction_1=request.direction_1,
-                    direction_2=request.direction_2
-                )
+            await self.create_basis_order(
+                api_key=request.api_key,
+                secret_key=request.secret_key,
+                passphrase=request.passphrase,
+                symbol_id_1=request.symbol_id_1,
+                symbol_id_2=request.symbol_id_2,
+                amount_1=request.amount_1,
+                amount_2=request.amount_2,
+                direction_1=request.direction_1,
+                direction_2=request.direction_2
             )
             return execution_pb2.OrderResult(code=1)
         except Exception as e:
             logger.error(f"基差下单失败:{e}", stack_info=True)
             return execution_pb2.OrderResult(code=0)
 
-    def CheckBasisPosition(self, request, context):
+    async def _CheckBasisPosition(self, request, context):
         try:
-            long_1, short_1, long_2, short_2 = asyncio.run(self.check_basis_position(api_key=request.api_key, secret_key=request.secret_key, passphrase=request.passphrase,
-                                                                                     symbol_id_1=request.symbol_id_1, symbol_id_2=request.symbol_id_2))
+            long_1, short_1, long_2, short_2 = await self.check_basis_position(api_key=request.api_key, secret_key=request.secret_key, passphrase=request.passphrase,
+                                                                                     symbol_id_1=request.symbol_id_1, symbol_id_2=request.symbol_id_2)
             # TODO:check type str exception
             return execution_pb2.CheckBasisPositionResult(long_amount_1=int(long_1), short_amount_1=int(short_1), long_amount_2=int(long_2), short_amount_2=int(short_2))
         except Exception as e:
             logger.error(f"查询基差仓位失败:{e}", stack_info=True)
 
-    def CheckBasis(self, request, context):
+    def _CheckBasis(self, request, context):
+        """只读redis,不需要事件循环"""
         try:
             logger.info(f"check basis of {request.symbol_id_1}-{request.symbol_id_2}")
-            symbol_1 = self.all_symbol[request.symbol_id_1]
-            symbol_2 = self.all_symbol[request.symbol_id_2]
+            symbol_1 = symbol_registry.get_by_id(request.symbol_id_1).symbol
+            symbol_2 = symbol_registry.get_by_id(request.symbol_id_2).symbol
             hash_key = "OKEX:BASIS"
             basis_key = f"{symbol_1}:{symbol_2}"
             redis = RedisHelper()
@@ -423,101 +608,206 @@ class ExecutionServicer(execution_pb2_grpc.ExecutionServicer):
         except Exception as e:
             logger.error(f"查询基差行情失败:{e}", stack_info=True)
 
-    def CheckBasisPositionEquity(self, request, context):
+    async def _CheckBasisPositionEquity(self, request, context):
         try:
             logger.info("查询当前持仓和余额/权益/可开张数")
-            equity, available, cont, long_1, short_1, long_2, short_2 = asyncio.run(self.check_basis_position_equity(api_key=request.api_key, secret_key=request.secret_key, passphrase=request.passphrase,
-                                                                                                                     symbol_id_1=request.symbol_id_1, symbol_id_2=request.symbol_id_2))
+            equity, available, cont, long_1, short_1, long_2, short_2 = await self.check_basis_position_equity(api_key=request.api_key, secret_key=request.secret_key, passphrase=request.passphrase,
+                                                                                                                     symbol_id_1=request.symbol_id_1, symbol_id_2=request.symbol_id_2)
             return execution_pb2.CheckBasisPositionEquityResult(equity=equity, available=available, cont=cont, long_amount_1=long_1, short_amount_1=short_1, long_amount_2=long_2, short_amount_2=short_2)
         except Exception as e:
             logger.error(f"查询当前持仓和余额/权益/可开张数失败:{e}", stack_info=True)
 
     # ==================== gRPC API K线策略相关的接口 ============
-    def MultipleOrder(self, request, context):
+    async def _MultipleOrder(self, request, context):
         """同时对多个仓位多个方向下单
         """
         logger.info(f"多个仓位下单 symbol_ids:{request.symbol_ids}-amounts:{request.target_amounts}")
         try:
-            result_code = asyncio.run(self.create_multiple_orders(symbol_ids=request.symbol_ids, target_amounts=request.target_amounts, api_key=request.api_key, secret_key=request.secret_key, passphrase=request.passphrase))
-            return execution_pb2.OrderResult(code=result_code)
+            result = await self.rebalance(symbol_ids=request.symbol_ids, target_amounts=request.target_amounts, api_key=request.api_key, secret_key=request.secret_key, passphrase=request.passphrase)
+            logger.info(f"多个仓位下单结果:{[(r.symbol_id, r.code) for r in result.results]}")
+            return result
         except Exception as e:
             logger.error(f"多个仓位下单失败{e}", stack_info=True)
             return execution_pb2.OrderResult(code=0)
 
-    def TargetPosition(self, request, context):
+    async def _TargetPosition(self, request, context):
         try:
             logger.info("下单" + str(request.target_percent) + "____" + str(request.direction))
-            asyncio.run(
-                self.target_position(api_key=request.api_key, secret_key=request.secret_key, passphrase=request.passphrase, symbol_id=request.symbol_id, direction=request.direction, percent=round(request.target_percent, 2)))
+            await self.target_position(api_key=request.api_key, secret_key=request.secret_key, passphrase=request.passphrase, symbol_id=request.symbol_id, direction=request.direction, percent=round(request.target_percent, 2))
             return execution_pb2.OrderResult(code=1)
         except Exception as e:
             logger.error(f"设置仓位为某个值失败:{e}", stack_info=True)
             return execution_pb2.OrderResult(code=0)
 
-    def CheckPosition(self, request, context) -> execution_pb2.CheckPositionResult:
+    async def _CheckPosition(self, request, context) -> execution_pb2.CheckPositionResult:
         try:
             logger.info(f"查询symbol_id:{request.symbol_id} 的仓位")
-            long, short = asyncio.run(self.check_position(api_key=request.api_key, secret_key=request.secret_key, passphrase=request.passphrase, symbol_id=request.symbol_id))
+            long, short = await self.check_position(api_key=request.api_key, secret_key=request.secret_key, passphrase=request.passphrase, symbol_id=request.symbol_id)
             logger.info(f"查询symbol_id:{request.symbol_id} 的仓位: {long} - {short}")
             return execution_pb2.CheckPositionResult(long_amount=long, short_amount=short)
         except Exception as e:
             logger.error(f"查询仓位失败:{e}", stack_info=True)
 
-    def CheckEquity(self, request, context):
+    async def _CheckEquity(self, request, context):
         try:
             logger.info("查询余额/权益/可开张数")
-            response = asyncio.run(self.check_equity(api_key=request.api_key, secret_key=request.secret_key, passphrase=request.passphrase, symbol_id=request.symbol_id))
+            response = await self.check_equity(api_key=request.api_key, secret_key=request.secret_key, passphrase=request.passphrase, symbol_id=request.symbol_id)
             r = execution_pb2.CheckEquityResult(equity=response["equity"], available=response["available"], cont=response["cont"])
             return r
         except Exception as e:
             logger.error(f"查询余额/权益/可开张数失败:{e}", stack_info=True)
 
-    def Order(self, request, context):
+    async def _Order(self, request, context):
         try:
-            logger.info(f"按数量下单{self.all_symbol[request.symbol_id]}-{request.direction}-{request.amount}")
-            asyncio.run(self.create_order(api_key=request.api_key, secret_key=request.secret_key, passphrase=request.passphrase, symbol_id=request.symbol_id, amount=request.amount, direction=request.direction))
+            logger.info(f"按数量下单{symbol_registry.get_by_id(request.symbol_id).symbol}-{request.direction}-{request.amount}")
+            await self.create_order(api_key=request.api_key, secret_key=request.secret_key, passphrase=request.passphrase, symbol_id=request.symbol_id, amount=request.amount, direction=request.direction)
             return execution_pb2.OrderResult(code=1)
         except Exception as e:
             logger.error(f"下单失败:{e}", stack_info=True)
             return execution_pb2.OrderResult(code=0)
 
-    def TwoOrder(self, request, context):
+    async def _TwoOrder(self, request, context):
         try:
             logger.info(f"同时对两个交易对下单,Symbol1:{request.symbol_id_1}-{request.direction_1}-{request.amount_1}-Symbol2:{request.symbol_id_2}-{request.direction_2}-{request.amount_2}")
-            asyncio.run(self.create_two_order(
+            await self.create_two_order(
                 api_key_1=request.api_key_1, secret_key_1=request.secret_key_1, passphrase_1=request.passphrase_1, symbol_id_1=request.symbol_id_1, direction_1=request.direction_1,
                 api_key_2=request.api_key_2, secret_key_2=request.secret_key_2, passphrase_2=request.passphrase_2, symbol_id_2=request.symbol_id_2, direction_2=request.direction_2,
                 amount_1=request.amount_1,
                 amount_2=request.amount_2
             )
-            )
             return execution_pb2.OrderResult(code=1)
         except Exception as e:
             logger.error(f"双向下单失败:{e}", stack_info=True)
             return execution_pb2.OrderResult(code=0)
 
-    def CheckTwoOrderPosition(self, request, context):
+    async def _CheckTwoOrderPosition(self, request, context):
         try:
-            long_1, short_1, long_2, short_2 = asyncio.run(self.check_two_order_position(
+            long_1, short_1, long_2, short_2 = await self.check_two_order_position(
                 api_key_1=request.api_key_1, secret_key_1=request.secret_key_1, passphrase_1=request.passphrase_1, symbol_id_1=request.symbol_id_1,
                 api_key_2=request.api_key_2, secret_key_2=request.secret_key_2, passphrase_2=request.passphrase_2, symbol_id_2=request.symbol_id_2,
-            ))
+            )
             # TODO:check type str exception
             return execution_pb2.CheckBasisPositionResult(long_amount_1=int(long_1), short_amount_1=int(short_1), long_amount_2=int(long_2), short_amount_2=int(short_2))
         except Exception as e:
             logger.error(f"两个交易所下单失败:{e}", stack_info=True)
             return execution_pb2.OrderResult(code=0)
 
+    # ==================== gRPC 线程池模式的接口,请求都在常驻的事件循环里执行 ============
+
+    def OrderBasis(self, request, context):
+        return self.run(self._OrderBasis(request, context))
+
+    def CheckBasisPosition(self, request, context):
+        return self.run(self._CheckBasisPosition(request, context))
 
-def serve():
+    def CheckBasis(self, request, context):
+        return self._CheckBasis(request, context)
+
+    def CheckBasisPositionEquity(self, request, context):
+        return self.run(self._CheckBasisPositionEquity(request, context))
+
+    def MultipleOrder(self, request, context):
+        return self.run(self._MultipleOrder(request, context))
+
+    def TargetPosition(self, request, context):
+        return self.run(self._TargetPosition(request, context))
+
+    def CheckPosition(self, request, context):
+        return self.run(self._CheckPosition(request, context))
+
+    def CheckEquity(self, request, context):
+        return self.run(self._CheckEquity(request, context))
+
+    def Order(self, request, context):
+        return self.run(self._Order(request, context))
+
+    def TwoOrder(self, request, context):
+        return self.run(self._TwoOrder(request, context))
+
+    def CheckTwoOrderPosition(self, request, context):
+        return self.run(self._CheckTwoOrderPosition(request, context))
+
+
+class AsyncExecutionServicer(ExecutionServicer):
+    """grpc.aio模式的交易执行服务
+
+    所有请求都作为协程跑在同一个常驻的事件循环里,共用http session和symbol信息,
+    并发数不再受线程池大小限制。
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.trackers = OrderTrackerManager()
+
+    async def OrderBasis(self, request, context):
+        return await self._OrderBasis(request, context)
+
+    async def CheckBasisPosition(self, request, context):
+        return await self._CheckBasisPosition(request, context)
+
+    async def CheckBasis(self, request, context):
+        return self._CheckBasis(request, context)
+
+    async def CheckBasisPositionEquity(self, request, context):
+        return await self._CheckBasisPositionEquity(request, context)
+
+    async def MultipleOrder(self, request, context):
+        return await self._MultipleOrder(request, context)
+
+    async def TargetPosition(self, request, context):
+        return await self._TargetPosition(request, context)
+
+    async def CheckPosition(self, request, context):
+        return await self._CheckPosition(request, context)
+
+    async def CheckEquity(self, request, context):
+        return await self._CheckEquity(request, context)
+
+    async def Order(self, request, context):
+        return await self._Order(request, context)
+
+    async def TwoOrder(self, request, context):
+        return await self._TwoOrder(request, context)
+
+    async def CheckTwoOrderPosition(self, request, context):
+        return await self._CheckTwoOrderPosition(request, context)
+
+
+def serve(aio: bool = ExecutionConfig.AIO):
+    if aio:
+        asyncio.run(serve_async())
+        return
     logger.info("启动交易执行服务")
     server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
-    execution_pb2_grpc.add_ExecutionServicer_to_server(
-        ExecutionServicer(), server)
+    servicer = ExecutionServicer()
+    execution_pb2_grpc.add_ExecutionServicer_to_server(servicer, server)
     server.add_insecure_port(f"[::]:{ExecutionConfig.PORT}")
     server.start()
-    server.wait_for_termination()
     logger.info("启动交易执行服务成功!")
+    try:
+        server.wait_for_termination()
+    finally:
+        logger.info(f"交易所客户端缓存:{servicer.clients.metrics()}")
+        servicer.stop_loop()
+        SessionManager.close_all()
+
+
+async def serve_async():
+    logger.info("启动交易执行服务(grpc.aio)")
+    asyncio.get_event_loop().set_exception_handler(exception_handler)
+    server = grpc.aio.server(maximum_concurrent_rpcs=ExecutionConfig.MAX_CONCURRENT_RPCS)
+    servicer = AsyncExecutionServicer()
+    execution_pb2_grpc.add_ExecutionServicer_to_server(servicer, server)
+    server.add_insecure_port(f"[::]:{ExecutionConfig.PORT}")
+    await server.start()
+    logger.info("启动交易执行服务成功!")
+    try:
+        await server.wait_for_termination()
+    finally:
+        await server.stop(None)
+        await servicer.trackers.close()
+        logger.info(f"交易所客户端缓存:{servicer.clients.metrics()}")
+        await SessionManager.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,175 @@
+import asyncio
+import json
+from typing import Dict, Optional, Tuple
+
+import websockets
+
+from api.binance.binance_api import BinanceApi
+from base.config import execution_logger as logger
+from base.consts import ExecutionConfig
+
+# 订单结束的状态,之后不会再有成交
+FINAL_ORDER_STATUS = {"FILLED", "CANCELED", "EXPIRED", "REJECTED"}
+# 最多保留的订单数量,别的程序下的单没人取走,超过之后删掉最早的
+MAX_ORDERS = 1000
+
+
+class OrderTracker(object):
+    """通过币安用户数据流跟踪一个账户在一个市场上的订单成交和持仓
+
+    订单和持仓都保存在内存里,下单之后等待订单结束和持仓推送即可,不需要轮询REST接口。
+    websocket没连上或者等待超时的时候返回None,由调用方改用REST查询。
+    """
+
+    def __init__(self, client: BinanceApi, market_type: str):
+        self.client = client
+        self.market_type = market_type
+        # client_oid -> 订单状态
+        self.orders: Dict[str, dict] = {}
+        # symbol(现货是币种) -> (多仓, 空仓, 推送时间毫秒)
+        self.positions: Dict[str, Tuple[float, float, int]] = {}
+        self.connected = False
+        self.condition: Optional[asyncio.Condition] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self.task is None or self.task.done():
+            self.condition = asyncio.Condition()
+            self.task = asyncio.ensure_future(self.run())
+
+    async def stop(self) -> None:
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+        self.connected = False
+
+    async def keep_listen_key(self) -> None:
+        """listen key 60分钟不续期就会失效,POST会返回同一个key并延长有效期"""
+        while True:
+            await asyncio.sleep(ExecutionConfig.LISTEN_KEY_KEEPALIVE)
+            try:
+                await self.client.get_listen_key(self.market_type, rds=False)
+            except Exception as e:
+                logger.error(f"listen key续期失败:{e}")
+
+    async def run(self) -> None:
+        keeper = asyncio.ensure_future(self.keep_listen_key())
+        try:
+            while True:
+                try:
+                    listen_key = await self.client.get_listen_key(self.market_type, rds=False)
+                    url = f"{self.client.get_ws_url(self.market_type)}/ws/{listen_key}"
+                    async with websockets.connect(url) as ws:
+                        self.connected = True
+                        logger.info(f"用户数据流连接成功:{self.market_type}")
+                        while True:
+                            # 用户数据流可能很久没有推送,断线由websockets自带的ping检测
+                            data = json.loads(await ws.recv())
+                            await self.on_message(data)
+                except asyncio.CancelledError:
+                    raise
+                except websockets.exceptions.ConnectionClosed:
+                    self.connected = False
+                except Exception as e:
+                    self.connected = False
+                    logger.error(f"用户数据流断开,正在重连:{e}")
+                    await asyncio.sleep(1)
+        finally:
+            self.connected = False
+            keeper.cancel()
+
+    async def on_message(self, data: dict) -> None:
+        event = data.get("e")
+        if event == "ORDER_TRADE_UPDATE":
+            order = data["o"]
+            self.orders[order["c"]] = {
+                "symbol": order["s"],
+                "status": order["X"],
+                "filled": float(order["z"]),
+                "price_avg": float(order["ap"]),
+                "timestamp": order["T"],
+            }
+        elif event == "executionReport":
+            filled = float(data["z"])
+            self.orders[data["c"]] = {
+                "symbol": data["s"],
+                "status": data["X"],
+                "filled": filled,
+                "price_avg": float(data["Z"]) / filled if filled else 0,
+                "timestamp": data["T"],
+            }
+        elif event == "ACCOUNT_UPDATE":
+            sides: Dict[str, Dict[str, float]] = {}
+            for position in data["a"].get("P", []):
+                sides.setdefault(position["s"], {})[position["ps"]] = float(position["pa"])
+            for symbol, amounts in sides.items():
+                long_amount, short_amount, _ = self.positions.get(symbol, (0, 0, 0))
+                if "LONG" in amounts or "SHORT" in amounts:
+                    # 双向持仓模式,BOTH一直是0,只看LONG和SHORT
+                    long_amount = abs(amounts.get("LONG", long_amount))
+                    short_amount = abs(amounts.get("SHORT", short_amount))
+                else:
+                    amount = amounts.get("BOTH", 0)
+                    long_amount, short_amount = max(amount, 0), max(-amount, 0)
+                self.positions[symbol] = (long_amount, short_amount, data["T"])
+        elif event == "outboundAccountPosition":
+            for balance in data["B"]:
+                self.positions[balance["a"]] = (float(balance["f"]) + float(balance["l"]), 0, data["u"])
+        else:
+            return
+        while len(self.orders) > MAX_ORDERS:
+            self.orders.pop(next(iter(self.orders)))
+        async with self.condition:
+            self.condition.notify_all()
+
+    async def wait_order(self, client_oid: str, timeout: float = ExecutionConfig.FILL_TIMEOUT) -> Optional[dict]:
+        """等待订单结束,超时或者没有连上返回None"""
+        if not self.connected:
+            return None
+
+        def finished():
+            return self.orders.get(client_oid, {}).get("status") in FINAL_ORDER_STATUS
+
+        try:
+            async with self.condition:
+                await asyncio.wait_for(self.condition.wait_for(finished), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"等待订单成交推送超时:{client_oid}")
+            return None
+        return self.orders.pop(client_oid)
+
+    async def wait_position(self, symbol: str, since: int, timeout: float = ExecutionConfig.FILL_TIMEOUT) -> Optional[Tuple[float, float]]:
+        """等待since(毫秒)之后推送的持仓,超时或者没有连上返回None"""
+        if not self.connected:
+            return None
+
+        def updated():
+            return self.positions.get(symbol, (0, 0, 0))[2] >= since
+
+        try:
+            async with self.condition:
+                await asyncio.wait_for(self.condition.wait_for(updated), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"等待持仓推送超时:{symbol}")
+            return None
+        long_amount, short_amount, _ = self.positions[symbol]
+        return long_amount, short_amount
+
+
+class OrderTrackerManager(object):
+    """按(api_key, market_type)管理OrderTracker,所有tracker都运行在同一个事件循环里"""
+
+    def __init__(self):
+        self.trackers: Dict[Tuple[str, str], OrderTracker] = {}
+
+    def get(self, client: BinanceApi) -> OrderTracker:
+        key = (client.api.api_key, client.symbol.market_type)
+        if key not in self.trackers:
+            self.trackers[key] = OrderTracker(client=client, market_type=client.symbol.market_type)
+        tracker = self.trackers[key]
+        tracker.start()
+        return tracker
+
+    async def close(self) -> None:
+        await asyncio.gather(*[tracker.stop() for tracker in self.trackers.values()])
+        self.trackers.clear()
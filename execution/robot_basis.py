@@ -19,6 +19,7 @@ from base.consts import ExecutionConfig, BinanceWebsocketUri
 from base.consts import RobotRedisConfig, RobotStatus, RobotConfig
 from db.cache import RedisHelper
 from db.model import SymbolModel, StrategyModel
+from db.symbol_registry import symbol_registry
 from execution import execution_pb2, execution_pb2_grpc
 from util.strategy_import import get_strategy_class
 
@@ -250,8 +251,8 @@ class Robot(object):
         self.robot_id = robot_id
         self.info = info
         self.strategy_class = self.generate_strategy()
-        self.symbol: SymbolModel = SymbolModel.get_by_id(id=self.info.get("symbol_id"))
-        self.symbol2: SymbolModel = SymbolModel.get_by_id(id=self.info.get("symbol2_id"))
+        self.symbol: SymbolModel = symbol_registry.get_by_id(self.info.get("symbol_id"))
+        self.symbol2: SymbolModel = symbol_registry.get_by_id(self.info.get("symbol2_id"))
         if not self.symbol2:
             self.symbol2 = self.symbol
         self.api = SimpleExchangeAPI(api_key=self.info["api"]["api_key"], secret_key=self.info["api"]["secret_key"], passphrase=self.info["api"]["passphrase"], exchange=self.symbol.exchange, symbol=self.symbol)
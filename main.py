@@ -6,8 +6,10 @@ from pprint import pprint
 import click
 import pandas as pd
 
-from api.basis import Basis
+from api.basis_engine import BasisEngine
 from api.binance.base_request import BinanceRequest
+from api.binance.binance_api import BinanceApi
+from api.binance.kline_downloader import BinanceKlineDownloader
 from api.binance.binance_websocket import BinanceWebsokcetService
 # from api.bybit import bybit
 from api.exchange import ExchangeAPI, ExchangeApiWithID, ExchangeWithSymbolID
@@ -16,10 +18,11 @@ from backtesting import run_backtest, run_optimize
 from backtesting.bt_backtest import run_bt_backtest
 # from backtesting.grid_backtest import run_grid_backtest
 from base.config import logger
-from base.consts import EthereumCoinAddress
+from base.consts import EthereumCoinAddress, ExecutionConfig
 from db.db_context import session_socpe
 from db.default.init import init_data
-from db.model import Factor, SymbolModel, ExchangeAPIModel
+from db.model import Factor, SymbolModel, ExchangeAPIModel, BasisTickerModel, BasisTickerRollupModel, BalanceModel, \
+    BalanceRollupModel
 from execution.execution_server import serve
 from execution.execution_test_client import test_execution_client
 from execution.robot_basis import RobotManager as BasisRobotMananger
@@ -203,8 +206,9 @@ def japan():
 
 
 @click.command()
-def execution():
-    serve()
+@click.option('--aio', is_flag=True, default=False, help='用grpc.aio启动,所有请求跑在同一个事件循环里')
+def execution(aio):
+    serve(aio=aio or ExecutionConfig.AIO)
 
 
 @click.command()
@@ -256,9 +260,32 @@ def generate():
     SuperVisor.generate_all()
 
 
+@cli.command()
+def rollup():
+    """用已有的基差tick和资金快照生成降采样的曲线, 之后新入库的数据会自动合并"""
+    for model, rollup_model in ((BasisTickerModel, BasisTickerRollupModel), (BalanceModel, BalanceRollupModel)):
+        columns = [rollup_model.key_column, rollup_model.time_column] + rollup_model.value_columns
+        last_id = 0
+        while True:
+            # 按id分页, 数据是按时间顺序入库的, 每个周期先写入的是第一条
+            with session_socpe() as sc:
+                objs = sc.query(model).filter(model.id > last_id).order_by(model.id).limit(10000).all()
+                if not objs:
+                    break
+                rows = []
+                for obj in objs:
+                    row = {column: getattr(obj, column, None) for column in columns}
+                    if model is BalanceModel:
+                        row['api_id'] = str(obj.api_id)
+                        row['balance'] = round(obj.amount * obj.price, 1)
+                    rows.append(row)
+                rollup_model.rollup(rows, sc=sc)
+                last_id = objs[-1].id
+
+
 @cli.command()
 def basisticker():
-    Basis.update_basis()
+    BasisEngine().run()
 
 
 @cli.command()
@@ -578,6 +605,17 @@ def sync():
     #     time.sleep(60 * 60 * 1)
 
 
+@click.command()
+@click.argument("market_type")
+@click.option("--timeframe", default="1m")
+def synckline(market_type, timeframe):
+    """并发同步币安某个市场所有可交易交易对的K线入库"""
+    with session_socpe() as sc:
+        symbols = sc.query(SymbolModel).filter_by(exchange="binance", market_type=market_type, is_tradable=True).all()
+    apis = [BinanceApi(api=None, symbol=symbol) for symbol in symbols]
+    asyncio.run(BinanceKlineDownloader.download_symbols(apis, timeframe=timeframe))
+
+
 @click.command()
 @click.argument("task")
 def testbt(task="1"):
@@ -803,6 +841,7 @@ cli.add_command(account)
 cli.add_command(scheduler)
 cli.add_command(generate)
 cli.add_command(basisticker)
+cli.add_command(rollup)
 cli.add_command(binance)
 cli.add_command(double)
 cli.add_command(kline)
@@ -814,6 +853,7 @@ cli.add_command(export)
 cli.add_command(preprocess)
 cli.add_command(analyse)
 cli.add_command(sync)
+cli.add_command(synckline)
 cli.add_command(testbt)
 cli.add_command(dex)
 cli.add_command(grid)
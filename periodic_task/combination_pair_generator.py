@@ -1,6 +1,6 @@
 from datetime import datetime
 from time import sleep
-from typing import List
+from typing import List, Dict
 
 from base.consts import RedisKeys
 from base.config import logger
@@ -21,11 +21,19 @@ class CombinationPairGenerator(object):
     def get_price(self, symbol: str):
         return self.redis.hget(redis_key=RedisKeys.TICKER_HASH_KEY, key=symbol).get("last")
 
+    def get_prices(self) -> Dict[str, float]:
+        """一次取出所有组合用到的交易对的最新价格"""
+        symbols = list({symbol for combination in self.all_combinations for symbol in combination.symbols.split("_")})
+        tickers = self.redis.hmget(redis_key=RedisKeys.TICKER_HASH_KEY, keys=symbols)
+        return {symbol: ticker.get("last") for symbol, ticker in zip(symbols, tickers)}
+
     def update_combination_index(self):
+        all_prices = self.get_prices()
+        data = {}
         for combination in self.all_combinations:
             symbols = combination.symbols.split("_")
             factors = [float(x) for x in combination.factors.split("_")]
-            prices = [self.get_price(symbol) for symbol in symbols]
+            prices = [all_prices[symbol] for symbol in symbols]
             result = sum(
                 factor * price for factor, price in zip(factors, prices)
             ) + float(combination.intercept)
@@ -33,23 +41,22 @@ class CombinationPairGenerator(object):
                 abs(factor) * price for factor, price in zip(factors, prices)
             )
             index_value = float(result / cost) * 10000
-            self.redis.hset(
-                redis_key=RedisKeys.PAIR_DIFF_HASH_KEY, key=combination.id, value={
-                    "b": round(cost, 6),
-                    "v": round(result, 6),
-                    "i": round(index_value, 6),
-                    "t": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    "s": combination.combination_symbol_name,
-                }
-            )
+            data[combination.id] = {
+                "b": round(cost, 6),
+                "v": round(result, 6),
+                "i": round(index_value, 6),
+                "t": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "s": combination.combination_symbol_name,
+            }
+        self.redis.hmset(redis_key=RedisKeys.PAIR_DIFF_HASH_KEY, data=data)
 
     @sc_wrapper
     def update_mysql(self, sc=None):
         logger.info("开始更新MySQL里面的数据")
-        for combination in self.all_combinations:
-            values = self.redis.hget(
-                redis_key=RedisKeys.PAIR_DIFF_HASH_KEY, key=combination.id
-            )
+        all_values = self.redis.hmget(
+            redis_key=RedisKeys.PAIR_DIFF_HASH_KEY, keys=[combination.id for combination in self.all_combinations]
+        )
+        for combination, values in zip(self.all_combinations, all_values):
             index_model = CombinationIndexModel(
                 timestamp=datetime.now(),
                 combination_id=combination.id,
@@ -59,7 +66,7 @@ class CombinationPairGenerator(object):
                 btc_price=0
             )
             sc.add(index_model)
-            sc.commit()
+        sc.commit()
 
         logger.info("成功更新MySQL里面的数据")
 
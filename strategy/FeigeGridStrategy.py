@@ -11,6 +11,7 @@ from base.config import cli_app
 from base.log import Logger
 from db.cache import rds
 from util.func_util import my_round
+from util.trade_ledger_util import sync_trades
 
 pd.set_option('display.max_rows', 50)
 pd.set_option('display.max_columns', 500)
@@ -218,16 +219,9 @@ class FeigeGrid:
         return profit
 
     async def get_order_detail(self, line_data=False):
-        all_orders = []
         line = []
         del self.param['price_position']
-        orders: list = await self.ex.get_symbol_history_order_detail(start_time=arrow.get(float(self.param['timestamp']) + 1000), limit=1000)
-        while orders:
-            all_orders.extend(orders)
-            trade_id = orders[-1]['id'] + 1
-            orders = await self.ex.get_symbol_history_order_detail(trade_id)
-
-        df = pd.DataFrame(all_orders)
+        df = await sync_trades(self.ex, arrow.get(float(self.param['timestamp']) + 1000))
         depth = rds.hget(f'{self.ex.symbol.exchange}:TICKER:{self.ex.symbol.market_type}'.upper(), self.ex.symbol.symbol)
         buy_price, sell_price = depth.get('best_bid'), depth.get('best_ask')
         """运行时长"""
@@ -0,0 +1,77 @@
+"""redis值编码的性能测试
+
+python -m test.benchmark_codec
+"""
+import random
+import timeit
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from db import codec
+
+
+def make_tickers(number: int = 200) -> dict:
+    """和BinanceApi.ticker_process一样的ticker"""
+    tickers = {}
+    for i in range(number):
+        price = random.uniform(0.001, 50000)
+        tickers[f"SYMBOL{i}USDT"] = {
+            'timestamp': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+            'symbol': f"SYMBOL{i}USDT",
+            'last': price,
+            'last_qty': random.uniform(0, 100),
+            'best_ask': price * 1.0001,
+            'best_ask_size': random.uniform(0, 100),
+            'best_bid': price,
+            'best_bid_size': random.uniform(0, 100),
+        }
+    return tickers
+
+
+def make_positions(number: int = 50) -> dict:
+    """和BinanceApi.process_position一样的持仓"""
+    positions = {}
+    for i in range(number):
+        symbol = f"SYMBOL{i}USDT"
+        positions[symbol] = [{
+            "amount": random.uniform(0, 100),
+            "available": random.uniform(0, 100),
+            "price": round(random.uniform(0, 50000), 3),
+            "last": round(random.uniform(0, 50000), 3),
+            "margin": 0,
+            "symbol": symbol,
+            "leverage": 20.0,
+            "liquidation": round(random.uniform(0, 50000), 3),
+            "pnl": round(random.uniform(-100, 100), 3),
+            "direction": direction,
+            "create_time": datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+            "timestamp": datetime.utcnow(),
+        } for direction in ("long", "short")]
+    return positions
+
+
+def benchmark(name: str, values: list, number: int = 20) -> None:
+    print(f"{name}: {len(values)}个值")
+    tested = set()
+    for codec_name in ("json", "orjson", "pickle", "arrow"):
+        if isinstance(values[0], pd.DataFrame) == (codec_name in ("json", "orjson")):
+            continue
+        value_codec = codec.get_codec(codec_name)
+        # 没有安装pyarrow的时候arrow就是pickle
+        if value_codec.name in tested:
+            continue
+        tested.add(value_codec.name)
+        encoded = [value_codec.encode(x) for x in values]
+        encode_time = timeit.timeit(lambda: [value_codec.encode(x) for x in values], number=number) / number
+        decode_time = timeit.timeit(lambda: [codec.decode(x) for x in encoded], number=number) / number
+        size = sum(len(x) for x in encoded)
+        print(f"  {value_codec.name:>7}: 编码 {encode_time * 1000:8.3f}ms  解码 {decode_time * 1000:8.3f}ms  大小 {size}")
+
+
+if __name__ == '__main__':
+    benchmark("ticker", list(make_tickers().values()))
+    benchmark("position", list(make_positions().values()))
+    kline = pd.DataFrame({column: [random.random() for _ in range(1000)] for column in ["Open", "High", "Low", "Close", "Volume"]},
+                         index=pd.date_range("2021-01-01", periods=1000, freq="T"))
+    benchmark("kline DataFrame", [kline], number=100)
@@ -0,0 +1,53 @@
+import random
+
+import numpy as np
+import pandas as pd
+
+from util.balance_cal_util import approx_equal, pair_orders
+
+
+def pair_orders_loop(buy_prices, buy_times, sell_prices, sell_times):
+    """之前get_history里逐个比较的配对方式"""
+    matched = [-1] * len(buy_prices)
+    available = list(range(len(sell_prices)))
+    for i in range(len(buy_prices)):
+        for j in available:
+            if approx_equal(buy_prices[i], sell_prices[j], 0.01) & (buy_times[i] < sell_times[j]):
+                matched[i] = j
+                available.remove(j)
+                break
+    return matched
+
+
+def make_orders(rng: random.Random, number: int):
+    """和get_history一样: 网格格子上的成交, 按时间倒序, 买单的目标价是round(price * (1 + q), 5)"""
+    q = rng.choice([0.003, 0.005, 0.01, 0.02])
+    start = rng.uniform(0.1, 50000)
+    rungs = [start * (1 + q) ** i for i in range(rng.randint(1, 30))]
+    times = pd.date_range('2021-01-01', periods=number * 2, freq=f'{rng.randint(1, 120)}s')
+    df = pd.DataFrame({
+        'price': [rng.choice(rungs) * rng.uniform(0.998, 1.002) for _ in range(number)],
+        'timestamp': [str(rng.choice(times))[:19] for _ in range(number)],
+        'direction': [rng.choice(['BUY', 'SELL']) for _ in range(number)],
+    })
+    df.sort_values(by='timestamp', ascending=False, inplace=True)
+    df_buy = df[df['direction'] == 'BUY']
+    df_sell = df[df['direction'] == 'SELL']
+    return (round(df_buy['price'] * (q + 1), 5).to_numpy(), df_buy['timestamp'].to_numpy(),
+            df_sell['price'].to_numpy(), df_sell['timestamp'].to_numpy())
+
+
+def test_pair_orders():
+    rng = random.Random(0)
+    for _ in range(300):
+        orders = make_orders(rng, rng.randint(0, 200))
+        assert pair_orders(*orders).tolist() == pair_orders_loop(*orders)
+
+
+def test_pair_orders_large():
+    rng = random.Random(1)
+    buy_prices, buy_times, sell_prices, sell_times = make_orders(rng, 16000)
+    matched = pair_orders(buy_prices, buy_times, sell_prices, sell_times)
+    paired = matched[matched >= 0]
+    assert len(np.unique(paired)) == len(paired)
+    assert (buy_times[matched >= 0] < sell_times[paired]).all()
@@ -0,0 +1,31 @@
+import pytest
+from redis.exceptions import ConnectionError
+
+from api.binance.book_ticker import BookTickerService
+from db.cache import RedisPipeline
+
+
+def book_ticker(symbol: str, bid: str) -> dict:
+    return {"s": symbol, "b": bid, "B": "1", "a": "2", "A": "1", "T": 1}
+
+
+def test_flush_keeps_changes_until_written(monkeypatch):
+    service = BookTickerService(market_types=["usdt_future"])
+    service.on_message("usdt_future", book_ticker("BTCUSDT", "1"))
+    service.on_message("usdt_future", book_ticker("ETHUSDT", "1"))
+
+    def fail(self):
+        raise ConnectionError("redis is down")
+
+    monkeypatch.setattr(RedisPipeline, "execute", fail)
+    with pytest.raises(ConnectionError):
+        service.flush()
+    # 写入失败, 下次flush还要写这两个交易对
+    assert service.changed["usdt_future"] == {"BTCUSDT", "ETHUSDT"}
+
+    written = []
+    monkeypatch.setattr(RedisPipeline, "execute", lambda self: written.append(len(self.pipe.command_stack)))
+    assert service.flush() == 2
+    assert written == [2]
+    assert service.changed["usdt_future"] == set()
+    assert service.flush() == 0
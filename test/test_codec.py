@@ -0,0 +1,69 @@
+import json
+import math
+import pickle
+from datetime import datetime, date
+
+import pandas as pd
+import pytest
+
+from base.consts import RedisCodecConfig
+from db import codec
+from db.codec import CJsonEncoder
+
+VALUE = {
+    "timestamp": datetime(2021, 1, 2, 3, 4, 5, 6),
+    "date": date(2021, 1, 2),
+    "price": 1.5,
+    "amount": 3,
+    "symbol": "BTCUSDT",
+    "positions": [{"amount": 1.0, "direction": "long"}, None],
+}
+# json按CJsonEncoder的格式写时间, 读出来是字符串
+EXPECTED = json.loads(json.dumps(VALUE, cls=CJsonEncoder))
+
+KLINE = pd.DataFrame({"Open": [1.0, 2.0], "Close": [1.5, float("nan")]}, index=pd.date_range("2021-01-01", periods=2, freq="T"))
+
+
+def test_default_codec_is_legacy_json():
+    encoded = codec.encode(VALUE, codec.get_codec(RedisCodecConfig.CODEC), codec.get_codec(RedisCodecConfig.DATAFRAME_CODEC))
+    # 没有升级的程序仍然可以直接用json.loads读取
+    assert json.loads(encoded) == EXPECTED
+
+
+@pytest.mark.parametrize("name", ["json", "orjson"])
+def test_value_round_trip(name):
+    value_codec = codec.get_codec(name)
+    encoded = value_codec.encode(VALUE)
+    assert isinstance(encoded, str)
+    assert encoded[:1] == value_codec.tag or not value_codec.tag
+    assert codec.decode(encoded) == EXPECTED
+    assert codec.decode(encoded.encode()) == EXPECTED
+
+
+@pytest.mark.parametrize("name", ["pickle", "arrow"])
+def test_dataframe_round_trip(name):
+    dataframe_codec = codec.get_codec(name)
+    encoded = codec.encode(KLINE, codec.get_codec("json"), dataframe_codec)
+    assert encoded[:1] == dataframe_codec.tag
+    pd.testing.assert_frame_equal(codec.decode(encoded), KLINE, check_freq=False)
+    pd.testing.assert_frame_equal(codec.decode(encoded.encode()), KLINE, check_freq=False)
+
+
+def test_legacy_values():
+    # 之前写入的没有标记的JSON
+    assert codec.decode(json.dumps(VALUE, cls=CJsonEncoder)) == EXPECTED
+    assert codec.decode(json.dumps(VALUE, cls=CJsonEncoder).encode()) == EXPECTED
+    # 之前用pickle保存的DataFrame
+    pd.testing.assert_frame_equal(codec.decode(pickle.dumps(KLINE)), KLINE)
+
+
+def test_nan():
+    assert math.isnan(codec.decode(codec.get_codec("json").encode({"pnl": float("nan")}))["pnl"])
+    if codec.orjson is not None:
+        # orjson不支持NaN, 读出来是None
+        assert codec.decode(codec.get_codec("orjson").encode({"pnl": float("nan")}))["pnl"] is None
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        codec.get_codec("msgpack")
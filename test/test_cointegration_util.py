@@ -0,0 +1,149 @@
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# 对照的是之前用sklearn和statsmodels逐个窗口拟合的结果, 筛选用arch做ADF检验
+linear_model = pytest.importorskip("sklearn.linear_model")
+sm = pytest.importorskip("statsmodels.api")
+pytest.importorskip("arch")
+
+from base.consts import AnalyseConfig  # noqa: E402
+from util import cointegration_util  # noqa: E402
+from util.cointegration_util import CointegrationCalculator, generate_all_combination_info, load_screened_results, screen_pair  # noqa: E402
+
+FEATURES = ["BTCUSDT", "ETHUSDT"]
+
+
+def make_close(n: int = 900, seed: int = 0) -> pd.DataFrame:
+    """BTC和ETH是随机游走, LTC和EOS是它们的线性组合加上噪声, DOGE是另外的随机游走, 价格在LTC和EOS之间"""
+    rng = np.random.default_rng(seed)
+    btc = 10000 + np.cumsum(rng.normal(0, 50, n))
+    eth = 300 + np.cumsum(rng.normal(0, 3, n))
+    return pd.DataFrame({
+        "LTCUSDT": 0.005 * btc + 0.1 * eth + 20 + rng.normal(0, 1, n),
+        "EOSUSDT": 0.0002 * btc + 0.004 * eth + 1 + rng.normal(0, 0.05, n),
+        "DOGEUSDT": 5 + np.abs(np.cumsum(rng.normal(0, 0.1, n))),
+        "BTCUSDT": btc,
+        "ETHUSDT": eth,
+    }, index=pd.date_range("2021-01-01", periods=n, freq="H"))
+
+
+@pytest.fixture
+def cache_dir(monkeypatch, tmp_path):
+    """CointegrationCalculator的缓存写到临时目录"""
+    monkeypatch.setattr(cointegration_util, "BASE_DIR", str(tmp_path))
+    (tmp_path / "data").mkdir()
+    return tmp_path / "data"
+
+
+def calculate_loop(data: pd.DataFrame, symbol_1: str, symbol_2: str, rolling_length: int, model_type: str) -> pd.DataFrame:
+    """之前每个窗口用sklearn拟合两个残差模型, 再用statsmodels做残差的OLS"""
+    rows = []
+    for end in range(rolling_length, data.shape[0] + 1):
+        train_df = data.iloc[end - rolling_length:end].dropna()
+        models, residuals = [], []
+        for label_column in (symbol_1, symbol_2):
+            # 默认的tol会提前停止, 差不多千分之一的误差, 这里和收敛之后的结果比较
+            model = linear_model.Ridge(alpha=1.0) if model_type == "ridge" else linear_model.Lasso(alpha=0.1, tol=1e-12, max_iter=100000)
+            model.fit(train_df[FEATURES], train_df[label_column])
+            models.append(model)
+            residuals.append(train_df[label_column] - model.predict(train_df[FEATURES]))
+        residual_factor = sm.OLS(residuals[0], residuals[1]).fit().params.iloc[0]
+        row = train_df.iloc[-1].copy()
+        row["residual_diff"] = residuals[0].iloc[-1] - residuals[1].iloc[-1] * residual_factor
+        row["a"] = 1
+        row["b"] = -residual_factor
+        row["c"] = -models[0].coef_[0] + models[1].coef_[0] * residual_factor
+        row["d"] = -models[0].coef_[1] + models[1].coef_[1] * residual_factor
+        row["e"] = -models[0].intercept_ + models[1].intercept_ * residual_factor
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+@pytest.mark.parametrize("model_type", ["lasso", "ridge"])
+@pytest.mark.parametrize("missing", [False, True])
+def test_calculate(model_type, missing, cache_dir):
+    data = make_close().drop(columns="DOGEUSDT")
+    if missing:
+        # 窗口里有空值的行不参与计算, 窗口最后一行是空值的时候结果是前一行
+        data.iloc[[5, 300, 301, 750, 899], 3] = np.nan
+        data.iloc[[10, 820], 1] = np.nan
+    rolling_length = 24 * 30
+    expected = calculate_loop(data, "LTCUSDT", "EOSUSDT", rolling_length, model_type)
+
+    calculator = CointegrationCalculator(data=data, symbol_1="LTCUSDT", symbol_2="EOSUSDT", feature_columns=FEATURES,
+                                         rolling_length=rolling_length, model_type=model_type)
+    result = calculator.calculate(use_cache=False)
+
+    assert list(result.index) == list(expected.index)
+    for column in ["a", "b", "c", "d", "e", "residual_diff"]:
+        np.testing.assert_allclose(result[column], expected[column], rtol=1e-6, atol=1e-8, err_msg=column)
+    assert (cache_dir / "analyse_LTCUSDT-EOSUSDT.csv").is_file()
+
+
+def test_screen_pair(cache_dir):
+    close = make_close(n=2400)
+    # EOS开始得比较晚
+    close.iloc[:100, 1] = np.nan
+    # 之前别的时间段留下的缓存不能被使用
+    pd.DataFrame({"residual_diff": [0.0]}, index=[close.index[0]]).to_csv(cache_dir / "analyse_LTCUSDT-EOSUSDT.csv")
+
+    values = close.to_numpy()
+    shm = SharedMemory(create=True, size=values.nbytes)
+    try:
+        np.ndarray(values.shape, dtype=float, buffer=shm.buf)[:] = values
+        cointegration_util._init_pair_worker(shm.name, values.shape, close.index, list(close.columns))
+        assert np.array_equal(cointegration_util._shared_close["df"].to_numpy(), values, equal_nan=True)
+
+        result = screen_pair(("LTCUSDT", "EOSUSDT"), FEATURES)
+        assert result["rows"] == close.shape[0] - 100
+        assert result["is_stationary"]
+        cached = pd.read_csv(cache_dir / "analyse_LTCUSDT-EOSUSDT.csv", index_col=0, parse_dates=True)
+        assert cached.shape[0] == close.shape[0] - 100 - 24 * 30 * 3 + 1
+        assert cached.index[0] > close.index[100]
+
+        # 数据不够的组合不做检验
+        cointegration_util._shared_close["df"] = close.iloc[:1000]
+        result = screen_pair(("LTCUSDT", "EOSUSDT"), FEATURES)
+        assert result["rows"] == 900 and not result["is_stationary"] and np.isnan(result["adf_stat"])
+    finally:
+        cointegration_util._shared_close.clear()
+        shm.close()
+        shm.unlink()
+
+
+def test_generate_all_combination_info(cache_dir, monkeypatch, tmp_path):
+    close = make_close(n=2400)
+    monkeypatch.setattr(cointegration_util, "load_close_matrix", lambda symbols, start_time, end_time: close[symbols])
+    path = str(tmp_path / "screening.csv")
+    monkeypatch.setattr(AnalyseConfig, "PAIR_SCREENING_RESULT_PATH", path)
+
+    result = generate_all_combination_info(["LTC", "EOS", "DOGE", "LTC"], "2021-01-01", "2021-05-01", workers=2)
+
+    # (A, B) 和 (B, A) 只分析一次, 价格大的在前面
+    assert sorted(zip(result.symbol_1, result.symbol_2)) == [("DOGEUSDT", "EOSUSDT"), ("LTCUSDT", "DOGEUSDT"), ("LTCUSDT", "EOSUSDT")]
+    pd.testing.assert_frame_equal(pd.read_csv(path), result.reset_index(drop=True), check_dtype=False)
+    assert result.set_index(["symbol_1", "symbol_2"]).loc[("LTCUSDT", "EOSUSDT"), "is_stationary"]
+    assert (result.adf_stat.diff().dropna() >= 0).all()
+
+    analyse_results = load_screened_results(path)
+    assert ("LTCUSDT", "EOSUSDT") in analyse_results
+    assert set(analyse_results) == {tuple(x) for x in result[result.is_stationary][["symbol_1", "symbol_2"]].to_numpy()}
+
+
+def test_load_screened_results(cache_dir, tmp_path):
+    path = tmp_path / "screening.csv"
+    pd.DataFrame({"symbol_1": ["LTCUSDT", "DOGEUSDT"], "symbol_2": ["EOSUSDT", "EOSUSDT"], "rows": [10, 10],
+                  "adf_stat": [-5.0, -1.0], "critical_value": [-3.4, -3.4], "is_stationary": [True, False]}).to_csv(path, index=False)
+    index = pd.to_datetime(["2021-01-01 00:00", "2021-01-01 01:00", "2021-01-01 01:00", "2021-01-01 02:00"])
+    # 窗口最后一行是空值的时候, 结果会重复前一行的时间
+    pd.DataFrame({"residual_diff": [1.0, 2.0, 2.0, 3.0], "mean": [np.nan, 1.5, 1.5, 2.0]}, index=index).to_csv(cache_dir / "analyse_LTCUSDT-EOSUSDT.csv")
+
+    analyse_results = load_screened_results(str(path))
+
+    assert list(analyse_results) == [("LTCUSDT", "EOSUSDT")]
+    analyse_result = analyse_results[("LTCUSDT", "EOSUSDT")]
+    assert list(analyse_result.index) == list(pd.to_datetime(["2021-01-01 01:00", "2021-01-01 02:00"]))
+    assert list(analyse_result.residual_diff) == [2.0, 3.0]
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+
+from util.kline_volume_util import volume_bar_fragments, volume_bars
+
+
+def volume_bars_explode(df: pd.DataFrame, threshold: int) -> pd.DataFrame:
+    """之前按成交量explode, 一个成交量一行再分组的结果"""
+    df = df.copy()
+    df["Volumes"] = df["Volume"].apply(lambda x: [1 for x in range(int(x))])
+    # 空的list会explode成一行空值, 没有成交量的分钟不应该算一个成交量
+    df = df.explode("Volumes").dropna(subset=["Volumes"])
+    del df["Volumes"]
+    df["Volume"] = 1
+    df = df.rename_axis("candle_begin_time").reset_index()
+    bars = np.arange(df.shape[0]) // threshold
+    df = df.groupby(bars).agg({"Open": "first", "High": "max", "Low": "min", "Close": "last", "Volume": "sum", "candle_begin_time": "first"})
+    return df.set_index("candle_begin_time")
+
+
+def make_kline(n: int = 3000) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    close = rng.random(n) + 1
+    return pd.DataFrame({
+        "Open": close + rng.random(n) * 0.1,
+        "High": close + 0.4,
+        "Low": close - 0.4,
+        "Close": close,
+        # 有很多没有成交量的分钟
+        "Volume": rng.choice([0, 0, 0, 1, 3, 7, 20], n).astype(float),
+    }, index=pd.date_range("2021-01-01", periods=n, freq="T"))
+
+
+def test_volume_bars():
+    df = make_kline()
+    for threshold in [1, 5, 17, 100]:
+        expected = volume_bars_explode(df, threshold)
+        result = volume_bars(df, threshold)
+        pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+
+def test_fragments_skip_zero_volume_prices():
+    df = make_kline().rename_axis("candle_begin_time").reset_index()
+    fragments, bars = volume_bar_fragments(df, 50)
+    zero = fragments["Volume"].to_numpy() == 0
+    assert zero.any()
+    assert fragments.loc[zero, ["Open", "High", "Low", "Close"]].isnull().all().all()
+    # 没有成交量的行仍然保留, 总成交量不变
+    assert fragments.shape[0] >= df.shape[0]
+    np.testing.assert_allclose(fragments["Volume"].sum(), df["Volume"].sum())
+    np.testing.assert_allclose(fragments.groupby(bars)["Volume"].sum().to_numpy()[:-1], 50)
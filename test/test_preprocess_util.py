@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+
+from base.consts import PreProcessConfig
+from util.df_util import get_column_info, get_column_frequent
+from util.preprocess_util import Processor, PERIOD_FEATURE_SPEC
+
+CATEGORICAL_COLUMNS = ["twitter_tag", "twitter_to_addr", "twitter_from_addr", "twitter_transfer_coin_name", "type", "note", "first_tag", "has_link"]
+
+
+def preprocess_period_loop(x: pd.DataFrame, kline_technical_columns: list) -> pd.Series:
+    """之前逐段调用的preprocess_period"""
+    result = {
+        "Open": x.Open[0],
+        "Low": x.Low.min(),
+        "Close": x.Close[-1],
+        "High": x.High.max(),
+        "Volume": x.Volume.sum(),
+        "max_change": x.High.max() - x.Low.min(),
+        "candle_begin_time": x.candle_begin_time[-1],
+        "dayofweek": x.candle_begin_time[-1].dayofweek,
+        "hour": x.candle_begin_time[-1].hour,
+        "jinse_long_index": x.long_index.sum(),
+        "jinse_short_index": x.short_index.sum(),
+        "jinse_comment_number": x.comment_number.sum(),
+        "jinse_max_long_index": get_column_info(x, "long_index", "min"),
+        "jinse_max_short_index": get_column_info(x, "short_index", "min"),
+        "jinse_news_number": len(x.content_score.unique()) - 1,
+        "jinse_max_tag_number": get_column_info(x, "tag_number", "max"),
+        "jinse_max_title_words": get_column_info(x, "title_words", "max"),
+        "jinse_min_title_words": get_column_info(x, "title_words", "min"),
+        "jinse_max_title_score": get_column_info(x, "title_score", "max"),
+        "jinse_min_title_score": get_column_info(x, "title_score", "min"),
+        "jinse_max_content_words": get_column_info(x, "content_words", "max"),
+        "jinse_min_content_words": get_column_info(x, "content_words", "min"),
+        "jinse_max_content_score": get_column_info(x, "content_score", "max"),
+        "jinse_min_content_score": get_column_info(x, "content_score", "min"),
+        "jinse_max_comment_number": get_column_info(x, "comment_number", "max"),
+        "jinse_min_long_index": get_column_info(x, "long_index", "min"),
+        "jinse_min_short_index": get_column_info(x, "short_index", "min"),
+        "jinse_min_comment_number": get_column_info(x, "comment_number", "min"),
+        "twitter_whale_number": len(x.twitter_unique_key.unique()) - 1,
+    }
+    for column in ["twitter_usd_number", "twitter_coin_amount", "twitter_favorite_count", "twitter_retweet_count"]:
+        result[f"{column}_min"], result[f"{column}_max"], result[f"{column}_sum"] = get_column_info(x, column, "all")
+    result["twitter_light_number_max"] = get_column_info(x, "twitter_light_number", "max")
+    result["twitter_light_number_sum"] = get_column_info(x, "twitter_light_number", "sum")
+    for column in CATEGORICAL_COLUMNS:
+        result[column if column.startswith("twitter_") else f"jinse_{column}"] = get_column_frequent(x, column)
+    result["duration"] = (x.candle_begin_time[-1] - x.candle_begin_time[0]).total_seconds() / 60
+    result = pd.Series(result)
+    for column in kline_technical_columns + [x for x in x.columns.tolist() if x.startswith("eth_")]:
+        result[column] = x[column][-1]
+    return result
+
+
+def make_minute_df(n: int = 2000) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        "Open": rng.random(n) + 1,
+        "High": rng.random(n) + 2,
+        "Low": rng.random(n),
+        "Close": rng.random(n) + 1,
+        "Volume": rng.random(n),
+    }, index=pd.date_range("2020-01-01", periods=n, freq="T"))
+    for column in set(rule[0] for rule in PERIOD_FEATURE_SPEC.values()) - set(df.columns) - {"candle_begin_time"}:
+        if column in CATEGORICAL_COLUMNS or column == "twitter_unique_key":
+            df[column] = rng.choice(["a", "b", "c", None], n).astype(object)
+        else:
+            df[column] = rng.choice([1., 2., 3., np.nan, np.nan], n)
+    df["eth_Close"] = rng.random(n)
+    return df
+
+
+def test_aggregate_period():
+    processor = Processor()
+    df, processor.kline_technical_columns = processor.generate_technical_columns(make_minute_df(), "minute_kline_")
+    df["candle_begin_time"] = df.index
+    bars = np.repeat(np.arange(df.shape[0] // 20), 20)
+    # 有的段全是空值
+    df.loc[bars == 3, ["twitter_tag", "long_index"]] = None
+
+    expected = df.groupby(bars).apply(lambda x: preprocess_period_loop(x, processor.kline_technical_columns))
+    result = processor.aggregate_period(df.reset_index(drop=True), bars)
+
+    assert list(result.columns) == list(expected.columns)
+    assert set(processor.kline_technical_columns + ["eth_Close"]) <= set(result.columns)
+    for column in expected.columns:
+        if expected[column].dtype == object or column == "candle_begin_time":
+            assert (result[column].astype(str).values == expected[column].astype(str).values).all(), column
+        else:
+            np.testing.assert_allclose(result[column].astype(float), expected[column].astype(float), err_msg=column)
+
+
+def test_merge_info_volume_zero_volume_edges(monkeypatch, tmp_path):
+    processor = Processor()
+    df, processor.kline_technical_columns = processor.generate_technical_columns(make_minute_df(), "minute_kline_")
+    df["candle_begin_time"] = df.index
+    df.reset_index(drop=True, inplace=True)
+    # 每分钟的成交量正好是一根K线, 中间夹着没有成交的分钟和只有新闻的分钟, 最后几分钟没有成交
+    rng = np.random.default_rng(1)
+    kind = rng.choice(["trade", "zero", "news"], df.shape[0], p=[0.5, 0.3, 0.2])
+    kind[-5:] = "zero"
+    df["Volume"] = np.where(kind == "trade", 5.0, np.where(kind == "zero", 0.0, np.nan))
+    df.loc[kind == "news", ["Open", "High", "Low", "Close"]] = np.nan
+    traded = df[kind == "trade"]
+
+    monkeypatch.setattr(PreProcessConfig, "RESAMPLE_VOLUME", 5)
+    monkeypatch.setattr(PreProcessConfig, "VOLUME_RESULT_PATH", str(tmp_path / "volume.csv"))
+    monkeypatch.setattr(processor, "merge_all_df", lambda **kwargs: df.copy())
+    result = processor.merge_info_volume(df=None, gold_df=None, jinse_df=None, twitter_whale_df=None)
+
+    # 删除空值之前的结果: 每一分钟成交都是一根K线, 没有开盘价/收盘价是空值的K线, 也没有多出来一根空的K线
+    bars = pd.read_csv(tmp_path / "volume.csv", index_col=0)
+    assert bars.shape[0] == traded.shape[0]
+    assert bars[["Open", "High", "Low", "Close"]].notnull().all().all()
+    # 没有成交的分钟算到下一根K线里, 但开高低收只来自有成交的那一分钟
+    assert result.shape[0] > 0
+    for column in ["Open", "High", "Low", "Close"]:
+        np.testing.assert_allclose(result[column], traded[column].round(4).to_numpy()[result.index], err_msg=column)
+    np.testing.assert_allclose(result["Volume"], 5)
@@ -3,6 +3,7 @@ import asyncio
 import click
 
 from api.binance.binance_api import BinanceApi
+from api.binance.book_ticker import BookTickerService
 from api.ccfox.ccfox_api import CcfoxApi
 from api.exchange import ExchangeAPI, ExchangeModelAPI
 from api.okex.okex_api import OkexApi
@@ -11,6 +12,7 @@ from base.log import Logger
 from db.base_model import sc_wrapper
 from db.cache import RedisHelper
 from db.model import SymbolModel, ExchangeAPIModel, BasisModel
+from db.symbol_registry import publish_symbol_change
 from util.func_util import async_while_true_try
 
 logger = Logger('AsynExchange', logger_level)
@@ -32,6 +34,8 @@ class AsynExchange:
         asyncio.run(BinanceApi.get_all_symbols())
         BinanceApi.get_basis_symbols()
         SymbolModel.update_symbol_info()
+        # update_symbol_info会修改交割合约的is_tradable
+        publish_symbol_change()
         basis = {b.id: b.to_dict() for b in BasisModel.get_all_data()}
         redis = RedisHelper()
         redis.connection.delete('BASIS:SYMBOL')
@@ -104,9 +108,10 @@ class AsynExchange:
     @classmethod
     async def update_market(cls):
         """更新行情"""
+        # 币安的行情用websocket推送, 只写入变化的交易对
         await asyncio.wait([
             cls.ok.get_all_tickers(),
-            BinanceApi.get_all_tickers(),
+            BookTickerService().run(),
         ])
 
 
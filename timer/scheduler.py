@@ -1,14 +1,15 @@
 import asyncio
+import signal
 
-from apscheduler.events import EVENT_JOB_EXECUTED, EVENT_JOB_ERROR, EVENT_JOB_MISSED
+from apscheduler.events import EVENT_JOB_EXECUTED, EVENT_JOB_ERROR, EVENT_JOB_MISSED, EVENT_SCHEDULER_SHUTDOWN
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
-from api.basis import Basis
 from base.config import logger_level
 from base.consts import WeComAgent, WeComUser
 from base.log import Logger
 from timer.asynexchange import AsynExchange
 from timer.fund_rate import FundRateClass
+from util.async_request_util import SessionManager
 from util.wecom_message_util import WeComMessage
 
 logger = Logger('scheduler', logger_level)
@@ -27,6 +28,11 @@ def my_listener(event):
         logger.info(f"定时任务执行成功:{event.scheduled_run_time.strftime('%Y-%m-%d %H:%M:%S')}:{job.name}")
 
 
+def close_http_sessions(event):
+    """定时任务退出时关闭共享的http session"""
+    SessionManager.close_all()
+
+
 # scheduler = BlockingScheduler()
 scheduler = AsyncIOScheduler()
 
@@ -38,21 +44,7 @@ scheduler.add_job(
     func=AsynExchange.update_symbol, id='get_all_symbols_per_hour', name='更新symbol，定时任务,每小时一次',
     trigger='cron', minute='0-3', replace_existing=True, coalesce=True)
 
-scheduler.add_job(
-    func=Basis.get_max_min, args=[1], id="basis_get_max_min_1days", name='更新基差1D最大值最小值，间隔任务，5分钟一次',
-    trigger='interval', minutes=5, jitter=50, replace_existing=True, coalesce=True)
-
-scheduler.add_job(
-    func=Basis.get_max_min, args=[7], id="basis_get_max_min_7days", name='更新基差7D最大值最小值，间隔任务，1小时一次',
-    trigger='interval', hours=1, jitter=100, replace_existing=True, coalesce=True)
-
-scheduler.add_job(
-    func=Basis.get_max_min, args=[30], id="basis_get_max_min_30days", name='更新基差30D最大值最小值，间隔任务，3小时一次',
-    trigger='interval', hours=3, jitter=300, replace_existing=True, coalesce=True)
-
-scheduler.add_job(
-    func=Basis.cal_all_basis, args=[True], id="cal_all_basis", name='基差入库，间隔任务，1分钟一次',
-    trigger='interval', minutes=1, jitter=10, replace_existing=True, coalesce=True)
+# 基差的最大值最小值和基差入库由BasisEngine(python main.py basisticker)完成
 
 scheduler.add_job(
     func=AsynExchange.update_total_balance, id="update_total_balance", name='资金快照入库，间隔任务，1分钟一次',
@@ -67,17 +59,30 @@ scheduler.add_job(
 #     trigger='cron', hour='23,7,15', minute=55, replace_existing=True, coalesce=True)
 
 scheduler.add_listener(callback=my_listener, mask=EVENT_JOB_ERROR | EVENT_JOB_MISSED | EVENT_JOB_EXECUTED)
+scheduler.add_listener(callback=close_http_sessions, mask=EVENT_SCHEDULER_SHUTDOWN)
+
+
+def run_scheduler():
+    """运行定时任务直到收到SIGINT/SIGTERM, 退出前shutdown触发close_http_sessions"""
+    loop = asyncio.get_event_loop()
+    scheduler.start()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, loop.stop)
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        logger.info('停止定时任务')
+        # 事件循环已经停止, close_all可以在当前线程里直接关闭session
+        scheduler.shutdown(wait=False)
 
 
 def start_scheduler():
     AsynExchange.update_symbol()
-    Basis.get_max_min(1)
-    Basis.get_max_min(7)
-    Basis.get_max_min(30)
-    scheduler.start()
+    run_scheduler()
 
 
 if __name__ == '__main__':
     logger.info('启动定时任务')
-    scheduler.start()
-    asyncio.get_event_loop().run_forever()
+    run_scheduler()
@@ -1,10 +1,13 @@
+import asyncio
 import json
+import threading
+from typing import Dict
 
 import aiohttp
 from aiosocksy.connector import ProxyConnector, ProxyClientRequest
 
 from base.config import ip, logger_level
-from base.consts import WeComAgent, WeComPartment
+from base.consts import WeComAgent, WeComPartment, HttpSessionConfig
 from base.ifdebug import DEBUG
 from base.log import Logger
 from util.wecom_message_util import WeComMessage
@@ -35,25 +38,111 @@ class RequestException(Exception):
                f"程序运行主机:{ip}"
 
 
-async def request(method, url, data=None, timeout=15, headers=None, proxy=None, **kwargs):
-    async with aiohttp.ClientSession(connector=ProxyConnector(), request_class=ProxyClientRequest) as session:
+class SessionManager(object):
+    """进程内共享的aiohttp session
+
+    aiohttp的session绑定事件循环,所以每个事件循环一个session,同一个事件循环里的请求共用连接池,
+    按host保持长连接并缓存DNS,不用每次请求都重新握手。
+    asyncio.run结束时会关闭所有异步生成器,借助这一点在事件循环结束时自动关闭对应的session。
+    """
+    sessions: Dict[asyncio.AbstractEventLoop, aiohttp.ClientSession] = {}
+    keepers = {}
+    lock = threading.Lock()
+    connector_kwargs = {
+        'limit': HttpSessionConfig.LIMIT,
+        'limit_per_host': HttpSessionConfig.LIMIT_PER_HOST,
+        'ttl_dns_cache': HttpSessionConfig.TTL_DNS_CACHE,
+        'use_dns_cache': True,
+        'keepalive_timeout': HttpSessionConfig.KEEPALIVE_TIMEOUT,
+    }
+
+    @classmethod
+    def configure(cls, **kwargs):
+        """修改连接池参数,只对之后新建的session生效"""
+        cls.connector_kwargs.update(kwargs)
+
+    @staticmethod
+    async def _keep_session(session: aiohttp.ClientSession):
         try:
-            async with session.request(method, url, json=data, headers=headers, timeout=timeout, proxy=proxy, **kwargs) as res:
-                result = await res.text()
-                if res.status == 200:
-                    if res.content_type == 'text/html':
-                        return result
-                    result = json.loads(result)
-                    return result
+            yield
+        finally:
+            await session.close()
+
+    @classmethod
+    async def get_session(cls) -> aiohttp.ClientSession:
+        loop = asyncio.get_event_loop()
+        session = cls.sessions.get(loop)
+        if session is None or session.closed:
+            session = aiohttp.ClientSession(connector=ProxyConnector(**cls.connector_kwargs), request_class=ProxyClientRequest)
+            keeper = cls._keep_session(session)
+            await keeper.__anext__()
+            with cls.lock:
+                for closed_loop in [lp for lp in cls.sessions if lp.is_closed()]:
+                    cls.sessions.pop(closed_loop)
+                    cls.keepers.pop(closed_loop, None)
+                cls.sessions[loop] = session
+                cls.keepers[loop] = keeper
+        return session
+
+    @classmethod
+    async def close(cls):
+        """关闭当前事件循环的session"""
+        loop = asyncio.get_event_loop()
+        with cls.lock:
+            session = cls.sessions.pop(loop, None)
+            cls.keepers.pop(loop, None)
+        if session is not None:
+            await session.close()
+
+    @classmethod
+    def close_all(cls, timeout: float = 5):
+        """关闭所有事件循环的session,给gRPC服务和定时任务退出时调用
+
+        在事件循环自己的线程里调用的时候不能阻塞等待,只能把关闭交给事件循环,
+        这种情况最好直接await SessionManager.close()。
+        """
+        with cls.lock:
+            sessions = list(cls.sessions.items())
+            cls.sessions.clear()
+            cls.keepers.clear()
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        for loop, session in sessions:
+            if loop.is_closed() or session.closed:
+                continue
+            try:
+                if loop is running_loop:
+                    loop.create_task(session.close())
+                elif loop.is_running():
+                    asyncio.run_coroutine_threadsafe(session.close(), loop).result(timeout)
                 else:
-                    e = RequestException(url=url, data=data, text=result, response=res)
-                    raise e
-        except RequestException as e:
-            raise e
-        except Exception as e:
-            # logger.error(f"{e}")
-            e = RequestException(url=url, data=data, text=str(e))
-            raise e
+                    loop.run_until_complete(session.close())
+            except Exception as e:
+                logger.error(f"关闭http session失败:{e}")
+        logger.info(f"关闭了{len(sessions)}个http session")
+
+
+async def request(method, url, data=None, timeout=15, headers=None, proxy=None, **kwargs):
+    session = await SessionManager.get_session()
+    try:
+        async with session.request(method, url, json=data, headers=headers, timeout=timeout, proxy=proxy, **kwargs) as res:
+            result = await res.text()
+            if res.status == 200:
+                if res.content_type == 'text/html':
+                    return result
+                result = json.loads(result)
+                return result
+            else:
+                e = RequestException(url=url, data=data, text=result, response=res)
+                raise e
+    except RequestException as e:
+        raise e
+    except Exception as e:
+        # logger.error(f"{e}")
+        e = RequestException(url=url, data=data, text=str(e))
+        raise e
 
 
 async def get(url, data=None, timeout=15, headers=None, proxy=None):
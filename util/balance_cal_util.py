@@ -8,6 +8,7 @@ from api.binance.binance_api import BinanceApi
 from api.exchange import ExchangeApiWithID
 from base.log import Logger
 from db.cache import rds
+from util.trade_ledger_util import sync_trades
 
 pd.set_option('display.max_rows', 50)
 pd.set_option('display.max_columns', 500)
@@ -19,6 +20,55 @@ def approx_equal(x, y, tolerance=0.01):
     return abs(x - y) <= 0.5 * tolerance * (x + y)
 
 
+def pair_orders(buy_prices: np.ndarray, buy_times: np.ndarray, sell_prices: np.ndarray, sell_times: np.ndarray,
+                tolerance: float = 0.01) -> np.ndarray:
+    """给每个买单找到对应的卖单
+
+    按顺序处理买单, 每个买单取还没有被用过的、价格接近并且在它之后成交的第一个卖单。
+    卖单的价格都在网格的格子上, 所以按价格分组, 每组按时间倒序排队,
+    每个买单只需要看价格区间里每组的队首, 时间和内存都和成交数量成线性关系。
+    卖单按时间倒序传入的时候(和get_history一样)结果和逐个比较完全一样。
+
+    Returns:
+        每个买单对应的卖单的位置, 没有配对的是-1
+    """
+    matched = np.full(len(buy_prices), -1)
+    if not len(buy_prices) or not len(sell_prices):
+        return matched
+    buy_prices, sell_prices = buy_prices.astype(float), sell_prices.astype(float)
+    # 卖单按时间倒序, 时间相同的保持原来的顺序
+    _, time_rank = np.unique(sell_times, return_inverse=True)
+    order = np.lexsort((np.arange(len(sell_times)), -time_rank.ravel()))
+    levels, level_of = np.unique(sell_prices[order], return_inverse=True)
+    level_of = level_of.ravel()
+    # queue里是按价格分组之后的卖单, 每组的卖单按时间倒序, heads是每组还没有用过的第一个
+    queue = order[np.argsort(level_of, kind='stable')]
+    ends = np.cumsum(np.bincount(level_of, minlength=len(levels)))
+    heads = np.concatenate([[0], ends[:-1]])
+    # approx_equal(x, y)等价于 y 在 [x(1-h)/(1+h), x(1+h)/(1-h)] 之间, 区间放宽一点之后再用approx_equal确认
+    half = 0.5 * tolerance
+    lows = np.searchsorted(levels, buy_prices * (1 - half) / (1 + half) * (1 - 1e-9), side='left')
+    highs = np.searchsorted(levels, buy_prices * (1 + half) / (1 - half) * (1 + 1e-9), side='right')
+    # 逐个处理的部分用list, 比numpy的标量索引快很多
+    queue, ends, heads, levels = queue.tolist(), ends.tolist(), heads.tolist(), levels.tolist()
+    buy_prices, sell_times = buy_prices.tolist(), list(sell_times)
+    for i, (low, high) in enumerate(zip(lows.tolist(), highs.tolist())):
+        best_level = -1
+        for level in range(low, high):
+            head = heads[level]
+            # 队首不在买单之后, 这一组的其他卖单更早, 都不能配对
+            if head == ends[level] or not buy_times[i] < sell_times[queue[head]]:
+                continue
+            if not approx_equal(buy_prices[i], levels[level], tolerance):
+                continue
+            if best_level < 0 or queue[head] < queue[heads[best_level]]:
+                best_level = level
+        if best_level >= 0:
+            matched[i] = queue[heads[best_level]]
+            heads[best_level] += 1
+    return matched
+
+
 class BalanceCal:
     def __init__(self, api_id, symbol_id):
         self.param = rds.hget(f'REAL:GRIDSTRATEGY'.upper(), f"{api_id}:{symbol_id}")
@@ -45,44 +95,57 @@ class BalanceCal:
         df_buy = df[df['direction'] == 'BUY'].copy()
         df_sell = df[df['direction'] == 'SELL'].copy()
         df_buy['sell_price'] = round(df_buy['price'] * (self.param.get('q') + 1), 5)
-        for b, buy in df_buy.iterrows():
-            for s, sell in df_sell.iterrows():
-                if approx_equal(buy.sell_price, sell.price, 0.01) & (buy.timestamp < sell.timestamp):
-                    df_buy.loc[b, 'sell_timestamp'] = sell.timestamp
-                    df_buy.loc[b, 'sell_amount'] = sell.amount
-                    df_sell.drop(index=[s], inplace=True)
-                    break
+        matched = pair_orders(df_buy['sell_price'].to_numpy(), df_buy['timestamp'].to_numpy(),
+                              df_sell['price'].to_numpy(), df_sell['timestamp'].to_numpy())
+        if (matched >= 0).any():
+            paired = matched >= 0
+            df_buy['sell_timestamp'] = np.where(paired, df_sell['timestamp'].to_numpy()[matched], np.nan)
+            df_buy['sell_amount'] = np.where(paired, df_sell['amount'].to_numpy()[matched], np.nan)
         df_buy.fillna(value='', inplace=True)
         return df_buy.to_dict(orient='records')
 
     def cal_float_profit(self):
         self.price_position.loc[self.price_position['price'] > self.param['start_price'], 'float_profit'] = (self.price_position['price'] - self.param['start_price']) * self.price_position['per_amount'].shift(-1)
         self.price_position.loc[self.price_position['price'] < self.param['start_price'], 'float_profit'] = (self.price_position['price'] - self.param['start_price']) * self.price_position['per_amount'].shift(1)
-        self.price_position['total_float_profit'] = self.price_position['float_profit']. \
-            apply(lambda x:
-                  self.price_position[(self.price_position['float_profit'] <= x) & (self.price_position['float_profit'] >= 0)]['float_profit'].sum() if x > 0 else
-                  self.price_position[(self.price_position['float_profit'] >= x) & (self.price_position['float_profit'] < 0)]['float_profit'].sum())
+        """盈利的格子累加不超过它的盈利, 亏损的格子累加不低于它的亏损"""
+        profit = self.price_position['float_profit'].to_numpy(dtype=float)
+        positive = np.sort(profit[profit >= 0])
+        negative = np.sort(profit[profit < 0])
+        positive_sum = np.concatenate([[0], np.cumsum(positive)])
+        negative_sum = np.concatenate([[0], np.cumsum(negative)])
+        self.price_position['total_float_profit'] = np.where(
+            profit > 0,
+            positive_sum[np.searchsorted(positive, profit, side='right')],
+            negative_sum[-1] - negative_sum[np.searchsorted(negative, profit, side='left')])
+
+    def get_history_floats(self, lasts: np.ndarray) -> np.ndarray:
+        """按价格排序之后用前缀最大值和后缀最小值计算每个成交价的浮动盈亏
+
+        价格高于开始价格的取更低价格的格子里的最大值, 否则取更高价格的格子里的最小值
+        """
+        lasts = np.asarray(lasts, dtype=float)
+        df = self.price_position.sort_values(by='price', kind='mergesort')
+        prices = df['price'].to_numpy(dtype=float)
+        if not len(prices):
+            return np.full(lasts.shape, np.nan)
+        total = df['total_float_profit'].to_numpy(dtype=float)
+        # fmax/fmin跳过NaN, 和pandas的max/min一样
+        prefix_max = np.fmax.accumulate(total)
+        suffix_min = np.fmin.accumulate(total[::-1])[::-1]
+        lower = np.searchsorted(prices, lasts, side='left')
+        upper = np.searchsorted(prices, lasts, side='right')
+        above = np.where(lower > 0, prefix_max[np.maximum(lower - 1, 0)], np.nan)
+        below = np.where(upper < len(prices), suffix_min[np.minimum(upper, len(prices) - 1)], np.nan)
+        return np.where(lasts > self.param['start_price'], above, below)
 
     def get_history_float(self, last):
-        df = self.price_position.copy()
-        if last > self.param['start_price']:
-            profit = df[df['price'] < last]['total_float_profit'].max()
-        else:
-            profit = df[df['price'] > last]['total_float_profit'].min()
-        return profit
+        return self.get_history_floats(np.array([last]))[0]
 
     async def get_order_detail(self, line_data=False):
 
-        all_orders = []
         line = []
         del self.param['price_position']
-        orders: list = await self.ex.get_symbol_history_order_detail(start_time=arrow.get(float(self.param['timestamp']) + 1000), limit=1000)
-        while orders:
-            all_orders.extend(orders)
-            trade_id = orders[-1]['id'] + 1
-            orders = await self.ex.get_symbol_history_order_detail(trade_id)
-
-        df = pd.DataFrame(all_orders)
+        df = await sync_trades(self.ex, arrow.get(float(self.param['timestamp']) + 1000))
         depth = rds.hget(f'{self.ex.symbol.exchange}:TICKER:{self.ex.symbol.market_type}'.upper(), self.ex.symbol.symbol)
         buy_price, sell_price = depth.get('best_bid'), depth.get('best_ask')
         """运行时长"""
@@ -124,7 +187,7 @@ class BalanceCal:
         grid_24_profit = round(df[df['timestamp'] > arrow.now().shift(days=-1).format('YYYY-MM-DD HH:mm:ss')]['profit'].sum(), 1) - grid_24_fee
 
         """计算浮动盈亏"""
-        df['float_profit'] = df['price'].apply(lambda x: self.get_history_float(x))
+        df['float_profit'] = self.get_history_floats(df['price'].to_numpy())
         df['float_profit'] = df['float_profit'].fillna(value=0)
         print(df)
         if line_data:
@@ -1,7 +1,9 @@
 # Everything about cointegration
 import os
 from typing import Dict, Optional, List, Tuple
-from itertools import permutations
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import combinations
+from multiprocessing.shared_memory import SharedMemory
 
 import joblib
 import matplotlib.pyplot as plt
@@ -19,7 +21,9 @@ from db.base_model import sc_wrapper
 from db.cache import RedisHelper
 from db.db_context import engine
 from db.model import SymbolModel, CombinationIndexModel, CombinationIndexSymbolModel
+from db.symbol_registry import symbol_registry
 from util.kline_util import get_kline, get_kline_symbol_market
+from util.rolling_regression_util import RollingMoments, lasso_coef, ridge_coef
 
 
 class CointegrationAnalyser(object):
@@ -50,8 +54,8 @@ class CointegrationAnalyser(object):
         self.end_time = end_date
         self.btc_kline = get_kline(btc_symbol_id, start_date=start_date, end_date=end_date).add_prefix("BTC_")
         self.eth_kline = get_kline(eth_symbol_id, start_date=start_date, end_date=end_date).add_prefix("ETH_")
-        self.symbol_1 = SymbolModel.get_by_id(symbol_id_1)
-        self.symbol_2 = SymbolModel.get_by_id(symbol_id_2)
+        self.symbol_1 = symbol_registry.get_by_id(symbol_id_1)
+        self.symbol_2 = symbol_registry.get_by_id(symbol_id_2)
         self.kline_1 = get_kline(symbol_id=symbol_id_1, start_date=start_date, end_date=end_date)
         self.kline_2 = get_kline(symbol_id=symbol_id_2, start_date=start_date, end_date=end_date)
         self.residual_1 = None
@@ -334,12 +338,16 @@ def analyse_all_combination(name_dict: Dict[str, int], start_time: str, end_time
     test_minutes = {}
     good_pair = set()
     fail_pair = set()
+    short_pair = set()
     for symbol_name_1, symbol_id_1 in name_dict.items():
         for symbol_name_2, symbol_id_2 in name_dict.items():
             if symbol_name_1 == symbol_name_2:
                 continue
             if symbol_name_1 in ["BTCUSDT", "ETHUSDT"] or symbol_name_2 in ["BTCUSDT", "ETHUSDT"]:
                 continue
+            # (A, B) 和 (B, A) 只分析一次, 分析过的组合不用再读取K线
+            if {f"{symbol_name_1}-{symbol_name_2}", f"{symbol_name_2}-{symbol_name_1}"} & (good_pair | fail_pair | short_pair):
+                continue
             train_test_ratio = 0.7
             ca = CointegrationAnalyser(name_dict[symbol_name_1], name_dict[symbol_name_2], start_date=start_time, end_date=end_time, train_test_ratio=train_test_ratio)
             pair_key_1 = f"{ca.symbol_1.symbol}-{ca.symbol_2.symbol}"
@@ -352,6 +360,7 @@ def analyse_all_combination(name_dict: Dict[str, int], start_time: str, end_time
                         good_pair.add(f"{ca.symbol_1.symbol}-{ca.symbol_2.symbol}")
                         test_minutes[f"{ca.symbol_1.symbol}-{ca.symbol_2.symbol}"] = ca.total_minutes
                     else:
+                        short_pair.add(f"{ca.symbol_1.symbol}-{ca.symbol_2.symbol}")
                         logger.warning(f"{ca.symbol_1.symbol}-{ca.symbol_2.symbol} is not enough， number is {ca.total_minutes}")
                 else:
                     fail_pair.add(f"{ca.symbol_1.symbol}-{ca.symbol_2.symbol}")
@@ -361,7 +370,7 @@ def analyse_all_combination(name_dict: Dict[str, int], start_time: str, end_time
 
 
 class CointegrationCalculator(object):
-    def __init__(self, data: pd.DataFrame, symbol_1: str, symbol_2: str, feature_columns: Optional[List[str]] = None, rolling_length: int = 24 * 30 * 3):
+    def __init__(self, data: pd.DataFrame, symbol_1: str, symbol_2: str, feature_columns: Optional[List[str]] = None, rolling_length: int = 24 * 30 * 3, model_type: str = "lasso"):
         """
 
         Args:
@@ -377,6 +386,7 @@ class CointegrationCalculator(object):
             symbol_1: like  "BCH"
             symbol_2: like  "EOS"
             feature_columns: like ["BTC","ETH"]
+            model_type: lasso or ridge
 
         """
         self.df = data
@@ -396,68 +406,21 @@ class CointegrationCalculator(object):
 
         self.result_df = pd.DataFrame()
         self.rolling_length = rolling_length
+        self.model_type = model_type
 
-    def get_residual_model(self, label_column: str, model_type: str = "lasso"):
-        """
-
-        Returns:
-            (model,residual)
+    def fit_residual_model(self, xx: np.ndarray, xy: np.ndarray, n: int, coef: Optional[np.ndarray] = None) -> np.ndarray:
+        """在窗口的充分统计量上拟合 label ~ features 的模型, 和之前的 Lasso(alpha=0.1)/Ridge(alpha=1.0) 结果一样"""
+        if self.model_type == "ridge":
+            return ridge_coef(xx, xy, alpha=1.0)
+        return lasso_coef(xx, xy, n=n, alpha=0.1, coef=coef)
 
-        """
-        try:
-            # TODO: fix me here
-            label = self.train_df[label_column]
-            if model_type == "ridge":
-                model = Ridge(alpha=1.0)
-                model.fit(self.train_df[self.feature_columns], label)
-            else:
-                model = Lasso(alpha=0.1)
-                model.fit(self.train_df[self.feature_columns], label)
-
-            residual = label - model.predict(self.train_df[self.feature_columns])
-            return model, residual
-        except Exception as e:
-            import ipdb;
-            ipdb.set_trace()
-            logger.error(e)
-
-    def calculate_index(self, values):
-        try:
-            # reset train as recent data
-            self.train_df = self.df.loc[values.index]
-            # calculate residual 1 and residual 2
-            if self.train_df.shape[0] < self.rolling_length:
-                return 1
-            self.train_df.dropna(inplace=True)
-
-            self.model_1, self.residual_1 = self.get_residual_model(label_column=self.symbol_1, model_type="lasso")
-            self.model_2, self.residual_2 = self.get_residual_model(label_column=self.symbol_2, model_type="lasso")
-
-            # calculate factor of two residual
-            ols_model = sm.OLS(self.residual_1, self.residual_2)
-            results = ols_model.fit()
-            self.residual_factor = results.params.iloc[0]
-            self.train_df["residual_diff"] = self.residual_1 - self.residual_2 * self.residual_factor
-            a = 1
-            b = -self.residual_factor
-            c = -self.model_1.coef_[0] + self.model_2.coef_[0] * self.residual_factor
-            d = -self.model_1.coef_[1] + self.model_2.coef_[1] * self.residual_factor
-            e = -self.model_1.intercept_ + self.model_2.intercept_ * self.residual_factor
-            self.train_df["a"] = a
-            self.train_df["b"] = b
-            self.train_df["c"] = c
-            self.train_df["d"] = d
-            self.train_df["e"] = e
-            self.result_df = self.result_df.append(self.train_df.iloc[-1])
-            return 1
-
-        except Exception as e:
-            logger.error(e)
-            return 1
-
-    def calculate(self,use_cache=True) -> pd.DataFrame:
+    def calculate(self, use_cache=True) -> pd.DataFrame:
         """ rolling and generate results dataframe
 
+        每个窗口用两个symbol分别对feature_columns做回归得到残差, 再用两个残差做不带截距的OLS得到残差的系数。
+        窗口滑动的时候只增量更新 [symbol_1, symbol_2, features] 的 X'X 和 X'y, 回归和残差的OLS都直接在上面计算,
+        结果写进预先分配好的数组里。
+
         Returns:
             results dataframe
 
@@ -470,8 +433,70 @@ class CointegrationCalculator(object):
             df = pd.read_csv(cache_path, index_col=0, parse_dates=True, infer_datetime_format=True)
             return df
 
-        tqdm.pandas(total=self.df[self.symbol_1].rolling(self.rolling_length, min_periods=24 * 30).count().shape[0])
-        self.df[self.symbol_1].rolling(self.rolling_length, min_periods=24 * 30).progress_apply(self.calculate_index)
+        columns = [self.symbol_1, self.symbol_2] + self.feature_columns
+        values = self.df[columns].to_numpy(dtype=float)
+        # 窗口里任何一列是空值的行都不参与计算
+        valid = self.df.notna().all(axis=1).to_numpy()
+        # 和 rolling(min_periods=24 * 30) 一样, symbol_1 非空的数量不够时不计算
+        filled = np.cumsum(self.df[self.symbol_1].notna().to_numpy())
+        min_periods = 24 * 30
+        length = self.rolling_length
+        total = values.shape[0]
+        features = slice(2, len(columns))
+
+        # 每个窗口一行结果
+        rows = np.zeros(total, dtype=np.int64)
+        # a, b, feature系数(c, d), e
+        factors = np.full((total, len(columns) + 1), np.nan)
+        residual_diff = np.full(total, np.nan)
+        count = 0
+
+        if valid.any():
+            moments = RollingMoments(dim=len(columns), reference=values[valid.argmax()])
+            coef_1, coef_2 = None, None
+            last_valid = -1
+            for i in tqdm(range(total)):
+                if valid[i]:
+                    moments.add(values[i])
+                    last_valid = i
+                if i >= length and valid[i - length]:
+                    moments.remove(values[i - length])
+                if i < length - 1 or filled[i] - (filled[i - length] if i >= length else 0) < min_periods:
+                    continue
+                if (i + 1) % length == 0:
+                    # 定期重新计算,避免增量更新积累误差
+                    window = values[i - length + 1:i + 1]
+                    moments.reset(window[valid[i - length + 1:i + 1]])
+                if moments.n < 2 or last_valid <= i - length:
+                    continue
+
+                mean = moments.mean()
+                scatter = moments.scatter()
+                xx = scatter[features, features]
+                coef_1 = self.fit_residual_model(xx, scatter[features, 0], moments.n, coef_1)
+                coef_2 = self.fit_residual_model(xx, scatter[features, 1], moments.n, coef_2)
+                intercept_1 = mean[0] - mean[features] @ coef_1
+                intercept_2 = mean[1] - mean[features] @ coef_2
+
+                # 残差是 z 的线性组合, 残差之间的内积可以直接用 X'X 算出来
+                weight_1 = np.r_[1, 0, -coef_1]
+                weight_2 = np.r_[0, 1, -coef_2]
+                residual_square = weight_2 @ scatter @ weight_2
+                if residual_square <= 0:
+                    continue
+                residual_factor = weight_1 @ scatter @ weight_2 / residual_square
+
+                factors[count] = np.r_[1, -residual_factor, -coef_1 + coef_2 * residual_factor, -intercept_1 + intercept_2 * residual_factor]
+                row = values[last_valid]
+                residual_diff[count] = (row[0] - intercept_1 - row[features] @ coef_1) - (row[1] - intercept_2 - row[features] @ coef_2) * residual_factor
+                rows[count] = last_valid
+                count += 1
+
+        self.result_df = self.df.iloc[rows[:count]].copy()
+        self.result_df["residual_diff"] = residual_diff[:count]
+        for j, name in enumerate(["a", "b", "c", "d", "e"]):
+            self.result_df[name] = factors[:count, j]
+
         # calculate real index
         self.result_df["real_index"] = self.result_df[self.symbol_1] * self.result_df["a"] + self.result_df["b"] * self.result_df[self.symbol_2] + self.result_df[self.feature_columns[0]] * self.result_df["c"] + self.result_df[
             "d"] * \
@@ -490,46 +515,118 @@ class CointegrationCalculator(object):
         return self.result_df
 
 
-def generate_all_combination_info(symbols: List[str], start_time: str, end_time: str):
+def load_close_matrix(symbols: List[str], start_time: str, end_time: str, rule: str = "1H") -> pd.DataFrame:
+    """每个交易对只读取一次K线, 按rule取最后的收盘价, 合并成一个矩阵
+
+    Returns:
+        index是时间, 每一列是一个交易对的收盘价
+
+    """
+    closes = {}
+    for symbol in dict.fromkeys(symbols):
+        kline = get_kline_symbol_market(symbol=symbol, start_date=start_time, end_date=end_time)
+        closes[symbol] = kline["Close"].resample(rule=rule).last()
+    return pd.concat(closes, axis=1)
+
+
+# 进程池里每个进程共享的收盘价矩阵
+_shared_close = {}
+
+
+def _init_pair_worker(shm_name: str, shape: Tuple[int, int], index: pd.Index, columns: List[str]) -> None:
+    shm = SharedMemory(name=shm_name)
+    # 保存引用, 不然共享内存会在函数返回后被关闭
+    _shared_close["shm"] = shm
+    _shared_close["df"] = pd.DataFrame(np.ndarray(shape, dtype=float, buffer=shm.buf), index=index, columns=columns, copy=False)
+
+
+def screen_pair(pair: Tuple[str, str], feature_columns: List[str]) -> dict:
+    """在共享的收盘价矩阵上对一个组合做滚动协整分析和ADF检验"""
+    symbol_1, symbol_2 = pair
+    data = _shared_close["df"][[symbol_1, symbol_2] + feature_columns]
+    full = data.dropna()
+    result = {"symbol_1": symbol_1, "symbol_2": symbol_2, "rows": 0, "adf_stat": np.nan, "critical_value": np.nan, "is_stationary": False}
+    if full.empty:
+        return result
+    # 从几个交易对都有数据的时候开始
+    data = data.loc[full.index[0]:full.index[-1]]
+    result["rows"] = data.shape[0]
+    if data.shape[0] <= 24 * 30 * 3:
+        return result
+    calculator = CointegrationCalculator(data=data, symbol_1=symbol_1, symbol_2=symbol_2, feature_columns=feature_columns)
+    # 缓存文件只按组合命名, 不同时间段的筛选不能读之前的缓存, 重新计算之后会覆盖缓存给 load_screened_results 读取
+    result_df = calculator.calculate(use_cache=False)
+    residual_test_result = ADF(result_df['residual_diff'])
+    result["adf_stat"] = residual_test_result.stat
+    result["critical_value"] = residual_test_result.critical_values['1%']
+    result["is_stationary"] = bool(residual_test_result.stat <= residual_test_result.critical_values['1%'])
+    return result
+
+
+def generate_all_combination_info(symbols: List[str], start_time: str, end_time: str, workers: Optional[int] = None) -> pd.DataFrame:
+    """筛选所有组合里残差平稳的组合
+
+    所有交易对的收盘价只读取一次, 放进共享内存交给进程池, (A, B) 和 (B, A) 只分析一次, 价格大的在前面。
+    结果保存到 AnalyseConfig.PAIR_SCREENING_RESULT_PATH , 每个组合的分析结果都会重新计算并覆盖 CointegrationCalculator 的缓存,
+    可以用 load_screened_results 读取给 CombinationAlgo 使用。
+
+    Args:
+        symbols: 币种, like ["LTC", "EOS"]
+        start_time: 开始时间
+        end_time: 结束时间
+        workers: 进程数, 默认是 AnalyseConfig.SCREEN_WORKERS
+
+    Returns:
+        每个组合的ADF检验结果
+
+    """
     logger.info(f"开始分析以下交易对:{symbols}")
-    all_combinations: List[Tuple[str]] = list(permutations(symbols, 2))
-    tradeable_combinations = {}
-    for combination in all_combinations:
-        symbol_1 = combination[0] + "USDT"
-        symbol_2 = combination[1] + "USDT"
-        logger.info(f"开始分析{symbol_1}-{symbol_2}......")
-
-        kline_1 = get_kline_symbol_market(symbol=symbol_1, start_date=start_time, end_date=end_time)
-        kline_2 = get_kline_symbol_market(symbol=symbol_2, start_date=start_time, end_date=end_time)
-        btc_kline = get_kline_symbol_market(symbol="BTCUSDT", start_date=start_time, end_date=end_time)
-        eth_kline = get_kline_symbol_market(symbol="ETHUSDT", start_date=start_time, end_date=end_time)
-
-        data = pd.concat([x[["Close"]] for x in (kline_1, kline_2, btc_kline, eth_kline)], axis=1)
-        data.columns = [symbol_1, symbol_2, "BTCUSDT", "ETHUSDT"]
-        data.dropna(inplace=True)
-        logger.info(f"总条数:{data.index.values.shape[0]},开始时间：{data.index.values[0]},结束时间:{data.index.values[-1]}")
-
-        data = data.resample(rule="1H").last()
-        if data.index.values.shape[0] > 24 * 30 * 3:
-            calculator = CointegrationCalculator(data=data, symbol_1=symbol_1, symbol_2=symbol_2, feature_columns=["BTCUSDT", "ETHUSDT"])
-            result_df = calculator.calculate()
-            residual_test_result = ADF(result_df['residual_diff'])
-            logger.info("Residual Stationary Test:")
-            logger.info(f"\n{residual_test_result}")
-            if residual_test_result.stat > residual_test_result.critical_values['1%']:
-                # if residual_test_result.stat > residual_test_result.critical_values['1%'] or not np.allclose(residual_test_result.stat, residual_test_result.critical_values['1%'], atol=0.5):
-                logger.error(f"{symbol_1}-{symbol_2} residual Diff is not Stationary!!! :( ")
-                is_stationary = False
-            else:
-                logger.info(f"{symbol_1}-{symbol_2} residual Diff is Stationary! :) result is :")
-                is_stationary = True
-            if is_stationary:
-                tradeable_combinations[(calculator.symbol_1, calculator.symbol_2)] = residual_test_result.stat
-
-    logger.info(f" total combinations:{tradeable_combinations} ")
-    logger.info(f" tradeable combinations:{tradeable_combinations} ")
-    logger.info(f" tradeable combinations:{set(tradeable_combinations)} ")
-    df = pd.DataFrame([{"symbol_pair": str(k), "value": v} for k, v in tradeable_combinations.items()])
-    import ipdb;
-    ipdb.set_trace()
-    print(df.sort_values("value"))
+    feature_columns = ["BTCUSDT", "ETHUSDT"]
+    symbol_names = list(dict.fromkeys(symbol + "USDT" for symbol in symbols))
+    close = load_close_matrix(symbol_names + feature_columns, start_time=start_time, end_time=end_time)
+    means = close.mean()
+    pairs = [tuple(sorted(pair, key=lambda x: -means[x])) for pair in combinations(symbol_names, 2)]
+    logger.info(f"总条数:{close.shape[0]},开始时间：{close.index[0]},结束时间:{close.index[-1]},组合数量:{len(pairs)}")
+
+    values = close.to_numpy(dtype=float)
+    shm = SharedMemory(create=True, size=max(values.nbytes, 1))
+    results = []
+    try:
+        np.ndarray(values.shape, dtype=float, buffer=shm.buf)[:] = values
+        with ProcessPoolExecutor(max_workers=workers or AnalyseConfig.SCREEN_WORKERS, initializer=_init_pair_worker,
+                                 initargs=(shm.name, values.shape, close.index, list(close.columns))) as executor:
+            futures = {executor.submit(screen_pair, pair, feature_columns): pair for pair in pairs}
+            for future in tqdm(as_completed(futures), total=len(futures)):
+                symbol_1, symbol_2 = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(f"{symbol_1}-{symbol_2} 分析失败:{e}")
+                    continue
+                if result["is_stationary"]:
+                    logger.info(f"{symbol_1}-{symbol_2} residual Diff is Stationary! :) result is :{result['adf_stat']}")
+                else:
+                    logger.info(f"{symbol_1}-{symbol_2} residual Diff is not Stationary!!! :( ")
+                results.append(result)
+    finally:
+        shm.close()
+        shm.unlink()
+
+    df = pd.DataFrame(results, columns=["symbol_1", "symbol_2", "rows", "adf_stat", "critical_value", "is_stationary"])
+    df.sort_values("adf_stat", inplace=True)
+    df.to_csv(AnalyseConfig.PAIR_SCREENING_RESULT_PATH, index=False)
+    logger.info(f" tradeable combinations:\n{df[df.is_stationary]}")
+    logger.info(f"筛选结果保存在:{AnalyseConfig.PAIR_SCREENING_RESULT_PATH}")
+    return df
+
+
+def load_screened_results(path: str = AnalyseConfig.PAIR_SCREENING_RESULT_PATH) -> Dict[Tuple[str, str], pd.DataFrame]:
+    """读取筛选出来的平稳组合的分析结果, 格式和 CombinationAlgo 的 analyse_results 一样"""
+    screening = pd.read_csv(path)
+    analyse_results = {}
+    for row in screening[screening.is_stationary].itertuples():
+        cache_path = os.path.join(BASE_DIR, "data", f"analyse_{row.symbol_1}-{row.symbol_2}.csv")
+        analyse_result = pd.read_csv(cache_path, index_col=0, parse_dates=True, infer_datetime_format=True)
+        analyse_result.dropna(inplace=True)
+        analyse_results[(row.symbol_1, row.symbol_2)] = analyse_result[~analyse_result.index.duplicated()]
+    return analyse_results
@@ -1,7 +1,8 @@
 """DataFrame Related
 """
-from typing import Iterable, Union, Tuple
+from typing import Iterable, Union, Tuple, Dict
 
+import numpy as np
 import pandas as pd
 
 
@@ -75,3 +76,57 @@ def get_column_frequent(df: pd.DataFrame, column_name: str):
 
     most_frequent_value = df[column_name].value_counts().nlargest(n=1).index[0]
     return most_frequent_value
+
+
+def aggregate_by_spec(df: pd.DataFrame, groups: Union[np.ndarray, pd.Series], spec: Dict[str, tuple]) -> pd.DataFrame:
+    """按照声明的规则对每个分组做聚合, 全部用groupby的向量化聚合完成, 不对每个分组调用python函数
+
+    Args:
+        df: 原始数据
+        groups: 每一行属于哪个分组
+        spec: 结果的列名 -> (原始列名, 聚合方式) 或者 (原始列名, 聚合方式, 空值的填充值)
+            聚合方式:
+                first/last: 分组里按位置的第一条/最后一条, 和空值无关
+                first_valid/last_valid: 分组里第一个/最后一个非空值, 全是空值的时候是空值
+                min/max/sum: 忽略空值
+                nunique: 不同值的数量, 空值也算一个值
+                frequent: 出现次数最多的值, 和 get_column_frequent 一样, 全是空值的时候object列返回unknown, 其他返回0.0
+
+    Returns:
+        以分组为index, 列的顺序和spec一样
+
+    """
+    grouped = df.groupby(groups, sort=True)
+    result = {}
+    for name, rule in spec.items():
+        column, how = rule[0], rule[1]
+        if how == "first":
+            value = grouped[column].nth(0)
+        elif how == "last":
+            value = grouped[column].nth(-1)
+        elif how == "first_valid":
+            value = grouped[column].first()
+        elif how == "last_valid":
+            value = grouped[column].last()
+        elif how in ("min", "max", "sum"):
+            value = grouped[column].agg(how)
+        elif how == "nunique":
+            value = grouped[column].nunique(dropna=False)
+        elif how == "frequent":
+            # 和value_counts一样, 次数一样的时候取分组里先出现的值
+            position = pd.Series(np.arange(df.shape[0]), index=df.index)
+            counts = position.groupby([groups, df[column]]).agg(["size", "min"])
+            counts = counts.sort_values(["size", "min"], ascending=[False, True])
+            value = counts[~counts.index.get_level_values(0).duplicated()]
+            value = pd.Series(value.index.get_level_values(1), index=value.index.get_level_values(0))
+        else:
+            raise ValueError(f"不支持的聚合方式:{how}")
+        result[name] = value
+
+    result = pd.DataFrame(result, index=grouped.size().index)
+    for name, rule in spec.items():
+        if rule[1] == "frequent":
+            result[name] = result[name].fillna("unknown" if df[rule[0]].dtype == "object" else 0.0)
+        elif len(rule) > 2:
+            result[name] = result[name].fillna(rule[2])
+    return result
@@ -9,6 +9,7 @@ from api.basis import logger
 from api.exchange import SimpleExchangeAPI
 from base.consts import ExecutionConfig
 from db.model import SymbolModel
+from db.symbol_registry import symbol_registry
 
 
 def exception_handler(loop, context):
@@ -18,8 +19,8 @@ def exception_handler(loop, context):
 class MultipleOrderExecutor(object):
     def __init__(self):
         logger.info("初始化交易执行服务")
-        self.all_symbol = {symbol.id: symbol.symbol for symbol in SymbolModel.get_all_data()}
-        self.all_symbol_info: Dict[str:SymbolModel] = {symbol.id: symbol for symbol in SymbolModel.get_all_data()}
+        self.all_symbol_info: Dict[int, SymbolModel] = {symbol.id: symbol for symbol in symbol_registry.all()}
+        self.all_symbol = {symbol_id: symbol.symbol for symbol_id, symbol in self.all_symbol_info.items()}
         logger.info("初始化交易执行服务成功!")
 
     async def target_current_diff(self, api: SimpleExchangeAPI, target_amount: float) -> (float, str):
@@ -1,8 +1,10 @@
-import time
-from threading import Thread
+import json
+from datetime import datetime
+from typing import Dict, Iterator, Tuple
 
 import numpy as np
 import pandas as pd
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from tqdm import tqdm
 
@@ -13,6 +15,14 @@ from util.indicator_util import Indicator
 
 
 class IndicatorFatcor:
+    """把一个交易对的MA/RSI/STD因子写入FactorTime
+
+    每个周期的所有窗口都在内存里计算, 再按data_type分块批量写入, 重复写入的数据按主键覆盖。
+    已经写入过的因子只从最后一根K线开始写(最后一根K线写入的时候可能还没有走完), 每天重跑只写入新的K线。
+    因子仍然用start_date之后的全部K线计算, 所以和一次性写入的结果一样。
+    """
+    TIMEFRAMES = ['5T', '15T', '30T', '1H', '2H', '6H', '12H', '1D']
+
     def __init__(self, symbol_id: int = 866, start_date: str = '2019-01-01 00:00:00', end_date: str = '2022-01-01 00:00:00'):
         self.df = KlineModel.get_symbol_kline_df(symbol_id=symbol_id, timeframe='1m', start_date=start_date, end_date=end_date)
         self.df['candle_begin_time'] = pd.to_datetime(self.df['candle_begin_time'])
@@ -20,49 +30,44 @@ class IndicatorFatcor:
         self.symbol_id = symbol_id
         logger.info(f"开始时间：{start_date},结束时间：{end_date}")
 
-    @sc_wrapper
-    def ma(self, timeframe, close, sc: Session = None):
-        for n in tqdm(np.arange(10, 500, 10)):
+    def factors(self, timeframe: str, close: pd.Series) -> Iterator[Tuple[str, pd.Series]]:
+        """一个周期所有的因子, 返回(data_type, 因子)"""
+        for n in np.arange(10, 500, 10):
             if (n > 200) & (timeframe in ['12H', '1D']):
                 continue
-            temp = Indicator.MA(close, n)
-            temp = temp.round(5)
-            data_type = f"{self.symbol_id}:ma:{timeframe}:{n}".upper()
-            for candle_begin_time, data in temp.items():
-                if not pd.isna(data):
-                    FactorTime.update_data(candle_begin_time=str(candle_begin_time), data_type=data_type, data=data, sc=sc)
-
-    @sc_wrapper
-    def rsi(self, timeframe, close, sc: Session = None):
-        for n in tqdm(np.arange(7, 20, 1)):
-            temp = Indicator.RSI(close, n)
-            temp = temp.round(5)
-            data_type = f"{self.symbol_id}:rsi:{timeframe}:{n}".upper()
-            for candle_begin_time, data in temp.items():
-                if not pd.isna(data):
-                    FactorTime.update_data(candle_begin_time=str(candle_begin_time), data_type=data_type, data=data, sc=sc)
+            yield f"{self.symbol_id}:ma:{timeframe}:{n}".upper(), Indicator.MA(close, n)
+        for n in np.arange(7, 20, 1):
+            yield f"{self.symbol_id}:rsi:{timeframe}:{n}".upper(), Indicator.RSI(close, n)
+        for n in np.arange(10, 500, 10):
+            yield f"{self.symbol_id}:std:{timeframe}:{n}".upper(), Indicator.STDDEV(close, n)
 
     @sc_wrapper
-    def std(self, timeframe, close, sc: Session = None):
-        for n in tqdm(np.arange(10, 500, 10)):
-            temp = Indicator.STDDEV(close, n)
-            temp = temp.round(5)
-            data_type = f"{self.symbol_id}:std:{timeframe}:{n}".upper()
-            for candle_begin_time, data in temp.items():
-                if not pd.isna(data):
-                    FactorTime.update_data(candle_begin_time=str(candle_begin_time), data_type=data_type, data=data, sc=sc)
-                    time.sleep(1)
+    def last_times(self, sc: Session = None) -> Dict[str, datetime]:
+        """每个因子已经写入的最后一根K线的时间"""
+        return dict(sc.query(FactorTime.data_type, func.max(FactorTime.candle_begin_time)).filter(
+            FactorTime.data_type.like(f"{self.symbol_id}:%")).group_by(FactorTime.data_type).all())
 
-    def to_db(self):
-        for timeframe in ['5T', '15T', '30T', '1H', '2H', '6H', '12H', '1D']:
+    def to_db(self) -> int:
+        last_times = self.last_times()
+        count = 0
+        for timeframe in self.TIMEFRAMES:
             df_ = Indicator.candle_transfer(self.df.copy(), timeframe)
             df_.fillna(method='pad', inplace=True)
-            Thread(target=self.ma, args=(timeframe, df_['close'])).start()
-            Thread(target=self.rsi, args=(timeframe, df_['close']),).start()
-            Thread(target=self.std, args=(timeframe, df_['close']),).start()
+            for data_type, temp in tqdm(list(self.factors(timeframe, df_['close'])), desc=f"{self.symbol_id}:{timeframe}"):
+                temp = temp.round(5).dropna()
+                last_time = last_times.get(data_type)
+                if last_time is not None:
+                    temp = temp[temp.index >= last_time]
+                count += FactorTime.bulk_upsert([{
+                    'candle_begin_time': candle_begin_time.to_pydatetime(),
+                    'data_type': data_type,
+                    'data': json.dumps(data),
+                } for candle_begin_time, data in temp.items()])
+        logger.info(f"{self.symbol_id}因子入库完毕,共计{count}条")
+        return count
 
 
 if __name__ == '__main__':
-    Thread(target=IndicatorFatcor(symbol_id=866).to_db).start()
-    Thread(target=IndicatorFatcor(symbol_id=867).to_db).start()
-    Thread(target=IndicatorFatcor(symbol_id=3020).to_db).start()
+    # SQLite同一时间只能有一个写入, 按交易对依次写入
+    for symbol_id in [866, 867, 3020]:
+        IndicatorFatcor(symbol_id=symbol_id).to_db()
@@ -1,15 +1,19 @@
+import functools
 import os
+from datetime import datetime
 
 import pandas as pd
 
 from base.config import BASE_DIR, logger
-from db.model import KlineModel, SymbolModel
+from db.kline_store import kline_store
+from db.model import KlineModel
+from db.symbol_registry import symbol_registry
 
 
 def get_kline_symbol_market(start_date: str = '2019-01-01 00:00:00', end_date: str = '2022-10-01 00:00:00',
                             timeframe="1m", use_cache=True, symbol: str = "", market_type="spot",
                             exchange: str = "binance") -> pd.DataFrame:
-    symbol = SymbolModel.get_symbol(symbol=symbol, market_type=market_type, exchange=exchange)
+    symbol = symbol_registry.get_symbol(symbol=symbol, market_type=market_type, exchange=exchange)
     logger.info(f"开始获取K线数据{symbol.symbol}-{market_type}-{exchange}-{symbol.id}")
     if not symbol:
         raise Exception(f"f没有找到对应的交易对{symbol}-{market_type}-{exchange}")
@@ -21,7 +25,7 @@ def get_local_kline(symbol_id: int = 0, symbol_name: str = "", start_date: str =
                     end_date: str = '2022-10-01 ' \
                                     '00:00:00',
                     timeframe="1m", use_cache=True) -> pd.DataFrame:
-    symbol = SymbolModel.get_symbol(exchange="binance", market_type="spot", symbol=symbol_name)
+    symbol = symbol_registry.get_symbol(exchange="binance", market_type="spot", symbol=symbol_name)
 
     # 2021/06/15 02:12:21 binance_api.py[line:134] INFO: 保存ETHBTC到本地成功,
     # 路径:/Users/mark/Dropbox/code/aibitgo/cache/855___2018-12-30-00:00:00___2021-06-10-00:00:00___1m.csv
@@ -38,6 +42,22 @@ def get_local_kline(symbol_id: int = 0, symbol_name: str = "", start_date: str =
         raise Exception(f"没有找到对应数据:{filename}")
 
 
+def get_db_kline(symbol_id: int, timeframe: str, start_date, end_date) -> pd.DataFrame:
+    """从数据库读取[start_date, end_date]的K线"""
+    df = KlineModel.get_symbol_kline_df(symbol_id, timeframe=timeframe,
+                                        start_date=pd.Timestamp(start_date).strftime("%Y-%m-%d %H:%M:%S"),
+                                        end_date=pd.Timestamp(end_date).strftime("%Y-%m-%d %H:%M:%S"))
+    if df.shape[0] == 0:
+        return pd.DataFrame(columns=["Open", "High", "Low", "Close", "Volume"],
+                            index=pd.DatetimeIndex([], name="candle_begin_time"))
+    df['candle_begin_time'] = pd.to_datetime(df['candle_begin_time'])
+    df.set_index('candle_begin_time', inplace=True)
+    df.sort_index(inplace=True)
+    df.rename(columns={"open": "Open", "high": "High", "low": "Low", "close": "Close", "volume": "Volume"},
+              errors="raise", inplace=True)
+    return df[["Open", "High", "Low", "Close", "Volume"]].astype(float)
+
+
 def get_kline(symbol_id: int = 0, symbol_name: str = "", start_date: str = '2020-01-01 00:00:00',
               end_date: str = '2022-10-01 ' \
                               '00:00:00',
@@ -45,42 +65,31 @@ def get_kline(symbol_id: int = 0, symbol_name: str = "", start_date: str = '2020
     logger.info(f"开始获取K线数据,symbol id:{symbol_id}, symbol name:{symbol_name}")
 
     if not symbol_name:
-        symbol = SymbolModel.get_by_id(id=symbol_id)
+        symbol = symbol_registry.get_by_id(symbol_id)
     else:
-        symbol = SymbolModel.get_symbol(exchange="binance", market_type="spot", symbol=symbol_name)
+        symbol = symbol_registry.get_symbol(exchange="binance", market_type="spot", symbol=symbol_name)
 
     if not symbol:
         raise Exception(f"没有在symbol表找到对应的symbol_id:{symbol_id}")
 
     # for symbol from symbol name
     symbol_id = symbol.id
-    filename = f"{symbol_id}___{start_date}___{end_date}___{timeframe}.csv".replace(" ", "-")
-    cache_path = os.path.join(BASE_DIR, "cache", filename)
-    if os.path.isfile(cache_path) and use_cache:
-        logger.info(f"从缓存中读取k线数据: {cache_path}...")
-        df = pd.read_csv(cache_path, index_col=0, parse_dates=True, infer_datetime_format=True)
+    end_date = end_date or datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+    if use_cache:
+        logger.info(f"从本地K线存储读取k线数据...")
+        df = kline_store.load(symbol_id, timeframe, start_date, end_date,
+                              loader=functools.partial(get_db_kline, symbol_id, timeframe))
+    else:
+        logger.info(f"从数据库读取k线数据...")
+        df = get_db_kline(symbol_id, timeframe, start_date, end_date)
+    if df.shape[0] > 0:
         df.name = symbol.symbol
-        logger.info(f"从缓存中读取k线数据成功")
+        logger.info(f"读取k线数据成功,共计{df.shape[0]}条记录")
         return df
     else:
-        logger.info(f"从数据库读取k线数据...")
-        query = KlineModel.get_symbol_kline(symbol_id, timeframe=timeframe, start_date=start_date, end_date=end_date)
-        df = pd.DataFrame([d.to_dict() for d in query])
-        if df.shape[0] > 0:
-            df['candle_begin_time'] = pd.to_datetime(df['candle_begin_time'])
-            df.set_index('candle_begin_time', inplace=True)
-            df.rename(columns={"open": "Open", "high": "High", "low": "Low", "close": "Close", "volume": "Volume"},
-                      errors="raise", inplace=True)
-            df = df[["Open", "High", "Low", "Close", "Volume"]]
-            if use_cache:
-                df.to_csv(cache_path)
-            df.name = symbol.symbol
-            logger.info(f"从数据库中读取k线数据成功")
-            return df
-        else:
-            raise Exception(f"没有从数据库中找到数据symbol_id: {symbol_id} symbol_name:{symbol_name} "
-                            f"-{start_date}"
-                            f"-{end_date}")
+        raise Exception(f"没有从数据库中找到数据symbol_id: {symbol_id} symbol_name:{symbol_name} "
+                        f"-{start_date}"
+                        f"-{end_date}")
 
 
 def get_basis_kline(filename) -> pd.DataFrame:
@@ -1,3 +1,6 @@
+from typing import Tuple
+
+import numpy as np
 import pandas as pd
 
 from util.kline_util import get_kline
@@ -6,14 +9,110 @@ pd.set_option('display.max_columns', 500)
 pd.set_option('display.width', 1000)
 
 
+# 按什么累计来切分K线: 成交量, 成交额, 分钟K线的根数
+BAR_MEASURES = ("volume", "dollar", "tick")
+DEFAULT_AGG_INFO = {"Open": "first", "High": "max", "Low": "min", "Close": "last", "Volume": "sum", "candle_begin_time": "first"}
+PRICE_COLUMNS = ("Open", "High", "Low", "Close")
+
+
+def bar_measure(df: pd.DataFrame, by: str = "volume") -> np.ndarray:
+    """每一行对K线累计量的贡献"""
+    if by == "volume":
+        return df["Volume"].to_numpy(dtype=float)
+    if by == "dollar":
+        return (df["Close"] * df["Volume"]).to_numpy(dtype=float)
+    if by == "tick":
+        return np.ones(df.shape[0])
+    raise ValueError(f"不支持的K线类型:{by}, 只能是{BAR_MEASURES}")
+
+
+def volume_bar_fragments(df: pd.DataFrame, threshold: float, by: str = "volume", split_columns=("Volume",),
+                         price_columns=PRICE_COLUMNS) -> Tuple[pd.DataFrame, np.ndarray]:
+    """把time-based k线 切成属于各个volume-based k线的片段
+
+    每一行在累计量上占据 (累计量 - 本行的量, 累计量] 这一段, 第k根K线是 (k * threshold, (k + 1) * threshold],
+    跨过K线边界的行按比例拆成几段, split_columns里的列按比例分配, 其余的列原样复制。
+    结果的行数是 原始行数 + K线数量, 不会像按成交量explode那样一个成交量一行。
+    按成交量explode的时候没有成交量的分钟会被丢掉, 这里保留这些行(上面可能有新闻等数据), 但是price_columns设成空值,
+    不参与K线的开高低收, 聚合的时候开盘价和收盘价要取第一个/最后一个非空值。
+    没有成交量的行属于下一根K线, 最后一根有成交量的K线之后的行没有K线, 直接去掉。
+
+    Args:
+        df: 时间based df
+        threshold: 每根K线的成交量/成交额/分钟数
+        by: volume, dollar 或者 tick
+        split_columns: 需要按比例拆分的列
+        price_columns: 没有成交量的行需要设成空值的列
+
+    Returns:
+        片段的df, 每个片段属于第几根K线
+
+    """
+    if threshold <= 0:
+        raise ValueError(f"threshold必须大于0:{threshold}")
+    measure = bar_measure(df, by)
+    end = np.cumsum(measure)
+    begin = end - measure
+    # 浮点数累加的误差不能多切出来一段很小的片段
+    eps = 1e-9
+    first_bar = np.floor(begin / threshold + eps).astype(np.int64)
+    last_bar = np.maximum(np.ceil(end / threshold - eps).astype(np.int64) - 1, first_bar)
+    counts = last_bar - first_bar + 1
+
+    rows = np.repeat(np.arange(df.shape[0]), counts)
+    # 每个片段是所在行的第几段
+    offsets = np.arange(rows.shape[0]) - np.repeat(np.cumsum(counts) - counts, counts)
+    bars = first_bar[rows] + offsets
+    # 最后一笔成交之后没有成交量的行只会组成一根全是空值的K线
+    positive = measure > 0
+    keep = bars <= (last_bar[positive].max() if positive.any() else -1)
+    rows, bars = rows[keep], bars[keep]
+
+    fragments = df.iloc[rows].copy()
+    if rows.shape[0] != df.shape[0]:
+        low = np.maximum(begin[rows], bars * threshold)
+        high = np.minimum(end[rows], (bars + 1) * threshold)
+        row_measure = measure[rows]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            portion = np.where(row_measure > 0, (high - low) / row_measure, 1)
+        for column in split_columns:
+            fragments[column] = fragments[column].to_numpy() * portion
+    zero = measure[rows] == 0
+    if zero.any():
+        for column in price_columns:
+            if column in fragments.columns:
+                fragments[column] = np.where(zero, np.nan, fragments[column].to_numpy(dtype=float))
+    return fragments, bars
+
+
+def volume_bars(df: pd.DataFrame, threshold: float, by: str = "volume", agg_info=None, split_columns=("Volume",)) -> pd.DataFrame:
+    """把time-based k线 聚合成volume/dollar/tick-based k线
+
+    Args:
+        df: 时间based df, 以candle_begin_time为index或者有candle_begin_time这一列
+        threshold: 每根K线的成交量/成交额/分钟数
+        by: volume, dollar 或者 tick
+        agg_info: 其他字段如何进行聚合的规则, 和DataFrame.agg的参数一样
+        split_columns: 需要按比例拆分的列
+
+    Returns:
+        以每根K线第一个片段的candle_begin_time为index的df
+
+    """
+    if "candle_begin_time" not in df.columns:
+        df = df.rename_axis("candle_begin_time").reset_index()
+    # 和按成交量explode一样, 没有成交量的分钟不属于任何K线
+    df = df[bar_measure(df, by) > 0]
+    fragments, bars = volume_bar_fragments(df, threshold, by=by, split_columns=split_columns)
+    rule = dict(agg_info or {})
+    rule.update(DEFAULT_AGG_INFO)
+    result = fragments.groupby(bars).agg(rule)
+    result.set_index("candle_begin_time", inplace=True)
+    return result
+
+
 def volume_resample(df, volume):
-    df['sum_volume'] = df['Volume'].cumsum() + 2147483647
-    df['sum_volume_time'] = pd.to_datetime(df['sum_volume'], unit='s')
-    df = df.reset_index()
-    df.set_index(['sum_volume_time'], inplace=True)
-    df = df.resample(rule=f'{volume}S').agg({"Open": "first", "High": "max", "Low": "min", "Close": "last", "Volume": "sum", 'candle_begin_time': 'first'})
-    df.set_index('candle_begin_time', inplace=True)
-    return df
+    return volume_bars(df, volume)
 
 
 def volume_info_resample(df: pd.DataFrame, volume: int, agg_info=None):
@@ -27,31 +126,12 @@ def volume_info_resample(df: pd.DataFrame, volume: int, agg_info=None):
     Returns:
 
     """
-    # never use mutable variable as default param!
-    if not agg_info:
-        agg_info = {}
-    df["Volumes"] = df["Volume"].apply(lambda x: [1 for x in range(int(x))])
-    df = df.explode("Volumes")
-    del df["Volumes"]
-    df["Volume"] = 1
-    default_agg_info = {"Open": "first", "High": "max", "Low": "min", "Close": "last", "Volume": "sum", 'candle_begin_time': 'first'}
-    agg_info.update(default_agg_info)
-    df['sum_volume'] = df['Volume'].cumsum() + 2147483647
-    df['sum_volume_time'] = pd.to_datetime(df['sum_volume'], unit='s')
-    df = df.reset_index()
-    df.set_index(['sum_volume_time'], inplace=True)
-    df = df.resample(rule=f'{volume}S').agg(agg_info)
-    df.set_index('candle_begin_time', inplace=True)
-    return df
+    return volume_bars(df, volume, agg_info=agg_info)
 
 
-def volume_df(symbol_id, start_time: str, end_time: str, volume=5000) -> pd.DataFrame:
+def volume_df(symbol_id, start_time: str, end_time: str, volume=5000, by: str = "volume") -> pd.DataFrame:
     df = get_kline(symbol_id=symbol_id, start_date=start_time, end_date=end_time)
-    df["Volumes"] = df["Volume"].apply(lambda x: [1 for x in range(int(x))])
-    df = df.explode("Volumes")
-    del df["Volumes"]
-    df["Volume"] = 1
-    return volume_resample(df, volume)
+    return volume_bars(df, volume, by=by)
 
 
 def volume_df2(symbol_id=866, volume=5000):
@@ -79,4 +159,4 @@ def volume_df2(symbol_id=866, volume=5000):
 
 
 if __name__ == '__main__':
-    print(volume_df(866, volume=5000))
+    print(volume_df(866, start_time="2020-10-01 00:00:00", end_time="2020-11-01 00:00:00", volume=5000))
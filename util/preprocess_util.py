@@ -1,9 +1,76 @@
+import numpy as np
 import pandas as pd
-from tqdm import tqdm
 
 from base.config import logger
-from base.consts import PreProcessConfig
-from util.df_util import get_column_info, get_column_frequent
+from base.consts import PreProcessConfig, TrainerConfig
+from util.df_util import aggregate_by_spec
+from util.kline_volume_util import volume_bar_fragments
+
+# 每一段时间内的特征: 列名 -> (原始列名, 聚合方式, 空值的填充值), 聚合方式见 aggregate_by_spec
+# 和之前逐段计算的结果保持一致, 包括 jinse_max_*_index 用的是 min, twitter_*_min/max 是反过来的, 训练好的模型依赖这些列
+PERIOD_FEATURE_SPEC = {
+    # basic OLCH, 没有成交量的分钟价格是空值, 开盘价和收盘价取有成交的第一分钟和最后一分钟
+    "Open": ("Open", "first_valid"),
+    "Low": ("Low", "min"),
+    "Close": ("Close", "last_valid"),
+    "High": ("High", "max"),
+    "Volume": ("Volume", "sum"),
+    "candle_begin_time": ("candle_begin_time", "last"),
+    "first_candle_begin_time": ("candle_begin_time", "first"),
+
+    # jinse related
+    "jinse_long_index": ("long_index", "sum"),
+    "jinse_short_index": ("short_index", "sum"),
+    "jinse_comment_number": ("comment_number", "sum"),
+    "jinse_max_long_index": ("long_index", "min", 0),
+    "jinse_max_short_index": ("short_index", "min", 0),
+    "jinse_news_number": ("content_score", "nunique"),
+    "jinse_max_tag_number": ("tag_number", "max", 0),
+    "jinse_max_title_words": ("title_words", "max", 0),
+    "jinse_min_title_words": ("title_words", "min", 0),
+    "jinse_max_title_score": ("title_score", "max", 0),
+    "jinse_min_title_score": ("title_score", "min", 0),
+    "jinse_max_content_words": ("content_words", "max", 0),
+    "jinse_min_content_words": ("content_words", "min", 0),
+    "jinse_max_content_score": ("content_score", "max", 0),
+    "jinse_min_content_score": ("content_score", "min", 0),
+    "jinse_max_comment_number": ("comment_number", "max", 0),
+    "jinse_min_long_index": ("long_index", "min", 0),
+    "jinse_min_short_index": ("short_index", "min", 0),
+    "jinse_min_comment_number": ("comment_number", "min", 0),
+
+    # twitter related
+    "twitter_whale_number": ("twitter_unique_key", "nunique"),
+    "twitter_usd_number_min": ("twitter_usd_number", "max", 0),
+    "twitter_usd_number_max": ("twitter_usd_number", "min", 0),
+    "twitter_usd_number_sum": ("twitter_usd_number", "sum", 0),
+    "twitter_coin_amount_min": ("twitter_coin_amount", "max", 0),
+    "twitter_coin_amount_max": ("twitter_coin_amount", "min", 0),
+    "twitter_coin_amount_sum": ("twitter_coin_amount", "sum", 0),
+    "twitter_favorite_count_min": ("twitter_favorite_count", "max", 0),
+    "twitter_favorite_count_max": ("twitter_favorite_count", "min", 0),
+    "twitter_favorite_count_sum": ("twitter_favorite_count", "sum", 0),
+    "twitter_retweet_count_min": ("twitter_retweet_count", "max", 0),
+    "twitter_retweet_count_max": ("twitter_retweet_count", "min", 0),
+    "twitter_retweet_count_sum": ("twitter_retweet_count", "sum", 0),
+    "twitter_light_number_max": ("twitter_light_number", "max", 0),
+    "twitter_light_number_sum": ("twitter_light_number", "sum", 0),
+
+    # categorical
+    "twitter_tag": ("twitter_tag", "frequent"),
+    "twitter_to_addr": ("twitter_to_addr", "frequent"),
+    "twitter_from_addr": ("twitter_from_addr", "frequent"),
+    "twitter_transfer_coin_name": ("twitter_transfer_coin_name", "frequent"),
+    "jinse_type": ("type", "frequent"),
+    "jinse_note": ("note", "frequent"),
+    "jinse_first_tag": ("first_tag", "frequent"),
+    "jinse_has_link": ("has_link", "frequent"),
+}
+
+PERIOD_FEATURE_COLUMNS = ["Open", "Low", "Close", "High", "Volume", "max_change", "candle_begin_time", "dayofweek", "hour"] + [
+    column for column in TrainerConfig.numeric_columns if column.startswith("jinse_")] + ["twitter_whale_number"] + [
+    column for column in TrainerConfig.numeric_columns if column.startswith("twitter_")] + [
+    "twitter_tag", "twitter_to_addr", "twitter_from_addr", "twitter_transfer_coin_name", "jinse_type", "jinse_note", "jinse_first_tag", "jinse_has_link", "duration"]
 
 
 class Processor(object):
@@ -174,24 +241,14 @@ class Processor(object):
             logger.info(df)
 
         logger.info("开始把数据合并到一起,基于交易量...")
-        # 显示pandas的进度
-        df["Volumes"] = df["Volume"].apply(lambda x: [1 for x in range(int(x))])
-        df = df.explode("Volumes")
-        del df["Volumes"]
-        df["Volume"] = 1
-
-        # 对交易量求和并转为时间
-        df['sum_volume'] = df['Volume'].cumsum() + 2147483647
-        df['sum_volume_time'] = pd.to_datetime(df['sum_volume'], unit='s')
-
-        df = df.reindex()
-        df.set_index(['sum_volume_time'], inplace=True)
+        # 没有K线的分钟(只有新闻或者转账)不贡献交易量
+        df["Volume"] = df["Volume"].fillna(0)
+        # 跨过K线边界的分钟按交易量比例拆开, 其余的数据复制到每一段
+        df, bars = volume_bar_fragments(df, PreProcessConfig.RESAMPLE_VOLUME)
 
         # 聚合数据
         logger.info(f"开始聚合数据,数据量:{df.shape[0]}")
-        # 显示pandas的进度
-        tqdm.pandas()
-        df = df.groupby(pd.Grouper(freq=f'{PreProcessConfig.RESAMPLE_VOLUME}S')).progress_apply(self.preprocess_period)
+        df = self.aggregate_period(df, bars)
 
         # df.set_index('candle_begin_time', inplace=True)
 
@@ -205,6 +262,33 @@ class Processor(object):
         logger.info(f"聚合数据成功!结果文件保存在:{PreProcessConfig.VOLUME_RESULT_PATH}")
         return df
 
+    def aggregate_period(self, df: pd.DataFrame, groups) -> pd.DataFrame:
+        """按照PERIOD_FEATURE_SPEC统计每一段时间内的数据
+
+        分钟级别K线的技术指标和eth_开头的列是动态生成的, 取每一段的最后一个值, 放在固定的列后面
+
+        Args:
+            df: 合并之后的数据
+            groups: 每一行属于哪一段, 比如基于交易量的K线编号
+
+        Returns:
+            每一段一行, 列和 preprocess_period 的结果一样
+
+        """
+        last_columns = list(dict.fromkeys(self.kline_technical_columns + [column for column in df.columns if column.startswith("eth_")]))
+        result = aggregate_by_spec(df, groups, {**PERIOD_FEATURE_SPEC, **{column: (column, "last") for column in last_columns}})
+        # price related
+        result["max_change"] = result["High"] - result["Low"]
+        # time related, 需要用最后的时间，因为是在那个时间交易量才满足了
+        result["dayofweek"] = result["candle_begin_time"].dt.dayofweek
+        result["hour"] = result["candle_begin_time"].dt.hour
+        # unique里有空值, 减掉空值这一个
+        result["jinse_news_number"] -= 1
+        result["twitter_whale_number"] -= 1
+        # how long it takes
+        result["duration"] = (result["candle_begin_time"] - result.pop("first_candle_begin_time")).dt.total_seconds() / 60
+        return result[PERIOD_FEATURE_COLUMNS + [column for column in last_columns if column not in PERIOD_FEATURE_COLUMNS]]
+
     def preprocess_period(self, x: pd.DataFrame) -> pd.Series:
         """统计一段时间内的数据
 
@@ -215,193 +299,4 @@ class Processor(object):
             统计后的结果
 
         """
-        # basic OLCH
-        open = x.Open[0]
-        low = x.Low.min()
-        close = x.Close[-1]
-        high = x.High.max()
-        volume = x.Volume.sum()
-        # 需要用最后的时间，因为是在那个时间交易量才满足了
-        candle_begin_time = x.candle_begin_time[-1]
-
-        # price related
-        max_change = high - low
-
-        # time related
-        dayofweek = x.candle_begin_time[-1].dayofweek
-        hour = x.candle_begin_time[-1].hour
-
-        # jinse related
-        jinse_long_index = x.long_index.sum()
-        jinse_short_index = x.short_index.sum()
-        jinse_comment_number = x.comment_number.sum()
-        jinse_max_long_index = get_column_info(x, "long_index", "min")
-        jinse_max_short_index = get_column_info(x, "short_index", "min")
-        jinse_max_comment_number = get_column_info(x, "comment_number", "max")
-        jinse_min_long_index = get_column_info(x, "long_index", "min")
-        jinse_min_short_index = get_column_info(x, "short_index", "min")
-        jinse_min_comment_number = get_column_info(x, "comment_number", "min")
-        jinse_news_number = len(x.content_score.unique()) - 1
-        jinse_max_tag_number = get_column_info(x, "tag_number", "max")
-        jinse_max_title_words = get_column_info(x, "title_words", "max")
-        jinse_min_title_words = get_column_info(x, "title_words", "min")
-        jinse_max_title_score = get_column_info(x, "title_score", "max")
-        jinse_min_title_score = get_column_info(x, "title_score", "min")
-        jinse_max_content_words = get_column_info(x, "content_words", "max")
-        jinse_min_content_words = get_column_info(x, "content_words", "min")
-        jinse_max_content_score = get_column_info(x, "content_score", "max")
-        jinse_min_content_score = get_column_info(x, "content_score", "min")
-
-        # 开始处理twitter转账数据
-        twitter_whale_number = len(x.twitter_unique_key.unique()) - 1
-        twitter_usd_number_min, twitter_usd_number_max, twitter_usd_number_sum = get_column_info(x, "twitter_usd_number", "all")
-        twitter_coin_amount_min, twitter_coin_amount_max, twitter_coin_amount_sum = get_column_info(x, "twitter_coin_amount", "all")
-        twitter_favorite_count_min, twitter_favorite_count_max, twitter_favorite_count_sum = get_column_info(x, "twitter_favorite_count", "all")
-        twitter_retweet_count_min, twitter_retweet_count_max, twitter_retweet_count_sum = get_column_info(x, "twitter_retweet_count", "all")
-        twitter_light_number_max = get_column_info(x, "twitter_light_number", "max")
-        twitter_light_number_sum = get_column_info(x, "twitter_light_number", "sum")
-
-        # 开始处理所有的categorical数据
-        # twitter 转账
-        twitter_tag = get_column_frequent(x, "twitter_tag")
-        twitter_to_addr = get_column_frequent(x, "twitter_to_addr")
-        twitter_from_addr = get_column_frequent(x, "twitter_from_addr")
-        twitter_transfer_coin_name = get_column_frequent(x, "twitter_transfer_coin_name")
-
-        # jinse
-        jinse_type = get_column_frequent(x, "type")
-        jinse_note = get_column_frequent(x, "note")
-        jinse_first_tag = get_column_frequent(x, "first_tag")
-        jinse_has_link = get_column_frequent(x, "has_link")
-
-        # how long it takes
-        duration = (x.candle_begin_time[-1] - x.candle_begin_time[0]).total_seconds() / 60
-
-        # hardcode columns
-        result = pd.Series(
-            [
-                open,
-                low,
-                close,
-                high,
-                volume,
-                max_change,
-                candle_begin_time,
-                dayofweek,
-                hour,
-
-                # jinse related
-                jinse_long_index,
-                jinse_short_index,
-                jinse_comment_number,
-                jinse_max_long_index,
-                jinse_max_short_index,
-                jinse_news_number,
-                jinse_max_tag_number,
-                jinse_max_title_words,
-                jinse_min_title_words,
-                jinse_max_title_score,
-                jinse_min_title_score,
-                jinse_max_content_words,
-                jinse_min_content_words,
-                jinse_max_content_score,
-                jinse_min_content_score,
-                jinse_max_comment_number,
-                jinse_min_long_index,
-                jinse_min_short_index,
-                jinse_min_comment_number,
-
-                # twitter related
-                twitter_whale_number,
-                twitter_usd_number_min,
-                twitter_usd_number_max,
-                twitter_usd_number_sum,
-                twitter_coin_amount_min,
-                twitter_coin_amount_max,
-                twitter_coin_amount_sum,
-                twitter_favorite_count_min,
-                twitter_favorite_count_max,
-                twitter_favorite_count_sum,
-                twitter_retweet_count_min,
-                twitter_retweet_count_max,
-                twitter_retweet_count_sum,
-                twitter_light_number_max,
-                twitter_light_number_sum,
-
-                # categorical
-                twitter_tag,
-                twitter_to_addr,
-                twitter_from_addr,
-                twitter_transfer_coin_name,
-                jinse_type,
-                jinse_note,
-                jinse_first_tag,
-                jinse_has_link,
-
-                duration
-            ], index=[
-                "Open",
-                "Low",
-                "Close",
-                "High",
-                "Volume",
-                "max_change",
-                "candle_begin_time",
-                "dayofweek",
-                "hour",
-
-                # jinse related
-                "jinse_long_index",
-                "jinse_short_index",
-                "jinse_comment_number",
-                "jinse_max_long_index",
-                "jinse_max_short_index",
-                "jinse_news_number",
-                "jinse_max_tag_number",
-                "jinse_max_title_words",
-                "jinse_min_title_words",
-                "jinse_max_title_score",
-                "jinse_min_title_score",
-                "jinse_max_content_words",
-                "jinse_min_content_words",
-                "jinse_max_content_score",
-                "jinse_min_content_score",
-                "jinse_max_comment_number",
-                "jinse_min_long_index",
-                "jinse_min_short_index",
-                "jinse_min_comment_number",
-
-                # twitter related
-                "twitter_whale_number",
-                "twitter_usd_number_min",
-                "twitter_usd_number_max",
-                "twitter_usd_number_sum",
-                "twitter_coin_amount_min",
-                "twitter_coin_amount_max",
-                "twitter_coin_amount_sum",
-                "twitter_favorite_count_min",
-                "twitter_favorite_count_max",
-                "twitter_favorite_count_sum",
-                "twitter_retweet_count_min",
-                "twitter_retweet_count_max",
-                "twitter_retweet_count_sum",
-                "twitter_light_number_max",
-                "twitter_light_number_sum",
-
-                # categorical
-                "twitter_tag",
-                "twitter_to_addr",
-                "twitter_from_addr",
-                "twitter_transfer_coin_name",
-                "jinse_type",
-                "jinse_note",
-                "jinse_first_tag",
-                "jinse_has_link",
-                "duration"
-            ]
-        )
-        # 取分钟级别K线的技术指标的最后一个数值
-        for column in self.kline_technical_columns + [x for x in x.columns.tolist() if x.startswith("eth_")]:
-            result[column] = x[column][-1]
-
-        return result
+        return self.aggregate_period(x, np.zeros(x.shape[0], dtype=int)).iloc[0]
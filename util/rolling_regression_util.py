@@ -0,0 +1,96 @@
+"""Rolling window regression on sufficient statistics
+"""
+from typing import Optional
+
+import numpy as np
+
+
+class RollingMoments(object):
+    """在滑动窗口上维护 sum(z) 和 sum(z z') ,行进入和离开窗口的时候增量更新
+
+    为了减少大数相减的精度损失,所有的行都先减去一个参考行再累加。
+    增量更新会慢慢积累误差,可以定期用reset从窗口里的数据重新计算。
+    """
+
+    def __init__(self, dim: int, reference: Optional[np.ndarray] = None):
+        self.dim = dim
+        self.reference = np.zeros(dim) if reference is None else np.asarray(reference, dtype=float)
+        self.n = 0
+        self.sum = np.zeros(dim)
+        self.product = np.zeros((dim, dim))
+
+    def add(self, row: np.ndarray) -> None:
+        row = row - self.reference
+        self.n += 1
+        self.sum += row
+        self.product += np.outer(row, row)
+
+    def remove(self, row: np.ndarray) -> None:
+        row = row - self.reference
+        self.n -= 1
+        self.sum -= row
+        self.product -= np.outer(row, row)
+
+    def reset(self, rows: np.ndarray) -> None:
+        rows = rows - self.reference
+        self.n = rows.shape[0]
+        self.sum = rows.sum(axis=0)
+        self.product = rows.T @ rows
+
+    def mean(self) -> np.ndarray:
+        return self.sum / self.n + self.reference
+
+    def scatter(self) -> np.ndarray:
+        """去均值之后的 sum(z z'),即 n 倍的协方差矩阵"""
+        return self.product - np.outer(self.sum, self.sum) / self.n
+
+
+def ridge_coef(xx: np.ndarray, xy: np.ndarray, alpha: float = 1.0) -> np.ndarray:
+    """和sklearn.linear_model.Ridge(alpha)一样的系数,截距不参与惩罚
+
+    Args:
+        xx: 去均值之后特征的 X'X
+        xy: 去均值之后的 X'y
+        alpha: L2惩罚系数
+
+    Returns:
+        系数
+
+    """
+    return np.linalg.solve(xx + alpha * np.eye(xx.shape[0]), xy)
+
+
+def lasso_coef(xx: np.ndarray, xy: np.ndarray, n: int, alpha: float = 0.1, coef: Optional[np.ndarray] = None, max_iter: int = 1000, tol: float = 1e-12) -> np.ndarray:
+    """和sklearn.linear_model.Lasso(alpha)一样的目标函数, 用坐标下降在Gram矩阵上求解
+
+    目标函数是 1 / (2n) * ||y - Xw||^2 + alpha * ||w||_1 , 截距不参与惩罚。
+
+    Args:
+        xx: 去均值之后特征的 X'X
+        xy: 去均值之后的 X'y
+        n: 样本数
+        alpha: L1惩罚系数
+        coef: 初始值, 滚动计算的时候用上一个窗口的结果, 几次迭代就能收敛
+        max_iter: 最多迭代次数
+        tol: 系数的变化小于 tol * max(1, max|w|) 时停止
+
+    Returns:
+        系数
+
+    """
+    gram = xx / n
+    target = xy / n
+    coef = np.zeros(xx.shape[0]) if coef is None else np.array(coef, dtype=float)
+    for _ in range(max_iter):
+        max_delta = 0
+        for j in range(coef.shape[0]):
+            if gram[j, j] <= 0:
+                new = 0
+            else:
+                rho = target[j] - gram[j] @ coef + gram[j, j] * coef[j]
+                new = np.sign(rho) * max(abs(rho) - alpha, 0) / gram[j, j]
+            max_delta = max(max_delta, abs(new - coef[j]))
+            coef[j] = new
+        if max_delta <= tol * max(1, np.abs(coef).max()):
+            break
+    return coef
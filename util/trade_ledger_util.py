@@ -0,0 +1,44 @@
+"""成交记录增量同步
+
+网格统计需要从网格开始到现在的全部成交, 之前每次请求都从开始时间往后分页取一遍,
+运行时间越长请求越多。成交同步到trade_fill表之后, 每次只需要从最后一条成交ID往后取新的成交。
+"""
+from typing import Union
+
+import arrow
+import pandas as pd
+
+from api.binance.binance_api import BinanceApi
+from db.model import TradeFillModel
+
+PAGE_LIMIT = 1000
+
+
+def start_time_ms(start_time: Union[float, arrow.Arrow]) -> int:
+    """和get_symbol_history_order_detail的startTime一样转换成毫秒, 保证从库里读取的范围和接口一致"""
+    return int(arrow.get(start_time, tzinfo='Asia/Hong_Kong').timestamp() * 1000)
+
+
+async def sync_trades(ex: BinanceApi, start_time: Union[float, arrow.Arrow]) -> pd.DataFrame:
+    """同步新的成交并返回start_time之后的全部成交
+
+    Args:
+        ex: 带交易对的交易所接口
+        start_time: 开始时间, 第一次同步的时候从这个时间开始取
+
+    Returns:
+        成交记录, 列名和币安接口返回的一样, 按成交ID排序
+    """
+    api_id, symbol_id = ex.api.id, ex.symbol.id
+    last_trade_id = TradeFillModel.last_trade_id(api_id, symbol_id)
+    if last_trade_id is None:
+        trades: list = await ex.get_symbol_history_order_detail(start_time=start_time, limit=PAGE_LIMIT)
+    else:
+        trades: list = await ex.get_symbol_history_order_detail(last_trade_id + 1, limit=PAGE_LIMIT)
+    while trades:
+        # 每一页取到之后就入库, 中途失败下次从已经入库的位置继续
+        TradeFillModel.add_trades(api_id, symbol_id, trades)
+        if len(trades) < PAGE_LIMIT:
+            break
+        trades = await ex.get_symbol_history_order_detail(trades[-1]['id'] + 1, limit=PAGE_LIMIT)
+    return TradeFillModel.get_trades(api_id, symbol_id, start_time_ms(start_time))
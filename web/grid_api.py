@@ -398,12 +398,8 @@ class GridView(BaseView):
     async def get_detail_all(self, grid_type=Query(default='REAL', title='创建类型'), ):
         params = rds.hgetall(f'{grid_type}:GRIDSTRATEGY'.upper())
         if grid_type == 'REAL':
-            data = []
-            for k, param in params.items():
-                api_id = param['api_id']
-                symbol_id = param['symbol_id']
-                data.append(await FeigeGrid(api_id, symbol_id).get_order_detail())
-            return data
+            # 每个机器人只同步自己的新成交, 同时计算
+            return await asyncio.gather(*[FeigeGrid(param['api_id'], param['symbol_id']).get_order_detail() for param in params.values()])
         elif grid_type == 'TEST':
             return list(params.values())
 
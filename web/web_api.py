@@ -19,7 +19,8 @@ from base.ifdebug import DEBUG
 from db.cache import RedisHelper, rds
 from db.model import ExchangeAPIModel, KlineModel, SymbolModel, BalanceModel, StrtategyBackTestIndexModel, \
     StrtategyBackTestDetailModel, StrategyModel, BasisTickerModel, RobotModel, BasisModel, CombinationIndexSymbolModel, \
-    CombinationIndexModel
+    CombinationIndexModel, BasisTickerRollupModel, BalanceRollupModel
+from db.symbol_registry import symbol_registry
 from periodic_task.funding_rate_order import order_usdt_future_spot, binance_transfer_usdt_between_market, \
     close_usdt_future_spot
 from strategy.FundRateStrategy import FundRateStrategy
@@ -397,7 +398,7 @@ class AccountView(BaseView):
 
     def get_symbol(self, symbol_id):
         if symbol_id:
-            symbol: SymbolModel = SymbolModel.get_by_id(symbol_id, sc=self.session)
+            symbol: SymbolModel = symbol_registry.get_by_id(symbol_id)
             if symbol is None:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
@@ -480,8 +481,10 @@ class AccountView(BaseView):
     async def get_account_all_position(self, api_id: int = Path(..., description="APIKey id")):
         redis = RedisHelper()
         postions = []
-        for x in redis.connection.keys(f'POSITION:{api_id}:*'):
-            data = redis.hgetall(x)
+        with redis.pipeline() as pipe:
+            for x in redis.scan_iter(f'POSITION:{api_id}:*'):
+                pipe.hgetall(x)
+        for data in pipe.results:
             if data:
                 for p in data.values():
                     for y in p:
@@ -499,21 +502,13 @@ class AccountView(BaseView):
             self,
             id: int = Path(None, description="APIKey id"),
             timeframe: str = Query(default='1m', description="周期"),
+            start_time: Optional[datetime] = Query(default=None, description="开始时间"),
+            end_time: Optional[datetime] = Query(default=None, description="结束时间"),
     ):
-        if timeframe in ['1m', '5m', '15m', '30m']:
-            timeframe = timeframe[:-1]
-            objs = self.session.query(BalanceModel).filter_by(api_id=id).filter(
-                func.date_format(BalanceModel.create_time, "%i") % timeframe == 0).all()
-        else:
-            objs = self.session.query(BalanceModel).filter_by(api_id=id).filter(
-                func.date_format(BalanceModel.create_time, "%i") == 0,
-                func.date_format(BalanceModel.create_time, "%H") % timeframe == 0).all()
-        df = pd.DataFrame(BalanceModel.to_dicts(objs))
-        del df['id']
-        del df['api_id']
-        del df['type']
-        del df['coin']
-        return df.to_dict(orient='list')
+        try:
+            return BalanceRollupModel.get_line(str(id), timeframe, start_time, end_time, sc=self.session)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
     @router.post("/double/order/", tags=tags, name=f'対敲')
     async def double_order(
@@ -743,26 +738,15 @@ class BasisView(BaseView):
     async def get_basis_line(
             self,
             id: int = Path(..., description="基差ID"),
-            timeframe: str = Query(default='1m', description="周期")
+            timeframe: str = Query(default='1m', description="周期"),
+            start_time: Optional[datetime] = Query(default=None, description="开始时间"),
+            end_time: Optional[datetime] = Query(default=None, description="结束时间"),
     ):
-        if timeframe in ['1m', '5m', '15m', '30m']:
-            timeframe = timeframe[:-1]
-            query = self.session.query(BasisTickerModel).filter_by(basis_id=id).filter(
-                func.date_format(BasisTickerModel.timestamp, "%i") % timeframe == 0)
-            count = query.count()
-            if count > 10000:
-                objs = query.limit(10000).offset(count - 10000).all()
-            else:
-                objs = query.all()
-        else:
-            objs = self.session.query(BasisTickerModel).filter_by(basis_id=id).filter(
-                func.date_format(BasisTickerModel.timestamp, "%i") == 0,
-                func.date_format(BasisTickerModel.timestamp, "%H") % timeframe == 0).all()
-        df = pd.DataFrame(BasisTickerModel.to_dicts(objs))
-        del df['id']
-        del df['basis_id']
-        df.fillna('', inplace=True)
-        data = df.to_dict(orient='list')
+        try:
+            data = BasisTickerRollupModel.get_line(id, timeframe, start_time, end_time, sc=self.session)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        data['spot'] = ['' if x is None else x for x in data['spot']]
         return data
 
     @router.get("/basis/detail/last/{id}/", tags=tags, name=f'获取最新基差行情')